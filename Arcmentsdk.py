@@ -1,17 +1,27 @@
 import sys
 import time
-import requests
 import numpy as np
 
+from duet_transport import DuetError, shared_transport
+from processors.motion_estimator import MotionEstimator
+from processors.move_table import MoveTable
+from processors.weld_segments import WeldSegments
+
 # Add path to Baumer SDK
 sys.path.append("C:/Users/Arc One/Downloads/Baumer_OxSDK_V2...")
-import oxapi
 
 
 class WeldScanner:
-    def __init__(self):
-        # Initialize scanner connection
-        self.ox = oxapi.ox("192.168.0.250")
+    def __init__(self, sensor=None):
+        """
+        :param sensor: Sensor connection with the interface of oxapi.ox (e.g. the simulated collection/oxsim.ox),
+                       oxapi.ox("192.168.0.250") by default
+        """
+        # Initialize scanner connection, oxapi needs pythonnet and OxApi.dll so it is only loaded for the real sensor
+        if sensor is None:
+            import oxapi
+            sensor = oxapi.ox("192.168.0.250")
+        self.ox = sensor
         self.ox.Connect()
         self.ox.Login("admin", "")
 
@@ -27,27 +37,39 @@ class WeldScanner:
         self.weld_speed = 387
         self.z_buffer = 30
         self.z_range = (300, 500)  # Define working range (example: 300 mm to 500 mm)
+        # Pooled session shared with anything else sending to the Duet, consecutive commands go out packed
+        self.transport = shared_transport(self.duet_ip)
 
         # Initialize tracking variables
         self.max_height = float('-inf')
         self.height_history = []
 
     def send_gcode(self, command):
-        url = "http://{}/rr_gcode?gcode={}".format(self.duet_ip, command)
+        results = self.send_gcodes([command])
+        return results[0] if results else None
+
+    def send_gcodes(self, commands):
+        """Sends commands in as few requests as possible, returns a CommandResult per command"""
         try:
-            response = requests.get(url)
-            return response.json()
-        except Exception as e:
+            results = self.transport.send_many(commands)
+        except DuetError as e:
             print("G-code error: {}".format(e))
-            return None
+            return []
+        for result in results:
+            print("Command: {}, Response: {}".format(result.code, result.reply or "ok"))
+        return results
 
-    def send_gcodes(self, commands):
-        for command in commands:
-            response = self.send_gcode(command)
-            print("Command: {}, Response: {}".format(command, response))
+    def get_position(self):
+        """Machine position (X, Y, Z) reported by the Duet, None if it cannot be read"""
+        try:
+            axes = self.transport.get_model(key="move.axes")
+            return [axis["machinePosition"] for axis in axes[:3]]
+        except (DuetError, KeyError, TypeError) as e:
+            print("Position error: {}".format(e))
+            return None
 
     def get_profile(self, retries=3):
-        """Fetch profile data with retry logic."""
+        """Fetch profile data with retry logic. Returns x and z in mm as arrays, (None, None) on failure."""
         for attempt in range(retries):
             try:
                 qualityId, timeStamp, precision, xStart, length, x, z = self.ox.GetProfile()
@@ -56,21 +78,19 @@ class WeldScanner:
                     continue
 
                 # Convert to mm
-                x_mm = [(xStart + x[i]) / precision for i in range(length)]
-                z_mm = [z[i] / precision for i in range(length)]
+                x_mm = (np.asarray(x[:length], dtype=np.float64) + xStart) / precision
+                z_mm = np.asarray(z[:length], dtype=np.float64) / precision
 
                 # Filter measurements within the work range
-                valid_indices = [
-                    i for i in range(len(z_mm)) if self.z_range[0] <= z_mm[i] <= self.z_range[1]
-                ]
-                x_mm = [x_mm[i] for i in valid_indices]
-                z_mm = [z_mm[i] for i in valid_indices]
-
-                # Remove outliers
-                if z_mm:
-                    z_mean = np.mean(z_mm)
-                    z_std = np.std(z_mm)
-                    z_mm = [z for z in z_mm if abs(z - z_mean) < 2 * z_std]
+                valid = (z_mm >= self.z_range[0]) & (z_mm <= self.z_range[1])
+                x_mm = x_mm[valid]
+                z_mm = z_mm[valid]
+
+                # Remove outliers, x keeps matching z
+                if len(z_mm):
+                    inliers = np.abs(z_mm - z_mm.mean()) < 2 * z_mm.std()
+                    x_mm = x_mm[inliers]
+                    z_mm = z_mm[inliers]
 
                 return x_mm, z_mm
             except Exception as e:
@@ -80,7 +100,12 @@ class WeldScanner:
         print("Failed to retrieve profile data after {} attempts.".format(retries))
         return None, None
 
-    def scan(self, z, x0, y0, x1, y1, h, duration=5.0):
+    def scan(self, z, x0, y0, x1, y1, h, duration=None):
+        """
+        Moves over the bead and captures profiles while the scanning move runs. Capturing starts when the
+        approach and the dwell are predicted to be done (MotionEstimator, from the current machine position).
+        :param duration: Seconds to capture, by default the predicted time of the scanning move
+        """
         init_move = [
             "G1 F1000 Z{}".format(z + self.z_offset + self.z_buffer),
             "G1 X{} Y{} Z{}".format(x0 + self.x_offset, y0 + self.y_offset, z + self.z_offset),
@@ -90,10 +115,20 @@ class WeldScanner:
             "G1 X{} Y{}".format(x1 + self.x_offset, y1 + self.y_offset)
         ]
 
-        print("Moving to start position...")
-        self.send_gcodes(init_move)
-        print("Starting scan...")
-        self.send_gcodes(scanning_move)
+        moves = init_move + scanning_move
+        estimate = MotionEstimator.from_gcode(moves, position=self.get_position(), stop_at_layers=False)
+        scan_row = len(estimate) - 1
+        if duration is None:
+            duration = estimate.end_time(scan_row) - estimate.start_time(scan_row)
+
+        # The dwell ends the first request, the scanning move goes out in the second
+        print("Moving to start position and starting scan...")
+        sent = time.time()
+        self.send_gcodes(moves)
+        delay = sent + estimate.start_time(scan_row) - time.time()
+        print("Scan starts in {:.2f} s and takes {:.2f} s".format(max(delay, 0.0), duration))
+        if delay > 0:
+            time.sleep(delay)
 
         start_time = time.time()
         profile_count = 0
@@ -101,14 +136,14 @@ class WeldScanner:
         while time.time() - start_time < duration:
             x_mm, z_mm = self.get_profile()
 
-            if x_mm and z_mm:
-                current_max = max(z_mm)
+            if z_mm is not None and len(z_mm):
+                max_index = int(np.argmax(z_mm))
+                current_max = float(z_mm[max_index])
                 self.height_history.append(current_max)
 
                 if current_max > self.max_height:
                     self.max_height = current_max
-                    max_index = z_mm.index(current_max)
-                    max_x_pos = x_mm[max_index]
+                    max_x_pos = float(x_mm[max_index])
                     self.max_position = (max_x_pos, profile_count)
 
                 profile_count += 1
@@ -131,26 +166,15 @@ def main():
     try:
         filename = input("Please enter a gcode file to run: ")
         with open(filename, "r") as file:
-            gcode_commands = file.readlines()
-
-        z0 = x0 = y0 = x1 = y1 = 0
-
-        for i, command in enumerate(gcode_commands):
-            if "Z" in command:
-                comment_index = sys.maxsize
-                if ";" in command:
-                    comment_index = command.index(";")
-                if comment_index > command.index("Z"):
-                    z = float(command.split("Z")[1].split(" ")[0])
-
-            if command.startswith(";TYPE:WALL-OUTER"):
-                x0, y0 = float(gcode_commands[i - 1].split("X")[1].split(" ")[0]), float(
-                    gcode_commands[i - 1].split("Y")[1].split(" ")[0])
-                z0 = float(gcode_commands[i + 1].split("Z")[1].split(" ")[0])
-
-            if command.startswith("M42 P1 S0"):
-                x1, y1 = float(gcode_commands[i - 3].split("X")[1].split(" ")[0]), float(
-                    gcode_commands[i - 3].split("Y")[1].split(" ")[0])
+            segments = WeldSegments(MoveTable.from_gcode(file))
+
+        # Scan along the last outer wall bead
+        outer = np.flatnonzero(segments.feature_mask("WALL-OUTER"))
+        if len(outer) == 0:
+            raise ValueError("No WALL-OUTER weld bead in {}".format(filename))
+        bead = outer[-1]
+        x0, y0, z0 = (float(v) for v in segments.start[bead])
+        x1, y1 = (float(v) for v in segments.end[bead][:2])
 
         print("\nStarting scanning and welding sequence...")
         z0 = scanner.scan(z0, x0, y0, x1, y1, 0)
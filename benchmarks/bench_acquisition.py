@@ -0,0 +1,100 @@
+"""
+bench_acquisition.py
+
+Runs LaserStreamer against the simulated OX sensor (collection/oxsim.py)
+at increasing profile rates and reports, for every rate:
+
+    profiles acquired per second, profiles the sensor queue dropped,
+    CPU time per profile, and optionally the cost of recording the
+    stream (collection/recorder.py) and of reading it back.
+
+Usage:
+    python benchmarks/bench_acquisition.py
+    python benchmarks/bench_acquisition.py --rates 1000,5000,10000 --points 1280 --seconds 3 --record
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from collection import oxsim
+from collection.laserstreamer import LaserStreamer
+from collection.recorder import RecordedSession, SessionRecorder
+
+
+def run_case(rate, points, seconds, record=False, noise=0.02, dropout=0.0):
+    """Streams for seconds at rate profiles/s and returns the metrics"""
+    sensor = oxsim.ox(rate=rate, points=points, noise=noise, dropout=dropout)
+    directory = tempfile.mkdtemp() if record else None
+    recorder = SessionRecorder(os.path.join(directory, "session"), points) if record else None
+    streamer = LaserStreamer(sensor=sensor, recorder=recorder)
+    streamer.stream.SetQueueSize(max(int(rate), 1000))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cpu = time.process_time()
+        started = time.perf_counter()
+        streamer.start_stream()
+        time.sleep(seconds)
+        streamer.stop_stream()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu
+    # The CPU time includes generating the simulated profiles
+    overflow = streamer.overflow()
+    result = {
+        "rate": rate,
+        "points": points,
+        "seconds": elapsed,
+        "profiles": overflow["written"],
+        "profiles_per_second": overflow["written"] / elapsed,
+        "missed": overflow["missed"],  # Block id gaps, i.e. profiles dropped from the full sensor queue
+        "cpu_us_per_profile": cpu / max(overflow["written"], 1) * 1e6,
+        "record": record,
+    }
+    if record:
+        recorder.close()
+        path = os.path.join(directory, "session")
+        started = time.perf_counter()
+        session = RecordedSession(path)
+        heights = session.select(names=("z",))["z"].max(axis=1)
+        result["replay_seconds"] = time.perf_counter() - started
+        result["replayed"] = int(len(heights))
+        result["recorded_mb"] = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+        shutil.rmtree(directory)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Laser acquisition benchmark on the simulated OX sensor")
+    parser.add_argument("--rates", default="1000,5000,10000", help="Profile rates in Hz")
+    parser.add_argument("--points", type=int, default=640, help="Points per profile")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Streaming time per rate")
+    parser.add_argument("--record", action="store_true", help="Record the stream and read it back")
+    parser.add_argument("--output", default="bench_acquisition.json")
+    args = parser.parse_args()
+
+    results = []
+    for rate in (float(rate) for rate in args.rates.split(",")):
+        result = run_case(rate, args.points, args.seconds, args.record)
+        results.append(result)
+        line = (f"{rate:8.0f} Hz: {result['profiles_per_second']:8.0f} profiles/s  missed {result['missed']:6d}  "
+                f"cpu {result['cpu_us_per_profile']:7.1f} us/profile")
+        if args.record:
+            line += f"  recorded {result['recorded_mb']:7.1f} MB, read back in {result['replay_seconds']:.3f} s"
+        print(line)
+
+    with open(args.output, "w") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "settings": vars(args), "results": results}, f,
+                  indent=2)
+    print(f"Results written to {args.output}")
+    return 1 if any(result["missed"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+bench_sender.py
+
+Replays jobs through Sender.send_layer against the simulated Duet
+(duet_sim.py) and reports, for every job and send mode:
+
+    commands per second, per-request latency distribution, time blocked
+    waiting on the object model vs. time the machine spent moving,
+    idle gaps of the machine between layers and the HTTP requests used.
+
+Results are written as JSON. Threshold checks (built-in sanity checks, an
+optional thresholds file and an optional baseline from a previous run)
+flag regressions with a non-zero exit code.
+
+Usage:
+    python benchmarks/bench_sender.py
+    python benchmarks/bench_sender.py --job test.gcode --layers 5 --synthetic 10x200 \\
+        --modes line,pipelined,upload --latency 0.002 --output bench.json --baseline previous.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from duet_sim import DuetSimulator
+from processors import MotionEstimator, PreProcessor
+from sender import Sender
+
+MODES = ("line", "pipelined", "upload")
+MIN_SAMPLES = 10  # Distributions with fewer samples are not compared against a baseline
+# Metrics compared against a baseline: name -> True if higher is better
+BASELINE_METRICS = {"commands_per_second": True, "latency_ms.p95": False, "layer_gap_ms.mean": False}
+
+
+def synthetic_job(layers, moves):
+    """Square spiral beads with welder toggles, like a sliced thin wall"""
+    job = []
+    for layer in range(layers):
+        lines = [f";LAYER:{layer}", f"G1 F6000 Z{0.3 * (layer + 1):.3f}", "G1 X0 Y0", "G4 P0", "M42 P1 S1"]
+        for move in range(moves):
+            side = move % 4
+            size = 10 + (move // 4) * 0.5
+            x = size if side in (0, 1) else 0
+            y = size if side in (1, 2) else 0
+            lines.append(f"G1 F1200 X{x:.3f} Y{y:.3f} ;Removed extrusion in weld_control.py")
+        lines += ["M42 P1 S0", "G4 P0"]
+        job.append(lines)
+    return job
+
+
+def load_job(path, layers=None):
+    job = list(PreProcessor(path).parse_layers())
+    return job[:layers] if layers else job
+
+
+def summary(values, scale=1.0):
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values, dtype=np.float64) * scale
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+        "total": float(values.sum()),
+    }
+
+
+def _timed(samples, function):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - started)
+    return wrapper
+
+
+def run_case(simulator, name, job, mode, window=8, poll_interval=0.02, estimate=False):
+    """Sends every layer of job in one mode and returns the metrics
+    :param estimate: Pass predicted layer times (MotionEstimator) so the sender sleeps through the motion"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        sender = Sender(simulator.address, mode=mode, window=window, poll_interval=poll_interval)
+    sender.poller.unsubscribe(sender._log_position)
+
+    # Per request: how long the caller blocks on one line (a packet of lines in pipelined mode, the whole layer in upload mode)
+    latencies = []
+    waits = []
+    sender.send_code_line = _timed(latencies, sender.send_code_line)
+    sender.send_packet = _timed(latencies, sender.send_packet)
+    sender.upload_layer = _timed(latencies, sender.upload_layer)
+    sender.poller.wait_for = _timed(waits, sender.poller.wait_for)
+
+    durations = [None] * len(job)
+    if estimate:
+        # Layer by layer from where the previous one ended, the simulator runs time_scale times faster than real time
+        durations = []
+        position = (0.0, 0.0, 0.0)
+        for layer in job:
+            estimator = MotionEstimator.from_gcode(layer, position=position)
+            durations.append(estimator.total_time / simulator.time_scale)
+            position = estimator.end_position
+
+    simulator.reset_counters()
+    poller_requests = sender.poller.requests
+    layer_ends = []
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for layer, duration in zip(job, durations):
+            sender.send_layer(layer, duration=duration)
+            layer_ends.append(time.monotonic())
+        sender.sync()
+    seconds = time.perf_counter() - started
+    sender.close()
+
+    # The machine's idle gap around each layer boundary (from the end of one layer to the first move of the next)
+    layer_gaps = []
+    for boundary in layer_ends[:-1]:
+        for gap_start, gap_end in simulator.idle_gaps:
+            if gap_start <= boundary <= gap_end:
+                layer_gaps.append(gap_end - gap_start)
+                break
+
+    commands = simulator.commands
+    return {
+        "job": name,
+        "mode": mode,
+        "estimate": estimate,
+        "layers": len(job),
+        "lines": sum(len(layer) for layer in job),
+        "commands": commands,
+        "seconds": seconds,
+        "commands_per_second": commands / seconds if seconds else 0.0,
+        "latency_ms": summary(latencies, 1000.0),
+        "wait_seconds": float(sum(waits)),
+        "motion_seconds": simulator.motion_seconds,
+        "layer_gap_ms": summary(layer_gaps, 1000.0),
+        "requests": dict(simulator.endpoint_requests),
+        "poll_requests": sender.poller.requests - poller_requests,
+        "overflows": simulator.overflows,
+    }
+
+
+def _metric(result, path):
+    value = result
+    for name in path.split("."):
+        value = value.get(name) if isinstance(value, dict) else None
+    return value
+
+
+def check(results, thresholds=None, baseline=None, tolerance=0.2):
+    """Returns a list of failure messages"""
+    failures = []
+    by_case = {(result["job"], result["mode"]): result for result in results}
+
+    for result in results:
+        case = f"{result['job']}/{result['mode']}"
+        if result["overflows"]:
+            failures.append(f"{case}: {result['overflows']} commands overflowed the firmware buffer")
+        line = by_case.get((result["job"], "line"))
+        if result["mode"] != "line" and line and result["commands_per_second"] < line["commands_per_second"]:
+            failures.append(f"{case}: slower than line mode")
+
+        # thresholds: {"<mode>" or "<job>/<mode>": {"min_<metric>" / "max_<metric>": value}}
+        for key in (result["mode"], case):
+            for rule, limit in (thresholds or {}).get(key, {}).items():
+                bound, _, path = rule.partition("_")
+                value = _metric(result, path)
+                if value is None:
+                    continue
+                if (bound == "min" and value < limit) or (bound == "max" and value > limit):
+                    failures.append(f"{case}: {path} = {value:.3f} violates {rule} = {limit}")
+
+    for previous in (baseline or {}).get("results", []):
+        result = by_case.get((previous["job"], previous["mode"]))
+        if result is None or result["lines"] != previous["lines"]:
+            # Only the same replayed job is comparable (e.g. not with a different --layers)
+            continue
+        case = f"{result['job']}/{result['mode']}"
+        for path, higher_is_better in BASELINE_METRICS.items():
+            old, new = _metric(previous, path), _metric(result, path)
+            if not old or new is None:
+                continue
+            parent = path.rpartition(".")[0]
+            if parent and min(_metric(previous, parent + ".count") or 0, _metric(result, parent + ".count") or 0) < MIN_SAMPLES:
+                # Percentiles of a handful of samples are noise
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                failures.append(f"{case}: {path} regressed from {old:.3f} to {new:.3f} ({change:+.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sender throughput and latency benchmark on the simulated Duet")
+    parser.add_argument("--job", action="append", help="G-code job to replay (default: test.gcode)")
+    parser.add_argument("--layers", type=int, default=3, help="Layers replayed per job (0 = all)")
+    parser.add_argument("--synthetic", default="5x200", help="LAYERSxMOVES synthetic job, empty to skip")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--poll-interval", type=float, default=0.02)
+    parser.add_argument("--latency", type=float, default=0.002, help="Simulated network latency per request (s)")
+    parser.add_argument("--time-scale", type=float, default=50.0, help="Simulated motion speed-up")
+    parser.add_argument("--acceleration", type=float, help="Simulated acceleration in mm/s² (default: constant feedrate)")
+    parser.add_argument("--estimate", action="store_true", help="Sleep through predicted layer times (MotionEstimator)")
+    parser.add_argument("--output", default="bench_sender.json")
+    parser.add_argument("--thresholds", help="JSON file with min_/max_ limits per mode or job/mode")
+    parser.add_argument("--baseline", help="Results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs. baseline")
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    jobs = {}
+    for path in args.job or [os.path.join(root, "test.gcode")]:
+        jobs[os.path.basename(path)] = load_job(path, args.layers or None)
+    if args.synthetic:
+        layers, moves = (int(value) for value in args.synthetic.lower().split("x"))
+        jobs[f"synthetic_{layers}x{moves}"] = synthetic_job(layers, moves)
+
+    results = []
+    with DuetSimulator(latency=args.latency, time_scale=args.time_scale, acceleration=args.acceleration) as simulator:
+        for name, job in jobs.items():
+            for mode in args.modes.split(","):
+                result = run_case(simulator, name, job, mode, args.window, args.poll_interval, args.estimate)
+                results.append(result)
+                print(f"{name:>24} {mode:>9}: {result['commands_per_second']:8.1f} cmd/s  "
+                      f"p95 {result['latency_ms'].get('p95', 0):7.2f} ms  "
+                      f"wait {result['wait_seconds']:6.2f} s  motion {result['motion_seconds']:6.2f} s  "
+                      f"layer gap {result['layer_gap_ms'].get('mean', 0):7.2f} ms")
+
+    thresholds = baseline = None
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = check(results, thresholds, baseline, args.tolerance)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "thresholds")},
+        "results": results,
+        "failures": failures,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    print(f"Results written to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+bench_tokenizer.py
+
+Times the shared G-code tokenizer (processors/gcode_parser.py) against the
+split() chains the parsers used before it, on a job repeated a number of
+times:
+
+    reading the axes of every move (tokenize + params vs. split chains),
+    splitting into layers (LayerParser vs. a ";LAYER:" substring test).
+
+The best of several runs is reported for every case.
+
+Usage:
+    python benchmarks/bench_tokenizer.py
+    python benchmarks/bench_tokenizer.py --job test.gcode --repeat 10 --runs 7
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from processors import LayerParser, tokenize
+
+AXES = "XYZEF"
+
+
+def split_moves(lines):
+    """Baseline: the split chains of the old parsers"""
+    values = 0
+    for line in lines:
+        if line.startswith("G1") or line.startswith("G0"):
+            code = line.split(";")[0]
+            for axis in AXES:
+                if axis in code:
+                    float(code.split(axis)[1].split(" ")[0])
+                    values += 1
+    return values
+
+
+def tokenized_moves(lines):
+    values = 0
+    for record in tokenize(lines):
+        if record.command in ("G0", "G1"):
+            params = record.params
+            for axis in AXES:
+                if axis in params:
+                    values += 1
+    return values
+
+
+def substring_layers(lines):
+    """Baseline: the old LayerParser"""
+    layers = []
+    current = []
+    for line in lines:
+        if ";LAYER:" in line:
+            if current:
+                layers.append(current)
+                current = []
+        current.append(line)
+    if current:
+        layers.append(current)
+    return len(layers)
+
+
+def parsed_layers(lines):
+    return len(LayerParser().process(lines))
+
+
+def best_of(function, lines, runs):
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = function(lines)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokenizer benchmark against the old split() parsing")
+    parser.add_argument("--job", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test.gcode"))
+    parser.add_argument("--repeat", type=int, default=10, help="Times the job is repeated")
+    parser.add_argument("--runs", type=int, default=7, help="Runs per case, the best one is reported")
+    args = parser.parse_args()
+
+    with open(args.job, "r", encoding="utf-8", errors="replace") as f:
+        lines = [line.strip() for line in f] * args.repeat
+    print(f"{len(lines)} lines")
+
+    for name, baseline, function in (("moves", split_moves, tokenized_moves),
+                                      ("layers", substring_layers, parsed_layers)):
+        base_time, base_result = best_of(baseline, lines, args.runs)
+        new_time, new_result = best_of(function, lines, args.runs)
+        print(f"{name:7s} baseline {base_time:7.3f} s  tokenizer {new_time:7.3f} s  "
+              f"x{new_time / base_time:5.2f}  ({base_result} / {new_result})")
+
+
+if __name__ == "__main__":
+    main()
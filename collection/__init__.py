@@ -1,2 +1,4 @@
-from getData import *
-from laserstreamer import *
\ No newline at end of file
+from .laserstreamer import *
+from .ring_buffer import *
+from .recorder import *
+from .oxtypes import *
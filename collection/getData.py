@@ -1,7 +1,8 @@
+# Live plot of the sensor's profiles, run from the repository root: python -m collection.getData
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import time
-from oxapi import ox
+from .oxapi import ox
 
 # Initialize the stream
 o_x = ox("192.168.0.250")
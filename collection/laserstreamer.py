@@ -1,60 +1,121 @@
+import threading
 import time
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from oxapi import ox
+from .oxtypes import ProfileBatch
+from .ring_buffer import ProfileRing
+
+BATCH_SIZE = 256 # Profiles drained from the sensor queue per call
+RING_CAPACITY = 4096 # Latest profiles kept in memory
+IDLE_WAIT = 0.002 # Seconds the acquisition thread waits when the sensor queue is empty
 
 class LaserStreamer:
   
-  def __init__(self, ip="192.168.0.250"):
+  def __init__(self, ip="192.168.0.250", batch_size=BATCH_SIZE, capacity=RING_CAPACITY, intensity=False, recorder=None,
+               sensor=None):
+    """
+    Args:
+      sensor (optional): Sensor connection with the interface of oxapi.ox, e.g. oxsim.ox; oxapi.ox(ip) by default
+      capacity (int, optional): Profiles kept in the ring buffer, memory stays at capacity * width points
+      intensity (bool, optional): Keep the intensity values of the profiles too
+      recorder (SessionRecorder, optional): Every acquired profile is also recorded to disk
+    """
     self.ip = ip
-    self.o_x = ox(self.ip)
+    if sensor is None:
+      # Only loaded for the real sensor, it needs pythonnet and OxApi.dll
+      from .oxapi import ox
+      sensor = ox(self.ip)
+    self.o_x = sensor
     self.stream = self.o_x.CreateStream()
-    self.data = []
-    self.stop_flag = False
+    # Reused for every drain of the profile queue, rows are as wide as the longest profile the sensor sends
+    width = self.o_x.GetProfileInfo()[0]
+    self.batch = ProfileBatch(batch_size, width)
+    self.ring = ProfileRing(capacity, width, intensity)
+    self.stop_event = threading.Event()
+    self.stop_event.set()
+    self.thread = None
+    self.recorder = recorder
+    self.error = None
     self.last_profile = None
     
+  @property
+  def stop_flag(self):
+    return self.stop_event.is_set()
+    
+  @property
+  def data(self):
+    """Held profiles as a list of dictionaries with x, z and timestamp values"""
+    rows = self.ring.snapshot()
+    data = []
+    for row in range(rows.count):
+      length = rows.length[row]
+      data.append({"x": rows.x[row, :length], "z": rows.z[row, :length], "timestamp": float(rows.timestamp[row])})
+    return data
+    
   def start_stream(self):
-    """Starts the stream"""
-    self.stop_flag = False
+    """Starts the stream and the acquisition thread filling self.ring"""
+    if self.thread is not None and self.thread.is_alive():
+      return
+    self.stop_event.clear()
+    self.error = None
     self.stream.Start()
+    self.thread = threading.Thread(target=self._acquire, name="LaserAcquisition", daemon=True)
+    self.thread.start()
     print("Stream started.")
     
   def stop_stream(self):
-    """Stops the stream"""
-    self.stop_flag = True
+    """Stops the stream, returns once the acquisition thread has stored the last profiles"""
+    self.stop_event.set()
+    if self.thread is not None and self.thread is not threading.current_thread():
+      self.thread.join()
     self.stream.Stop()
     print("Stream stopped.")
     
+  def _acquire(self):
+    """Acquisition thread: drains the profile queue in batches into the ring until stopped"""
+    batch = self.batch
+    try:
+      while not self.stop_event.is_set():
+        if self.stream.ReadProfiles(batch) == 0:
+          self.stop_event.wait(IDLE_WAIT) # Returns right away on stop
+          continue
+        self.ring.write(batch)
+        if self.recorder is not None:
+          self.recorder.write_profiles(batch)
+        self.last_profile = batch.profile(batch.count - 1)
+    except Exception as e:
+      self.error = e
+      self.stop_event.set()
+      print(f"Acquisition stopped: {e}")
+    
   def stream_until_stop(self):
     """
     Streams data until stop signal is received 
-    Reads from profile queue and stores x and z values with timestamps
+    Starts the acquisition thread if needed and blocks until stop_stream() is called
     Returns:
-      List[Dict]: List of dictionaries containing x, z, and timestamp values
+      List[Dict]: List of dictionaries containing x, z, and timestamp values (the latest profiles the ring holds)
     """
     
     print("Streaming data...")  
-    while not self.stop_flag:
-      if self.stream.GetProfileCount() > 0:
-        profile = self.stream.ReadProfile()
-        x_vals = profile[-3]
-        z_vals = profile[-2]
-        timestamp = profile[6]
-        
-        self.data.append({
-          "x": x_vals,
-          "z": z_vals,
-          "timestamp": timestamp
-        })
-        
-        self.last_profile = profile
-      else:
-        time.sleep(0.01) # Skip if no profile
-    
+    self.start_stream()
+    self.stop_event.wait()
     return self.data
   
+  def set_layer(self, layer: int):
+    """Tags the profiles recorded from now on with layer (see SessionRecorder.set_layer), e.g. when a layer starts"""
+    if self.recorder is not None:
+      self.recorder.set_layer(layer)
+  
+  def overflow(self):
+    """
+    Returns:
+      Dict: Profiles written to the ring, overwritten in it and missed by the sensor (block id gaps)
+    """
+    return {"written": self.ring.written, "overwritten": self.ring.overwritten, "missed": self.ring.missed}
+  
   def current_profile(self):
     """Returns the last profile in queue"""
+    if not self.stop_flag:
+      # The acquisition thread owns the queue
+      return self.last_profile
     if self.stream.GetProfileCount() > 0:
       profile = self.stream.ReadProfile()
       self.last_profile = profile
@@ -64,13 +125,16 @@ class LaserStreamer:
     
   def plot_stream(self):
     """Plots streamed data from self.data"""
-    if not self.data:
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
+    data = self.data
+    if not data:
       print("No data")
       return
     
     xs, zs, ts = [], [], []
     
-    for profile in self.data:
+    for profile in data:
       for x_val, z_val in zip(profile["x"], profile["z"]):
         xs.append(x_val)
         zs.append(z_val)
@@ -82,4 +146,4 @@ class LaserStreamer:
     ax.set_xlabel('X')
     ax.set_ylabel('Z')
     ax.set_zlabel('Time')
-    plt.show()
\ No newline at end of file
+    plt.show()
@@ -1,6 +1,8 @@
 # This class uses pythonnet https://pypi.org/project/pythonnet/ to load and use a .NET assembly.
 # Please add pythonnet to you python installation:
 #       pip install pythonnet==2.4.0
+import ctypes
+import numpy as np
 import clr
 
 # Check if OxApi.dll can be found in path
@@ -15,8 +17,63 @@ if(not clr.FindAssembly('OxApi')):
 clr.AddReference('OxApi')
 
 import System
+from System.Runtime.InteropServices import GCHandle, GCHandleType
 # Import the required namespaces
 from Baumer.OXApi import Ox
+from .oxtypes import MeasurementBatch, ProfileBatch, scale_profile
+
+# NumPy types of the .NET array element types the SDK returns
+_DTYPES = {
+    "System.Boolean": np.bool_,
+    "System.Byte": np.uint8,
+    "System.Int16": np.int16,
+    "System.UInt16": np.uint16,
+    "System.Int32": np.int32,
+    "System.UInt32": np.uint32,
+    "System.Int64": np.int64,
+    "System.Single": np.float32,
+    "System.Double": np.float64,
+}
+
+
+def to_numpy(array, out=None):
+    """ Copies a .NET array into a NumPy array with one memmove of the pinned array
+    (list(array) crosses the pythonnet boundary once per element).
+    Parameters:
+    array: .NET array (or any sequence), None is passed through
+    out (ndarray): Optional preallocated array, values beyond its length are cut (memmove if it has the .NET type)
+    Returns:
+    (ndarray): The values, a view of out (cut to its length) if given
+    """
+    if array is None:
+        return None
+    dtype = _DTYPES.get(array.GetType().GetElementType().ToString()) if hasattr(array, "GetType") else None
+    if dtype is None:
+        values = np.asarray(list(array))
+        if out is None:
+            return values
+        values = values[:len(out)]
+        out[:len(values)] = values
+        return out[:len(values)]
+
+    length = array.Length
+    if out is None:
+        out = np.empty(length, dtype=dtype)
+    elif out.dtype != dtype or not out.flags.c_contiguous:
+        # Copied through a temporary array of the .NET type and converted
+        values = to_numpy(array)[:len(out)]
+        out[:len(values)] = values
+        return out[:len(values)]
+    else:
+        # Points beyond the length of out are not copied
+        out = out[:length]
+    if length:
+        handle = GCHandle.Alloc(array, GCHandleType.Pinned)
+        try:
+            ctypes.memmove(out.ctypes.data, handle.AddrOfPinnedObject().ToInt64(), out.nbytes)
+        finally:
+            handle.Free()
+    return out
 
 
 class oxstream:
@@ -58,22 +115,46 @@ class oxstream:
         (double):  Timestamp
         (int):  Length
         (int):  Encoder Value
-        (int[]):  Profile X-Values
-        (int[]):  Profile Z-Values (None if not in stream)
-        (int[]):  Profile Intensity-Values (None if not in stream)
+        (ndarray):  Profile X-Values
+        (ndarray):  Profile Z-Values (None if not in stream)
+        (ndarray):  Profile Intensity-Values (None if not in stream)
         """
         profile =  self.client.ReadProfile()
-        x = list(profile.X)
-        z = None
-        i = None
-        if(profile.Z is not None):
-            z = list(profile.Z)
-        if(profile.I is not None):
-            i = list(profile.I)
+        x = to_numpy(profile.X)
+        z = to_numpy(profile.Z)
+        i = to_numpy(profile.I)
         
         return profile.BlockId, profile.ConfigModeActive, profile.TimeSyncedByNtp, profile.ValuesValid, profile.Alarm, profile.Quality, profile.Timestamp, profile.Length, profile.EncoderValue, x, z, i
 
 
+    def ReadProfiles(self, batch):
+        """
+        Reads up to batch.capacity queued profiles into batch in one call (they are removed from the queue).
+        The queue is checked once, the points of every profile are copied straight into the rows of batch.
+        Parameters:
+        batch (ProfileBatch): Arrays to fill, reused between calls
+        Returns:
+        (int): Number of profiles read (batch.count)
+        """
+        count = min(self.client.ProfileCount, batch.capacity)
+        for row in range(count):
+            profile = self.client.ReadProfile()
+            batch.block_id[row] = profile.BlockId
+            batch.config_mode[row] = profile.ConfigModeActive
+            batch.time_synced[row] = profile.TimeSyncedByNtp
+            batch.valid[row] = profile.ValuesValid
+            batch.alarm[row] = profile.Alarm
+            batch.quality[row] = profile.Quality
+            batch.timestamp[row] = profile.Timestamp
+            batch.encoder[row] = profile.EncoderValue
+            batch.length[row] = len(to_numpy(profile.X, batch.x[row]))
+            if(profile.Z is not None):
+                to_numpy(profile.Z, batch.z[row])
+            if(profile.I is not None):
+                to_numpy(profile.I, batch.i[row])
+        batch.count = count
+        return count
+
     def ClearProfileQueue(self):
         """ Clears the profile queue. """
         self.client.ClearProfileQueue()
@@ -108,6 +189,29 @@ class oxstream:
         outputs = list(m.DigitalOuts)
         return m.BlockId, m.ConfigModeActive, m.Timestamp, m.TimeSyncedByNtp, m.ValuesValid, m.Quality, m.Alarm, outputs, m.MeasurementRate, m.EncoderValue, values
 
+    def ReadMeasurements(self, batch):
+        """
+        Reads up to batch.capacity queued measurements into batch in one call (they are removed from the queue).
+        Parameters:
+        batch (MeasurementBatch): Arrays to fill, reused between calls
+        Returns:
+        (int): Number of measurements read (batch.count)
+        """
+        count = min(self.client.MeasurementCount, batch.capacity)
+        for row in range(count):
+            m = self.client.ReadMeasurement()
+            batch.block_id[row] = m.BlockId
+            batch.timestamp[row] = m.Timestamp
+            batch.valid[row] = m.ValuesValid
+            batch.quality[row] = m.Quality
+            batch.alarm[row] = m.Alarm
+            batch.rate[row] = m.MeasurementRate
+            batch.encoder[row] = m.EncoderValue
+            to_numpy(m.Values, batch.values[row])
+            to_numpy(m.DigitalOuts, batch.outputs[row])
+        batch.count = count
+        return count
+
     def ErrorOccured(self):
         """   Returns true if at least one error is occured.  """
         return self.client.ErrorOccured
@@ -685,12 +789,12 @@ class ox:
         (int):  Precision
         (int):  X Start Value
         (int):  Length
-        (int[]):  Profile X-Values
-        (int[]):  Profile Z-Values
+        (ndarray):  Profile X-Values
+        (ndarray):  Profile Z-Values
         """
         profile = self.ox.GetProfile()
-        x = list(profile.X)
-        z = list(profile.Z)
+        x = to_numpy(profile.X)
+        z = to_numpy(profile.Z)
         return profile.Quality, profile.TimeStamp, profile.Precision, profile.XStart, profile.Length, x, z
 
     def GetIntensityProfile(self):
@@ -701,14 +805,14 @@ class ox:
         (int):  Precision
         (int):  X Start Value
         (int):  Length
-        (int[]):  Profile X-Values
-        (int[]):  Profile Z-Values
-        (int[]):  Profile Intensity-Values
+        (ndarray):  Profile X-Values
+        (ndarray):  Profile Z-Values
+        (ndarray):  Profile Intensity-Values
         """
         profile = self.ox.GetIntensityProfile()
-        x = list(profile.X)
-        z = list(profile.Z)
-        i = list(profile.I)
+        x = to_numpy(profile.X)
+        z = to_numpy(profile.Z)
+        i = to_numpy(profile.I)
         return profile.Quality, profile.TimeStamp, profile.Precision, profile.XStart, profile.Length, x, z, i
 
     def GetImageInfo(self):
@@ -0,0 +1,420 @@
+""" Simulated Baumer OX sensor with the interface of oxapi (ox, oxstream) for machines without pythonnet,
+OxApi.dll or the sensor. Profiles are generated from a synthetic surface the sensor moves over at a fixed
+profile rate, with noise, missing points, bad quality profiles and a bounded profile queue that overflows
+like the SDK's.
+
+Usage:
+    sensor = SimulatedSensor(rate=2000, surface=bead_surface(height=3.0), noise=0.02)
+    o_x = ox(sensor=sensor)
+    streamer = LaserStreamer(sensor=o_x)
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+PRECISION = 100  # Raw units per mm, x and z values are integers like the sensor's
+TIMESTAMP_UNIT = 1e-6  # Seconds per timestamp unit
+QUALITY_OK = 0
+QUALITY_BAD = 1
+QUEUE_OVERFLOW = 1  # ErrorType reported when profiles are dropped from a full queue
+
+
+def bead_surface(base=400.0, height=2.0, width=6.0, center=0.0, growth=0.0):
+    """ Weld bead along the direction of travel: a gaussian ridge on a flat plate.
+    Parameters:
+    base (float): Distance of the plate in mm
+    height, width (float): Bead height and full width in mm
+    center (float): X of the bead center in mm
+    growth (float): mm the bead rises per mm travelled
+    Returns:
+    (callable): surface(x, y) -> z in mm, x across the laser line and y along the travel (broadcast arrays)
+    """
+    sigma = width / 4.0
+
+    def surface(x, y):
+        return base + (height + growth * y) * np.exp(-0.5 * ((x - center) / sigma) ** 2)
+    return surface
+
+
+class SimulatedSensor:
+    """ Profile source behind the simulated ox and oxstream: the sensor moves along y over surface and takes
+    rate profiles per second, profile k is taken k / rate seconds after the sensor was created. """
+
+    def __init__(self, rate=1000.0, points=640, field_of_view=(-20.0, 20.0), surface=None, speed=5.0, motion=None,
+                 noise=0.01, dropout=0.0, bad_quality=0.0, encoder_steps=100.0, seed=None, clock=time.monotonic):
+        """
+        Parameters:
+        rate (float): Profiles per second
+        points (int): Points per profile (the maximum profile length)
+        field_of_view (float, float): X range of the laser line in mm
+        surface (callable): surface(x, y) -> z in mm, bead_surface() by default
+        speed (float): Travel in mm/s along y, used if motion is None
+        motion (callable): motion(t) -> y in mm at t seconds (arrays)
+        noise (float): Standard deviation of z in mm
+        dropout (float): Fraction of points without a measurement, they are left out of the profile
+        bad_quality (float): Fraction of profiles with QUALITY_BAD and values not valid
+        encoder_steps (float): Encoder steps per mm of travel
+        clock (callable): Seconds, e.g. a fake clock for deterministic tests
+        """
+        self.rate = float(rate)
+        self.points = points
+        self.x = np.linspace(field_of_view[0], field_of_view[1], points)
+        self.surface = surface if surface is not None else bead_surface()
+        self.motion = motion if motion is not None else (lambda t: speed * t)
+        self.noise = noise
+        self.dropout = dropout
+        self.bad_quality = bad_quality
+        self.encoder_steps = encoder_steps
+        self.random = np.random.default_rng(seed)
+        self.clock = clock
+        self.started = clock()
+        self.lock = threading.Lock()
+
+    def current_block(self):
+        """ Block id of the latest profile taken """
+        return int((self.clock() - self.started) * self.rate)
+
+    def profiles(self, first, count):
+        """ Generates profiles first..first+count-1 (one row each, struct of arrays with the ReadProfile fields) """
+        block_id = np.arange(first, first + count, dtype=np.int64)
+        t = block_id / self.rate
+        y = np.asarray(self.motion(t), dtype=np.float64) * np.ones(count)
+        with self.lock:
+            noise = self.random.normal(0.0, self.noise, (count, self.points)) if self.noise else 0.0
+            present = self.random.random((count, self.points)) >= self.dropout if self.dropout else None
+            bad = self.random.random(count) < self.bad_quality if self.bad_quality else np.zeros(count, dtype=bool)
+        z = self.surface(self.x[None, :], y[:, None]) + noise
+        x = np.broadcast_to(self.x, (count, self.points))
+        intensity = 512.0 + 256.0 * np.cos(np.gradient(z, axis=1) * 4.0)
+
+        x = np.rint(x * PRECISION).astype(np.int32)
+        z = np.rint(z * PRECISION).astype(np.int32)
+        i = np.rint(intensity).astype(np.int32)
+        length = np.full(count, self.points, dtype=np.int32)
+        if present is not None:
+            # Missing points are left out, the remaining ones move to the front of the row
+            order = np.argsort(~present, axis=1, kind="stable")
+            x, z, i = (np.take_along_axis(values, order, axis=1) for values in (x, z, i))
+            length = present.sum(axis=1).astype(np.int32)
+
+        return {
+            "block_id": block_id,
+            "timestamp": t / TIMESTAMP_UNIT,
+            "encoder": np.rint(y * self.encoder_steps).astype(np.int64),
+            "quality": np.where(bad, QUALITY_BAD, QUALITY_OK).astype(np.int32),
+            "length": length,
+            "valid": ~bad,
+            "alarm": np.zeros(count, dtype=bool),
+            "config_mode": np.zeros(count, dtype=bool),
+            "time_synced": np.ones(count, dtype=bool),
+            "x": x, "z": z, "i": i,
+        }
+
+    def measurements(self, profiles):
+        """ Measurements of generated profiles: values are the top height and its x in mm, output 0 is set
+        while the profile is valid """
+        count = len(profiles["block_id"])
+        columns = np.arange(self.points)
+        z = np.where(columns[None, :] < profiles["length"][:, None], profiles["z"], np.iinfo(np.int32).min)
+        top = np.argmax(z, axis=1)
+        rows = np.arange(count)
+        values = np.column_stack((z[rows, top], profiles["x"][rows, top])) / PRECISION
+        return {
+            "block_id": profiles["block_id"],
+            "timestamp": profiles["timestamp"].astype(np.int64),
+            "encoder": profiles["encoder"],
+            "quality": profiles["quality"],
+            "alarm": np.zeros(count, dtype=np.int32),
+            "rate": np.full(count, self.rate),
+            "valid": profiles["valid"],
+            "values": values,
+            "outputs": np.column_stack((profiles["valid"], np.zeros(count, dtype=bool))),
+        }
+
+
+class _Queue:
+    """ Bounded FIFO of generated rows, kept as the generated blocks with a read offset """
+
+    def __init__(self):
+        self.blocks = deque()  # [block, first unread row, rows]
+        self.count = 0
+
+    def push(self, block, rows):
+        self.blocks.append([block, 0, rows])
+        self.count += rows
+
+    def take(self, count):
+        """ Removes count rows, returns [(block, first row, rows)] """
+        spans = []
+        while count > 0 and self.blocks:
+            entry = self.blocks[0]
+            block, start, rows = entry
+            taken = min(count, rows - start)
+            spans.append((block, start, taken))
+            entry[1] += taken
+            self.count -= taken
+            count -= taken
+            if entry[1] == rows:
+                self.blocks.popleft()
+        return spans
+
+    def clear(self):
+        self.blocks.clear()
+        self.count = 0
+
+
+def _slice(block, start, rows):
+    return {name: values[start:start + rows] for name, values in block.items()}
+
+
+class oxstream:
+    """ Simulated streaming client, profiles are queued from Start() on as the sensor takes them """
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+        self.queue_size = 10000
+        self.receive_buffer_size = 0
+        self.full_queue_handling = 0
+        self.running = False
+        self.generated = 0  # Next block id to generate
+        self.profiles = _Queue()
+        self.measurement_queue = _Queue()
+        self.errors = deque()
+        self.overflowed = 0  # Profiles dropped from the full queue
+        self.lock = threading.Lock()
+
+    def _update(self):
+        """ Queues the profiles the sensor took since the last call """
+        if not self.running:
+            return
+        due = self.sensor.current_block() + 1
+        count = due - self.generated
+        if count <= 0:
+            return
+        queues = ((self.profiles, "profiles"), (self.measurement_queue, "measurements"))
+        if self.full_queue_handling == 1:
+            # Ignore newest: only what fits into the emptier queue is generated
+            kept_first = self.generated
+            kept = min(count, max(self.queue_size - min(queue.count for queue, _ in queues), 0))
+        else:
+            # Drop oldest: only the newest queue_size profiles can survive
+            kept = min(count, self.queue_size)
+            kept_first = due - kept
+        dropped = count
+        if kept:
+            blocks = {"profiles": self.sensor.profiles(kept_first, kept)}
+            blocks["measurements"] = self.sensor.measurements(blocks["profiles"])
+            for queue, kind in queues:
+                lost = count - kept
+                if self.full_queue_handling == 1:
+                    rows = min(kept, max(self.queue_size - queue.count, 0))
+                    lost += kept - rows
+                    if rows:
+                        queue.push(_slice(blocks[kind], 0, rows), rows)
+                else:
+                    overflow = max(queue.count + kept - self.queue_size, 0)
+                    lost += overflow
+                    queue.take(overflow)
+                    queue.push(blocks[kind], kept)
+                if queue is self.profiles:
+                    dropped = lost
+        if dropped:
+            self.overflowed += dropped
+            self.errors.append((due - 1, QUEUE_OVERFLOW, "Queue full, {} profiles dropped".format(dropped)))
+        self.generated = due
+
+    def Close(self):
+        self.Stop()
+
+    def Start(self):
+        with self.lock:
+            self.running = True
+            self.generated = self.sensor.current_block() + 1
+
+    def Stop(self):
+        with self.lock:
+            self._update()
+            self.running = False
+
+    def GetProfileCount(self):
+        with self.lock:
+            self._update()
+            return self.profiles.count
+
+    def ProfileAvailable(self):
+        return self.GetProfileCount() > 0
+
+    def ReadProfile(self):
+        """ One profile in the layout of oxapi.oxstream.ReadProfile, throws if the queue is empty """
+        with self.lock:
+            self._update()
+            if self.profiles.count == 0:
+                raise RuntimeError("Profile queue is empty")
+            block, start, _ = self.profiles.take(1)[0]
+        length = int(block["length"][start])
+        return (int(block["block_id"][start]), bool(block["config_mode"][start]), bool(block["time_synced"][start]),
+                bool(block["valid"][start]), bool(block["alarm"][start]), int(block["quality"][start]),
+                float(block["timestamp"][start]), length, int(block["encoder"][start]),
+                block["x"][start, :length].copy(), block["z"][start, :length].copy(), block["i"][start, :length].copy())
+
+    def ReadProfiles(self, batch):
+        """ Reads up to batch.capacity queued profiles into a ProfileBatch, returns how many """
+        return self._read(self.profiles, batch)
+
+    def ClearProfileQueue(self):
+        with self.lock:
+            self._update()
+            self.profiles.clear()
+
+    def GetMeasurementCount(self):
+        with self.lock:
+            self._update()
+            return self.measurement_queue.count
+
+    def MeasurementAvailable(self):
+        return self.GetMeasurementCount() > 0
+
+    def ReadMeasurement(self):
+        """ One measurement in the layout of oxapi.oxstream.ReadMeasurement, throws if the queue is empty """
+        with self.lock:
+            self._update()
+            if self.measurement_queue.count == 0:
+                raise RuntimeError("Measurement queue is empty")
+            block, start, _ = self.measurement_queue.take(1)[0]
+        return (int(block["block_id"][start]), False, int(block["timestamp"][start]), True, bool(block["valid"][start]),
+                int(block["quality"][start]), int(block["alarm"][start]), block["outputs"][start].tolist(),
+                float(block["rate"][start]), int(block["encoder"][start]), block["values"][start].tolist())
+
+    def ReadMeasurements(self, batch):
+        """ Reads up to batch.capacity queued measurements into a MeasurementBatch, returns how many """
+        return self._read(self.measurement_queue, batch)
+
+    def _read(self, queue, batch):
+        with self.lock:
+            self._update()
+            count = min(queue.count, batch.capacity)
+            done = 0
+            for block, start, rows in queue.take(count):
+                target = slice(done, done + rows)
+                for name, values in _slice(block, start, rows).items():
+                    destination = getattr(batch, name, None)
+                    if destination is None:
+                        continue
+                    if values.ndim == 2:
+                        width = min(values.shape[1], destination.shape[1])
+                        destination[target, :width] = values[:, :width]
+                    else:
+                        destination[target] = values
+                done += rows
+        if hasattr(batch, "length"):
+            np.minimum(batch.length[:count], batch.x.shape[1], out=batch.length[:count])
+        batch.count = count
+        return count
+
+    def ClearMeasurementQueue(self):
+        with self.lock:
+            self._update()
+            self.measurement_queue.clear()
+
+    def ErrorOccured(self):
+        with self.lock:
+            self._update()
+            return len(self.errors) > 0
+
+    def ReadError(self):
+        """ (BlockId, ErrorType, Message) of the oldest error, throws if there is none """
+        with self.lock:
+            if not self.errors:
+                raise RuntimeError("Error queue is empty")
+            return self.errors.popleft()
+
+    def SetQueueSize(self, size):
+        self.queue_size = int(size)
+
+    def GetQueueSize(self):
+        return self.queue_size
+
+    def SetReceiveBufferSize(self, size):
+        self.receive_buffer_size = int(size)
+
+    def GetReceiveBufferSize(self):
+        return self.receive_buffer_size
+
+    def SetFullQueueHandling(self, handling):
+        """ handling (int): 0: drop oldest, 1: ignore newest """
+        self.full_queue_handling = int(handling)
+
+    def GetFullQueueHandling(self):
+        return self.full_queue_handling
+
+
+class ox:
+    """ Simulated sensor connection with the methods of oxapi.ox that the acquisition code uses, the rest raise
+    NotImplementedError """
+
+    def __init__(self, ip="192.168.0.250", streamingPort=1234, sensor=None, **settings):
+        """
+        Parameters:
+        sensor (SimulatedSensor): Profile source, a SimulatedSensor(**settings) by default
+        """
+        self.ip = ip
+        self.streamingPort = streamingPort
+        self.sensor = sensor if sensor is not None else SimulatedSensor(**settings)
+        self.connected = False
+        self.exposure_time = 100
+
+    def __getattr__(self, name):
+        raise NotImplementedError("{} is not simulated".format(name))
+
+    def CreateStream(self):
+        return oxstream(self.sensor)
+
+    def Connect(self):
+        self.connected = True
+
+    def Disconnect(self):
+        self.connected = False
+
+    def Login(self, role="admin", password=""):
+        return True
+
+    def Logout(self):
+        return True
+
+    def ConfigureExposureTime(self, exposureTime):
+        self.exposure_time = exposureTime
+
+    def GetExposureTime(self):
+        return self.exposure_time
+
+    def Trigger(self, count):
+        pass
+
+    def GetProfileInfo(self):
+        return self.sensor.points, "mm", "mm"
+
+    def _current(self):
+        return self.sensor.profiles(self.sensor.current_block(), 1)
+
+    def GetProfile(self):
+        """ Latest profile: Quality Id, Timestamp, Precision, X Start Value, Length, X-Values, Z-Values """
+        p = self._current()
+        length = int(p["length"][0])
+        return (int(p["quality"][0]), float(p["timestamp"][0]), PRECISION, 0, length,
+                p["x"][0, :length].copy(), p["z"][0, :length].copy())
+
+    def GetIntensityProfile(self):
+        """ Latest profile with Intensity-Values """
+        p = self._current()
+        length = int(p["length"][0])
+        return (int(p["quality"][0]), float(p["timestamp"][0]), PRECISION, 0, length,
+                p["x"][0, :length].copy(), p["z"][0, :length].copy(), p["i"][0, :length].copy())
+
+    def GetMeasurement(self):
+        """ Quality, ConfigModeActive, Alarm, Digital Outs, Encoder value, Time stamp, Measurement rate, Measurements """
+        m = self.sensor.measurements(self._current())
+        return (int(m["quality"][0]), False, False, m["outputs"][0].tolist(), int(m["encoder"][0]),
+                int(m["timestamp"][0]), float(m["rate"][0]), m["values"][0].tolist())
@@ -0,0 +1,86 @@
+""" Plain NumPy types shared by the OX SDK wrapper (oxapi), the simulated sensor (oxsim) and recordings,
+they do not need pythonnet or OxApi.dll. """
+
+import numpy as np
+
+
+def scale_profile(x, z, precision, xStart=0, length=None):
+    """ Converts raw profile values to units (mm) in one vectorized step.
+    Parameters:
+    x, z (ndarray): Raw profile values (GetProfile, ReadProfile)
+    precision (int): Divisor of the raw values
+    xStart (int): Offset of the raw x values
+    length (int): Valid points, all by default
+    Returns:
+    (ndarray): X-Values as float64
+    (ndarray): Z-Values as float64 (None if z is None)
+    """
+    scale = 1.0 / precision
+    x = np.asarray(x[:length], dtype=np.float64)
+    x_mm = (x + xStart) * scale
+    z_mm = None if z is None else np.asarray(z[:length], dtype=np.float64) * scale
+    return x_mm, z_mm
+
+
+class ProfileBatch:
+    """ Preallocated arrays oxstream.ReadProfiles fills, one row per profile.
+    Rows 0..count-1 are valid, points of row k beyond length[k] are stale.
+    x, z, i: (capacity, width) int32 raw profile values (z and i are only written if the stream carries them)
+    length, quality: (capacity,) int32
+    block_id, encoder: (capacity,) int64
+    timestamp: (capacity,) float64
+    valid, alarm, config_mode, time_synced: (capacity,) bool
+    """
+
+    def __init__(self, capacity, width):
+        """
+        Parameters:
+        capacity (int): Profiles read per call at most
+        width (int): Points per profile at most (GetProfileInfo maximum length), longer profiles are cut
+        """
+        self.capacity = capacity
+        self.width = width
+        self.count = 0
+        self.x = np.zeros((capacity, width), dtype=np.int32)
+        self.z = np.zeros((capacity, width), dtype=np.int32)
+        self.i = np.zeros((capacity, width), dtype=np.int32)
+        self.length = np.zeros(capacity, dtype=np.int32)
+        self.quality = np.zeros(capacity, dtype=np.int32)
+        self.block_id = np.zeros(capacity, dtype=np.int64)
+        self.encoder = np.zeros(capacity, dtype=np.int64)
+        self.timestamp = np.zeros(capacity, dtype=np.float64)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.alarm = np.zeros(capacity, dtype=bool)
+        self.config_mode = np.zeros(capacity, dtype=bool)
+        self.time_synced = np.zeros(capacity, dtype=bool)
+
+    def profile(self, row):
+        """ Row as a tuple in the layout of oxstream.ReadProfile (the arrays are copies) """
+        length = self.length[row]
+        return (int(self.block_id[row]), bool(self.config_mode[row]), bool(self.time_synced[row]), bool(self.valid[row]),
+                bool(self.alarm[row]), int(self.quality[row]), float(self.timestamp[row]), int(length), int(self.encoder[row]),
+                self.x[row, :length].copy(), self.z[row, :length].copy(), self.i[row, :length].copy())
+
+
+class MeasurementBatch:
+    """ Preallocated arrays oxstream.ReadMeasurements fills, one row per measurement (rows 0..count-1 are valid).
+    values: (capacity, values) float64 measurement values (as defined in GetMeasurementInfo)
+    outputs: (capacity, outputs) bool digital outputs
+    block_id, timestamp, encoder: (capacity,) int64
+    quality, alarm: (capacity,) int32
+    rate: (capacity,) float64 measurement rate in Hz
+    valid: (capacity,) bool
+    """
+
+    def __init__(self, capacity, values, outputs=0):
+        self.capacity = capacity
+        self.count = 0
+        self.values = np.zeros((capacity, values), dtype=np.float64)
+        self.outputs = np.zeros((capacity, outputs), dtype=bool)
+        self.block_id = np.zeros(capacity, dtype=np.int64)
+        self.timestamp = np.zeros(capacity, dtype=np.int64)
+        self.encoder = np.zeros(capacity, dtype=np.int64)
+        self.quality = np.zeros(capacity, dtype=np.int32)
+        self.alarm = np.zeros(capacity, dtype=np.int32)
+        self.rate = np.zeros(capacity, dtype=np.float64)
+        self.valid = np.zeros(capacity, dtype=bool)
@@ -0,0 +1,423 @@
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+FORMAT_VERSION = 1
+CHUNK_SIZE = 1024 # Rows per chunk file
+MAX_PENDING_CHUNKS = 8 # Full chunks waiting for the writer thread before writes block
+
+# Per row fields of a chunk, stored together in <kind>_<chunk>.meta.npy, the point arrays get a file each
+PROFILE_META = np.dtype([("block_id", np.int64), ("timestamp", np.float64), ("encoder", np.int64),
+                         ("length", np.int32), ("quality", np.int32), ("valid", bool), ("alarm", bool),
+                         ("config_mode", bool), ("time_synced", bool), ("layer", np.int32)])
+MEASUREMENT_META = np.dtype([("block_id", np.int64), ("timestamp", np.int64), ("encoder", np.int64),
+                             ("quality", np.int32), ("alarm", np.int32), ("rate", np.float64), ("valid", bool),
+                             ("layer", np.int32)])
+PROFILES = "profiles"
+MEASUREMENTS = "measurements"
+
+def chunk_file(path, kind, chunk, name):
+  return os.path.join(path, f"{kind}_{chunk:06d}.{name}.npy")
+
+class SessionRecorder():
+  """Records profiles and measurements to a directory of append-only chunks
+  Every chunk is a set of plain .npy files (row metadata and one 2D array per point field) that np.load can memory
+  map. index.json lists the chunks with their row count, timestamp range and layers, it is rewritten after every
+  chunk so a recording that was cut off stays readable up to its last full chunk. Chunks never span layers.
+  Rows are collected in preallocated chunk arrays, a writer thread saves full chunks so the acquisition thread
+  never waits on the disk. set_layer(), flush() and close() may be called from other threads than the one writing.
+  The writer stops at the first chunk it fails to save, nothing after it is indexed, and every later call raises
+  that error."""
+
+  def __init__(self, path: str, width: int, values: int = 0, outputs: int = 0, intensity: bool = False,
+               chunk_size: int = CHUNK_SIZE):
+    """
+    Args:
+      path (str): Directory of the session, created if needed, must not hold a recording yet
+      width (int): Points per profile at most (GetProfileInfo maximum length)
+      values (int, optional): Values per measurement
+      outputs (int, optional): Digital outputs per measurement
+      intensity (bool, optional): Record the intensity values of the profiles too
+    """
+    if os.path.exists(os.path.join(path, "index.json")):
+      raise FileExistsError(f"{path} already holds a recording")
+    os.makedirs(path, exist_ok=True)
+    self.path = path
+    self.width = width
+    self.chunk_size = chunk_size
+    self.layer = -1
+    self.arrays = {
+      PROFILES: {"x": ((width,), np.int32), "z": ((width,), np.int32)},
+      MEASUREMENTS: {"values": ((values,), np.float64), "outputs": ((outputs,), bool)},
+    }
+    if intensity:
+      self.arrays[PROFILES]["i"] = ((width,), np.int32)
+    self.meta = {PROFILES: PROFILE_META, MEASUREMENTS: MEASUREMENT_META}
+    self.chunks = {kind: self._new_chunk(kind) for kind in self.meta}
+    self.chunk_count = {kind: 0 for kind in self.meta}
+    self.rows = {kind: 0 for kind in self.meta}
+    self.index = []
+    self.error = None
+    self.lock = threading.Lock() # Guards the open chunks and the layer
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+      json.dump({"version": FORMAT_VERSION, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "width": width,
+                 "values": values, "outputs": outputs, "intensity": intensity, "chunk_size": chunk_size}, f, indent=2)
+    self.pending = queue.Queue(MAX_PENDING_CHUNKS)
+    self.writer = threading.Thread(target=self._write_chunks, name="SessionRecorder", daemon=True)
+    self.writer.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def _new_chunk(self, kind):
+    chunk = {"count": 0, "meta": np.zeros(self.chunk_size, dtype=self.meta[kind])}
+    for name, (shape, dtype) in self.arrays[kind].items():
+      chunk[name] = np.zeros((self.chunk_size,) + shape, dtype=dtype)
+    return chunk
+
+  def set_layer(self, layer: int):
+    """Rows written from now on belong to layer, the open chunks are closed so no chunk spans two layers"""
+    with self.lock:
+      self._check()
+      if layer != self.layer:
+        for kind in self.chunks:
+          self._flush(kind)
+        self.layer = layer
+
+  def write_profiles(self, batch) -> int:
+    """Appends rows 0..batch.count-1 of a ProfileBatch (or ProfileRows of a ProfileRing)"""
+    return self._append(PROFILES, batch)
+
+  def write_measurements(self, batch) -> int:
+    """Appends rows 0..batch.count-1 of a MeasurementBatch"""
+    return self._append(MEASUREMENTS, batch)
+
+  def _check(self):
+    """Raises the error the writer thread stopped at"""
+    if self.error is not None:
+      raise self.error
+
+  def _append(self, kind, batch):
+    with self.lock:
+      self._check()
+      return self._append_rows(kind, batch)
+
+  def _append_rows(self, kind, batch):
+    count = batch.count
+    done = 0
+    while done < count:
+      chunk = self.chunks[kind]
+      start = chunk["count"]
+      rows = min(count - done, self.chunk_size - start)
+      target = slice(start, start + rows)
+      source = slice(done, done + rows)
+
+      meta = chunk["meta"]
+      for name in self.meta[kind].names:
+        values = getattr(batch, name, None)
+        if values is not None:
+          meta[name][target] = values[source]
+      meta["layer"][target] = self.layer
+      for name, (shape, _) in self.arrays[kind].items():
+        values = getattr(batch, name, None)
+        if values is None:
+          continue
+        # Profiles longer than the recorded width are cut
+        width = min(shape[0], values.shape[1])
+        chunk[name][target, :width] = values[source, :width]
+      if kind == PROFILES:
+        np.minimum(meta["length"][target], self.width, out=meta["length"][target])
+
+      chunk["count"] += rows
+      done += rows
+      if chunk["count"] == self.chunk_size:
+        self._flush(kind)
+    self.rows[kind] += count
+    return count
+
+  def _flush(self, kind):
+    """Hands the open chunk of kind to the writer thread, the caller holds the lock"""
+    chunk = self.chunks[kind]
+    if chunk["count"] == 0:
+      return
+    self.pending.put((kind, self.chunk_count[kind], chunk))
+    self.chunk_count[kind] += 1
+    self.chunks[kind] = self._new_chunk(kind)
+
+  def flush(self):
+    """Hands the open chunks to the writer thread"""
+    with self.lock:
+      self._check()
+      for kind in self.chunks:
+        self._flush(kind)
+
+  def _write_chunks(self):
+    while True:
+      item = self.pending.get()
+      if item is None:
+        return
+      if self.error is not None:
+        # Chunks after a failed one would leave a gap in the index, they are dropped until close()
+        continue
+      kind, number, chunk = item
+      try:
+        count = chunk["count"]
+        meta = chunk["meta"][:count]
+        for name in ["meta"] + list(self.arrays[kind]):
+          np.save(chunk_file(self.path, kind, number, name), chunk[name][:count])
+        self.index.append({"kind": kind, "chunk": number, "count": count,
+                           "first": float(meta["timestamp"][0]), "last": float(meta["timestamp"][-1]),
+                           "layers": [int(meta["layer"].min()), int(meta["layer"].max())]})
+        temporary = os.path.join(self.path, "index.json.tmp")
+        with open(temporary, "w") as f:
+          json.dump(self.index, f)
+        os.replace(temporary, os.path.join(self.path, "index.json"))
+      except Exception as e:
+        self.error = e
+
+  def close(self):
+    """Writes the open chunks and waits for the writer thread"""
+    if self.writer.is_alive():
+      with self.lock:
+        for kind in self.chunks:
+          self._flush(kind)
+      self.pending.put(None)
+      self.writer.join()
+    if self.error is not None:
+      raise self.error
+
+class RecordedSession():
+  """Read access to a recording, chunks are memory mapped and only read where they are used"""
+
+  def __init__(self, path: str):
+    self.path = path
+    with open(os.path.join(path, "meta.json")) as f:
+      self.meta = json.load(f)
+    index_path = os.path.join(path, "index.json")
+    index = []
+    if os.path.exists(index_path):
+      with open(index_path) as f:
+        index = json.load(f)
+    self.index = {kind: sorted((entry for entry in index if entry["kind"] == kind), key=lambda entry: entry["chunk"])
+                  for kind in (PROFILES, MEASUREMENTS)}
+    self._maps = {}
+
+  def count(self, kind: str = PROFILES) -> int:
+    return sum(entry["count"] for entry in self.index[kind])
+
+  def layers(self, kind: str = PROFILES) -> list:
+    """Layers with recorded rows"""
+    return sorted({layer for entry in self.index[kind] for layer in range(entry["layers"][0], entry["layers"][1] + 1)})
+
+  def load(self, kind: str, chunk: int, name: str) -> np.ndarray:
+    """Memory mapped array of a chunk ("meta" or a point field such as "x"), kept open for later calls"""
+    key = (kind, chunk, name)
+    if key not in self._maps:
+      self._maps[key] = np.load(chunk_file(self.path, kind, chunk, name), mmap_mode="r")
+    return self._maps[key]
+
+  def chunks(self, kind: str = PROFILES, layer: int = None, start: float = None, end: float = None) -> list:
+    """Index entries of the chunks that may hold rows of layer and of the timestamp range start..end"""
+    return [entry for entry in self.index[kind]
+            if (layer is None or entry["layers"][0] <= layer <= entry["layers"][1])
+            and (start is None or entry["last"] >= start) and (end is None or entry["first"] <= end)]
+
+  def select(self, kind: str = PROFILES, names=("x", "z"), layer: int = None, start: float = None,
+             end: float = None) -> dict:
+    """Rows of a layer and/or a timestamp range
+    Returns:
+      dict: "meta" and every field in names, concatenated over the matching chunks
+    """
+    parts = {name: [] for name in ("meta",) + tuple(names)}
+    for entry in self.chunks(kind, layer, start, end):
+      meta = self.load(kind, entry["chunk"], "meta")
+      rows = np.ones(len(meta), dtype=bool)
+      if layer is not None:
+        rows &= meta["layer"] == layer
+      if start is not None:
+        rows &= meta["timestamp"] >= start
+      if end is not None:
+        rows &= meta["timestamp"] <= end
+      for name in parts:
+        parts[name].append(self.load(kind, entry["chunk"], name)[rows])
+    return {name: np.concatenate(values) if values else np.zeros(0) for name, values in parts.items()}
+
+class _Cursor():
+  """Read position in the rows of one kind of a RecordedSession"""
+
+  def __init__(self, session, kind):
+    self.session = session
+    self.kind = kind
+    self.chunks = [entry["chunk"] for entry in session.index[kind]]
+    counts = [entry["count"] for entry in session.index[kind]]
+    self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    self.total = int(self.offsets[-1])
+    self.timestamps = np.concatenate([session.load(kind, chunk, "meta")["timestamp"] for chunk in self.chunks]) \
+      if self.chunks else np.zeros(0)
+    self.position = 0
+
+  def spans(self, count):
+    """(chunk, first row, rows) covering the next count rows"""
+    position = self.position
+    end = position + count
+    while position < end:
+      index = int(np.searchsorted(self.offsets, position, side="right")) - 1
+      row = position - int(self.offsets[index])
+      rows = min(end - position, int(self.offsets[index + 1]) - position)
+      yield self.chunks[index], row, rows
+      position += rows
+
+class ReplayStream():
+  """Plays a recording back through the interface of oxapi.oxstream
+  Without a speed all recorded rows are queued at Start(), otherwise rows are queued as the time since Start()
+  passes their timestamp (speed times real time)."""
+
+  def __init__(self, path, speed: float = None, timestamp_unit: float = 1e-6):
+    """
+    Args:
+      path (str or RecordedSession): Recording to play
+      speed (float, optional): Replay speed relative to the recording, None replays as fast as it is read
+      timestamp_unit (float, optional): Seconds per timestamp unit of the recording
+    """
+    self.session = path if isinstance(path, RecordedSession) else RecordedSession(path)
+    self.speed = speed
+    self.timestamp_unit = timestamp_unit
+    self.cursors = {kind: _Cursor(self.session, kind) for kind in (PROFILES, MEASUREMENTS)}
+    self.running = False
+    self.started = None
+    self.origin = {}
+    self.queue_size = 10000
+    self.receive_buffer_size = 0
+    self.full_queue_handling = 0
+
+  def Close(self):
+    self.running = False
+
+  def Start(self):
+    """ Starts queuing recorded rows, from where the replay stopped """
+    self.running = True
+    self.started = time.monotonic()
+    for kind, cursor in self.cursors.items():
+      self.origin[kind] = cursor.timestamps[cursor.position] if cursor.position < cursor.total else 0.0
+
+  def Stop(self):
+    self.running = False
+
+  def _available(self, kind):
+    cursor = self.cursors[kind]
+    if not self.running:
+      return 0
+    if self.speed is None:
+      return cursor.total - cursor.position
+    elapsed = (time.monotonic() - self.started) * self.speed / self.timestamp_unit
+    released = int(np.searchsorted(cursor.timestamps, self.origin[kind] + elapsed, side="right"))
+    return max(released - cursor.position, 0)
+
+  def GetProfileCount(self):
+    return self._available(PROFILES)
+
+  def ProfileAvailable(self):
+    return self._available(PROFILES) > 0
+
+  def ReadProfile(self):
+    """ One profile in the layout of oxstream.ReadProfile, throws if the queue is empty """
+    if self._available(PROFILES) == 0:
+      raise RuntimeError("Profile queue is empty")
+    cursor = self.cursors[PROFILES]
+    chunk, row, _ = next(cursor.spans(1))
+    cursor.position += 1
+    meta = self.session.load(PROFILES, chunk, "meta")[row]
+    length = int(meta["length"])
+    x = np.array(self.session.load(PROFILES, chunk, "x")[row, :length])
+    z = np.array(self.session.load(PROFILES, chunk, "z")[row, :length])
+    i = np.array(self.session.load(PROFILES, chunk, "i")[row, :length]) if self.session.meta["intensity"] else None
+    return (int(meta["block_id"]), bool(meta["config_mode"]), bool(meta["time_synced"]), bool(meta["valid"]),
+            bool(meta["alarm"]), int(meta["quality"]), float(meta["timestamp"]), length, int(meta["encoder"]), x, z, i)
+
+  def ReadProfiles(self, batch):
+    """ Copies up to batch.capacity queued profiles into a ProfileBatch, returns how many """
+    return self._read(PROFILES, batch, ("x", "z", "i"))
+
+  def ClearProfileQueue(self):
+    self.cursors[PROFILES].position += self._available(PROFILES)
+
+  def GetMeasurementCount(self):
+    return self._available(MEASUREMENTS)
+
+  def MeasurementAvailable(self):
+    return self._available(MEASUREMENTS) > 0
+
+  def ReadMeasurement(self):
+    """ One measurement in the layout of oxstream.ReadMeasurement, throws if the queue is empty """
+    if self._available(MEASUREMENTS) == 0:
+      raise RuntimeError("Measurement queue is empty")
+    cursor = self.cursors[MEASUREMENTS]
+    chunk, row, _ = next(cursor.spans(1))
+    cursor.position += 1
+    meta = self.session.load(MEASUREMENTS, chunk, "meta")[row]
+    outputs = self.session.load(MEASUREMENTS, chunk, "outputs")[row].tolist()
+    values = self.session.load(MEASUREMENTS, chunk, "values")[row].tolist()
+    return (int(meta["block_id"]), False, int(meta["timestamp"]), False, bool(meta["valid"]), int(meta["quality"]),
+            int(meta["alarm"]), outputs, float(meta["rate"]), int(meta["encoder"]), values)
+
+  def ReadMeasurements(self, batch):
+    """ Copies up to batch.capacity queued measurements into a MeasurementBatch, returns how many """
+    return self._read(MEASUREMENTS, batch, ("values", "outputs"))
+
+  def ClearMeasurementQueue(self):
+    self.cursors[MEASUREMENTS].position += self._available(MEASUREMENTS)
+
+  def _read(self, kind, batch, names):
+    cursor = self.cursors[kind]
+    count = min(self._available(kind), batch.capacity)
+    done = 0
+    for chunk, row, rows in cursor.spans(count):
+      source = slice(row, row + rows)
+      target = slice(done, done + rows)
+      meta = self.session.load(kind, chunk, "meta")[source]
+      for name in meta.dtype.names:
+        if hasattr(batch, name):
+          getattr(batch, name)[target] = meta[name]
+      for name in names:
+        if name == "i" and not self.session.meta["intensity"]:
+          continue
+        values = self.session.load(kind, chunk, name)[source]
+        width = min(values.shape[1], getattr(batch, name).shape[1])
+        getattr(batch, name)[target, :width] = values[:, :width]
+      if kind == PROFILES:
+        np.minimum(batch.length[target], batch.x.shape[1], out=batch.length[target])
+      done += rows
+    cursor.position += count
+    batch.count = count
+    return count
+
+  def ErrorOccured(self):
+    return False
+
+  def ReadError(self):
+    raise RuntimeError("Error queue is empty")
+
+  def SetQueueSize(self, size):
+    self.queue_size = int(size)
+
+  def GetQueueSize(self):
+    return self.queue_size
+
+  def SetReceiveBufferSize(self, size):
+    self.receive_buffer_size = int(size)
+
+  def GetReceiveBufferSize(self):
+    return self.receive_buffer_size
+
+  def SetFullQueueHandling(self, handling):
+    self.full_queue_handling = int(handling)
+
+  def GetFullQueueHandling(self):
+    return self.full_queue_handling
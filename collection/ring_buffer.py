@@ -0,0 +1,139 @@
+import threading
+import numpy as np
+
+class ProfileRows():
+  """Profiles copied out of a ProfileRing, fields as in oxapi.ProfileBatch (one row per profile, count rows)
+  index: int64: Position of each row in the stream (0 for the first profile written to the ring)"""
+
+  def __init__(self, fields):
+    self.__dict__.update(fields)
+    self.count = len(self.index)
+
+  def __len__(self):
+    return self.count
+
+  def points(self, row):
+    """x, z (and i if recorded) of a row, cut to its length"""
+    length = self.length[row]
+    if self.i is None:
+      return self.x[row, :length], self.z[row, :length]
+    return self.x[row, :length], self.z[row, :length], self.i[row, :length]
+
+class ProfileRing():
+  """Fixed capacity ring of the latest profiles, written by one acquisition thread and read by any number of threads
+  Memory is allocated once, the oldest profiles are overwritten when the ring is full.
+  written: Profiles written since the start (the stream position of the next profile)
+  overwritten: Profiles dropped to make room for newer ones (written - capacity once full)
+  missed: Profiles the sensor dropped before they were read (gaps in the block ids, e.g. a full sensor queue)"""
+
+  META = ("length", "quality", "block_id", "encoder", "timestamp", "valid", "alarm")
+
+  def __init__(self, capacity: int, width: int, intensity: bool = False):
+    """
+    Args:
+      capacity (int): Profiles held
+      width (int): Points per profile at most (GetProfileInfo maximum length)
+      intensity (bool, optional): Keep the intensity values too
+    """
+    self.capacity = capacity
+    self.width = width
+    self.x = np.zeros((capacity, width), dtype=np.int32)
+    self.z = np.zeros((capacity, width), dtype=np.int32)
+    self.i = np.zeros((capacity, width), dtype=np.int32) if intensity else None
+    self.length = np.zeros(capacity, dtype=np.int32)
+    self.quality = np.zeros(capacity, dtype=np.int32)
+    self.block_id = np.zeros(capacity, dtype=np.int64)
+    self.encoder = np.zeros(capacity, dtype=np.int64)
+    self.timestamp = np.zeros(capacity, dtype=np.float64)
+    self.valid = np.zeros(capacity, dtype=bool)
+    self.alarm = np.zeros(capacity, dtype=bool)
+
+    self.written = 0
+    self.missed = 0
+    self.last_block_id = None
+    self.lock = threading.Lock()
+    self.updated = threading.Condition(self.lock)
+
+  @property
+  def overwritten(self) -> int:
+    return max(self.written - self.capacity, 0)
+
+  def __len__(self):
+    return min(self.written, self.capacity)
+
+  def _arrays(self):
+    arrays = ["x", "z"] + (["i"] if self.i is not None else []) + list(self.META)
+    return [(name, getattr(self, name)) for name in arrays]
+
+  def write(self, batch):
+    """Copies rows 0..batch.count-1 of a ProfileBatch into the ring (at most two slice copies per field)
+    Returns:
+      int: Rows written
+    """
+    count = batch.count
+    if count == 0:
+      return 0
+    # Only the latest capacity rows of a batch larger than the ring survive
+    skip = max(count - self.capacity, 0)
+    rows = count - skip
+    block_ids = batch.block_id[:count]
+    width = min(self.width, batch.x.shape[1])
+
+    with self.lock:
+      gaps = np.diff(block_ids) - 1
+      self.missed += int(gaps[gaps > 0].sum())
+      if self.last_block_id is not None and block_ids[0] - self.last_block_id > 1:
+        self.missed += int(block_ids[0] - self.last_block_id - 1)
+      self.last_block_id = int(block_ids[-1])
+
+      start = (self.written + skip) % self.capacity
+      first = min(rows, self.capacity - start)
+      for target, source in ((slice(start, start + first), slice(skip, skip + first)),
+                             (slice(0, rows - first), slice(skip + first, count))):
+        if target.stop <= target.start:
+          continue
+        self.x[target, :width] = batch.x[source, :width]
+        self.z[target, :width] = batch.z[source, :width]
+        if self.i is not None:
+          self.i[target, :width] = batch.i[source, :width]
+        for name in self.META:
+          getattr(self, name)[target] = getattr(batch, name)[source]
+        self.length[target] = np.minimum(batch.length[source], width)
+      self.written += count
+      self.updated.notify_all()
+    return count
+
+  def _copy(self, first: int, last: int) -> ProfileRows:
+    """Rows for stream positions first..last-1, the caller holds the lock and both are still in the ring"""
+    rows = np.arange(first, last) % self.capacity
+    fields = {name: array[rows] for name, array in self._arrays()}
+    fields.setdefault("i", None)
+    fields["index"] = np.arange(first, last, dtype=np.int64)
+    return ProfileRows(fields)
+
+  def snapshot(self, count: int = None) -> ProfileRows:
+    """Copy of the latest count profiles (all held profiles by default), oldest first"""
+    with self.lock:
+      held = min(self.written, self.capacity)
+      count = held if count is None else min(count, held)
+      return self._copy(self.written - count, self.written)
+
+  def since(self, timestamp: float) -> ProfileRows:
+    """Copy of the held profiles newer than timestamp, oldest first (timestamps rise with the stream)"""
+    with self.lock:
+      first = self.written - min(self.written, self.capacity)
+      positions = np.arange(first, self.written) % self.capacity
+      start = int(np.searchsorted(self.timestamp[positions], timestamp, side="right"))
+      return self._copy(first + start, self.written)
+
+  def read_from(self, position: int) -> ProfileRows:
+    """Copy of the profiles from stream position on (e.g. the written count of the previous read), profiles that were
+    already overwritten are skipped, rows.index shows where the rows start"""
+    with self.lock:
+      first = max(position, self.written - min(self.written, self.capacity))
+      return self._copy(first, self.written)
+
+  def wait(self, position: int, timeout: float = None) -> bool:
+    """Blocks until a profile at stream position or later was written, False on timeout"""
+    with self.updated:
+      return self.updated.wait_for(lambda: self.written > position, timeout)
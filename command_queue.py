@@ -0,0 +1,120 @@
+"""
+command_queue.py
+
+Bounded host side queue between the code producing G-code (Main, the
+layer worker) and the Sender's streaming thread. Producers block while
+the queue is full, which keeps them at most max_depth commands ahead of
+the machine (backpressure). Depth and wait times are kept as metrics.
+
+Safety-critical and correction commands do not go through this queue,
+see Sender.send_priority().
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+def wait_summary(values):
+    """count / mean / p95 / max in milliseconds of a list of seconds"""
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values, dtype=np.float64) * 1000.0
+    return {"count": int(len(values)), "mean_ms": float(values.mean()),
+            "p95_ms": float(np.percentile(values, 95)), "max_ms": float(values.max())}
+
+
+class CommandQueue:
+    def __init__(self, max_depth=256, history=1000):
+        """
+        :param max_depth: Commands the queue holds before put() blocks
+        :param history: Number of recent wait times kept for metrics()
+        """
+        self.max_depth = max_depth
+        self._commands = deque()  # (code, time.monotonic() of put)
+        self._condition = threading.Condition()
+        self._unfinished = 0  # Queued or taken but not marked done
+        self._closed = False
+
+        self.enqueued = 0
+        self.taken = 0
+        self.max_depth_seen = 0
+        self.blocked_seconds = 0.0  # Time producers spent waiting on a full queue
+        self.wait_times = deque(maxlen=history)  # Seconds from put() to take() per command
+
+    @property
+    def depth(self):
+        return len(self._commands)
+
+    def put(self, code, timeout=None):
+        """Queues a command, blocks while the queue is full. Returns False if timeout (seconds) ran out first."""
+        with self._condition:
+            if len(self._commands) >= self.max_depth:
+                started = time.monotonic()
+                full = not self._condition.wait_for(
+                    lambda: len(self._commands) < self.max_depth or self._closed, timeout)
+                self.blocked_seconds += time.monotonic() - started
+                if full:
+                    return False
+            if self._closed:
+                raise RuntimeError("Command queue is closed")
+            self._commands.append((code, time.monotonic()))
+            self._unfinished += 1
+            self.enqueued += 1
+            self.max_depth_seen = max(self.max_depth_seen, len(self._commands))
+            self._condition.notify_all()
+        return True
+
+    def take(self, max_commands, timeout=None):
+        """Removes up to max_commands consecutive commands, waits for at least one.
+        Returns an empty list on timeout or once the queue is closed and empty."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._commands or self._closed, timeout)
+            now = time.monotonic()
+            codes = []
+            while self._commands and len(codes) < max_commands:
+                code, queued_at = self._commands.popleft()
+                codes.append(code)
+                self.wait_times.append(now - queued_at)
+            self.taken += len(codes)
+            self._condition.notify_all()
+            return codes
+
+    def task_done(self, count=1):
+        """Marks taken commands as sent"""
+        with self._condition:
+            self._unfinished -= count
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """Blocks until every queued command was taken and marked done. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._unfinished <= 0, timeout)
+
+    def clear(self):
+        """Drops the commands that were not taken yet (e.g. after a pause), returns how many"""
+        with self._condition:
+            dropped = len(self._commands)
+            self._commands.clear()
+            self._unfinished -= dropped
+            self._condition.notify_all()
+            return dropped
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def metrics(self):
+        with self._condition:
+            return {
+                "depth": len(self._commands),
+                "max_depth": self.max_depth,
+                "max_depth_seen": self.max_depth_seen,
+                "enqueued": self.enqueued,
+                "taken": self.taken,
+                "blocked_seconds": self.blocked_seconds,
+                "wait": wait_summary(list(self.wait_times)),
+            }
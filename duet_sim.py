@@ -0,0 +1,371 @@
+"""
+duet_sim.py
+
+Local stand-in for a Duet in standalone mode, so the sender paths can be
+run and timed without the board. It implements the rr_* endpoints used by
+Sender, DuetTransport and ModelPoller:
+
+    rr_connect, rr_disconnect, rr_gcode (with "buff"), rr_reply,
+    rr_model (key/flags, "f" = live values only, seqs), rr_upload
+
+Queued commands run on a motion thread: G0/G1 take distance / feedrate
+(G90/G91, modal F, with acceleration set every move accelerates from and
+decelerates to a stop, M204 changes it), G4 dwells, M98 runs uploaded macros (including the
+global variable lines the upload mode writes), M42 sets gpOut.
+
+Usage:
+    python duet_sim.py [--port 8080] [--latency 0.005] [--time-scale 1]
+    python sender.py job.gcode  (with duet_ip="127.0.0.1:8080")
+"""
+
+import argparse
+import json
+import math
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from model_poller import extract
+from processors.gcode_parser import parse_line
+
+BUFFER_SIZE = 255
+AXES = "XYZ"
+
+_GLOBAL = re.compile(r'^(?:set\s+)?global\.?\s*(\w+)\s*=\s*(.+)$')
+_EXISTS = re.compile(r'^if\s+!exists\(global\.(\w+)\)$')
+
+
+def _value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text.strip('"')
+
+
+class DuetSimulator:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, time_scale=1.0, buffer_size=BUFFER_SIZE, acceleration=None):
+        """
+        :param port: TCP port, 0 picks a free one (see address)
+        :param latency: Seconds added to every HTTP response
+        :param time_scale: Simulated motion runs this many times faster than real time
+        :param buffer_size: Size of the G-code buffer reported as "buff"
+        :param acceleration: mm/s² of every move, None moves at constant feedrate
+        """
+        self.latency = latency
+        self.time_scale = time_scale
+        self.buffer_size = buffer_size
+        self.acceleration = acceleration
+
+        self.lock = threading.Condition()
+        self.queue = deque()  # Commands waiting in the buffer
+        self.buffered = 0  # Bytes of the queued commands
+        self.replies = []
+        self.files = {}
+        self.globals = {}
+        self.gp_out = {}
+        self.seqs = {"state": 0, "move": 0, "global": 0, "reply": 0}
+
+        self.position = [0.0, 0.0, 0.0]
+        self.relative = False
+        self.feedrate = 3000.0  # mm/min
+        self.move = None  # (start, end, started_at, duration) of the running move
+        self.running = False  # A command is being executed
+
+        # Counters for benchmarks
+        self.requests = 0
+        self.endpoint_requests = {}
+        self.commands = 0
+        self.overflows = 0
+        self.motion_seconds = 0.0  # Real time spent executing moves and dwells
+        self.idle_gaps = []  # (start, end) time.monotonic() of every wait for the next command
+
+        self._stop = threading.Event()
+        self._motion = threading.Thread(target=self._run_motion, name="DuetSimMotion", daemon=True)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._server_thread = threading.Thread(target=self.server.serve_forever, name="DuetSimHTTP", daemon=True)
+
+    @property
+    def address(self):
+        """host:port to pass as duet_ip"""
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._motion.start()
+        self._server_thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self.lock:
+            self.lock.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.endpoint_requests = {}
+            self.commands = 0
+            self.overflows = 0
+            self.motion_seconds = 0.0
+            self.idle_gaps = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Object model
+
+    def status(self):
+        return "busy" if self.running or self.queue else "idle"
+
+    def machine_position(self):
+        if self.move is None:
+            return list(self.position)
+        start, end, started_at, duration = self.move
+        progress = min((time.monotonic() - started_at) / duration, 1.0) if duration > 0 else 1.0
+        return [a + (b - a) * progress for a, b in zip(start, end)]
+
+    def model(self, live_only=False):
+        position = [round(value, 3) for value in self.machine_position()]
+        model = {
+            "state": {
+                "status": self.status(),
+                "gpOut": [{"pwm": self.gp_out.get(pin, 0.0)} for pin in range(max(self.gp_out, default=-1) + 1)],
+                "upTime": int(time.monotonic()),
+            },
+            "move": {
+                "axes": [{"letter": letter, "machinePosition": value, "userPosition": value}
+                         for letter, value in zip(AXES, position)],
+                "currentMove": {"requestedSpeed": self.feedrate / 60.0 if self.move else 0.0},
+            },
+            "seqs": dict(self.seqs),
+        }
+        if not live_only:
+            model["global"] = dict(self.globals)
+        return model
+
+    # Commands
+
+    def queue_code(self, code):
+        """Adds the lines of an rr_gcode request to the buffer, returns the free space"""
+        with self.lock:
+            for line in code.split("\n"):
+                line = line.strip()
+                if not line:
+                    continue
+                if self.buffered + len(line) + 1 > self.buffer_size:
+                    # A real board would refuse the request, senders have to respect "buff"
+                    self.overflows += 1
+                    continue
+                self.queue.append(line)
+                self.buffered += len(line) + 1
+            self.lock.notify_all()
+            return self.buffer_size - self.buffered
+
+    def _run_motion(self):
+        while not self._stop.is_set():
+            with self.lock:
+                idle_since = None if self.queue else time.monotonic()
+                while not self.queue and not self._stop.is_set():
+                    self.lock.wait()
+                if idle_since is not None:
+                    self.idle_gaps.append((idle_since, time.monotonic()))
+                if self._stop.is_set():
+                    return
+                line = self.queue.popleft()
+                self.buffered -= len(line) + 1
+                self.running = True
+                self.seqs["state"] += 1
+            try:
+                self._execute(line)
+            finally:
+                with self.lock:
+                    self.running = False
+                    self.seqs["state"] += 1
+                    self.lock.notify_all()
+
+    def _execute_lines(self, lines):
+        skip_indent = None
+        for line in lines:
+            stripped = line.strip()
+            indent = len(line) - len(line.lstrip())
+            if skip_indent is not None:
+                if stripped and indent > skip_indent:
+                    continue
+                skip_indent = None
+            exists = _EXISTS.match(stripped)
+            if exists:
+                if exists.group(1) in self.globals:
+                    skip_indent = indent
+                continue
+            if stripped:
+                self._execute(stripped)
+
+    def _execute(self, line):
+        self.commands += 1
+        assignment = _GLOBAL.match(line)
+        if assignment:
+            self.globals[assignment.group(1)] = _value(assignment.group(2).strip())
+            self.seqs["global"] += 1
+            return
+
+        record = parse_line(line)
+        command = record.command
+        params = record.params
+        if command in ("G0", "G1"):
+            if isinstance(params.get("F"), float):
+                self.feedrate = params["F"]
+            target = list(self.position)
+            for axis, letter in enumerate(AXES):
+                if isinstance(params.get(letter), float):
+                    target[axis] = target[axis] + params[letter] if self.relative else params[letter]
+            distance = math.dist(self.position, target)
+            duration = self.move_duration(distance) / self.time_scale
+            self.move = (list(self.position), target, time.monotonic(), duration)
+            self.seqs["move"] += 1
+            self._stop.wait(duration)
+            self.motion_seconds += duration
+            self.position = target
+            self.move = None
+        elif command == "G4":
+            seconds = (params.get("S") or 0.0) + (params.get("P") or 0.0) / 1000.0
+            self._stop.wait(seconds / self.time_scale)
+            self.motion_seconds += seconds / self.time_scale
+        elif command == "M204" and self.acceleration is not None:
+            acceleration = params.get("P") if isinstance(params.get("P"), float) else params.get("S")
+            if isinstance(acceleration, float) and acceleration > 0:
+                self.acceleration = acceleration
+        elif command == "G90":
+            self.relative = False
+        elif command == "G91":
+            self.relative = True
+        elif command == "G92":
+            for axis, letter in enumerate(AXES):
+                if isinstance(params.get(letter), float):
+                    self.position[axis] = params[letter]
+        elif command == "M42" and params.get("P") is not None:
+            self.gp_out[int(params["P"])] = 1.0 if (params.get("S") or 0) > 0 else 0.0
+            self.seqs["state"] += 1
+        elif command == "M98" and isinstance(params.get("P"), str):
+            macro = self.files.get(params["P"])
+            if macro is None:
+                self._reply(f"Error: M98: macro file {params['P']} not found")
+            else:
+                self._execute_lines(macro.splitlines())
+        elif command == "M114":
+            self._reply(" ".join(f"{letter}:{value:.3f}" for letter, value in zip(AXES, self.position)))
+        elif command == "M291" and isinstance(params.get("P"), str):
+            self._reply(params["P"])
+
+    def move_duration(self, distance):
+        """Seconds of a move from and to a stop at the current feedrate"""
+        if self.feedrate <= 0:
+            return 0.0
+        speed = self.feedrate / 60.0
+        if not self.acceleration:
+            return distance / speed
+        if distance >= speed ** 2 / self.acceleration:
+            return distance / speed + speed / self.acceleration
+        # Too short to reach the feedrate
+        return 2.0 * math.sqrt(distance / self.acceleration)
+
+    def _reply(self, text):
+        with self.lock:
+            self.replies.append(text)
+            self.seqs["reply"] += 1
+
+    # HTTP
+
+    def _handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, content_type="application/json"):
+                if simulator.latency:
+                    time.sleep(simulator.latency)
+                if not isinstance(body, (bytes, str)):
+                    body = json.dumps(body)
+                if isinstance(body, str):
+                    body = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _query(self):
+                url = urlparse(self.path)
+                query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+                return url.path, query
+
+            def _count(self, path):
+                simulator.requests += 1
+                simulator.endpoint_requests[path] = simulator.endpoint_requests.get(path, 0) + 1
+
+            def do_GET(self):
+                path, query = self._query()
+                self._count(path)
+                if path == "/rr_connect":
+                    self._send({"err": 0, "sessionTimeout": 8000, "boardType": "duetsim", "apiLevel": 1})
+                elif path == "/rr_disconnect":
+                    self._send({"err": 0})
+                elif path == "/rr_gcode":
+                    self._send({"buff": simulator.queue_code(query.get("gcode", ""))})
+                elif path == "/rr_reply":
+                    with simulator.lock:
+                        text = "\n".join(simulator.replies)
+                        simulator.replies = []
+                    self._send(text, "text/plain")
+                elif path == "/rr_model":
+                    key = query.get("key", "")
+                    flags = query.get("flags", "")
+                    with simulator.lock:
+                        model = simulator.model(live_only="f" in flags and not key)
+                    self._send({"key": key, "flags": flags, "result": extract(model, key)})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                path, query = self._query()
+                self._count(path)
+                if path != "/rr_upload" or "name" not in query:
+                    self.send_error(404)
+                    return
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                simulator.files[query["name"]] = data.decode("utf-8", errors="replace")
+                self._send({"err": 0})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated Duet (rr_* API) for offline sender tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Run motion this many times faster")
+    parser.add_argument("--acceleration", type=float, help="mm/s² of every move (default: constant feedrate)")
+    args = parser.parse_args()
+
+    simulator = DuetSimulator(args.host, args.port, args.latency, args.time_scale,
+                              acceleration=args.acceleration).start()
+    print(f"Simulated Duet listening on {simulator.address}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
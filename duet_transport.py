@@ -0,0 +1,487 @@
+"""
+duet_transport.py
+
+Thin HTTP client for the Duet standalone (rr_*) API that keeps one
+keep-alive session open and tracks how much room is left in the
+firmware's G-code buffer, so commands can be streamed without waiting
+for the machine to go idle after every line.
+
+Everything that talks to the board (Sender, WeldScanner, the v0 script)
+goes through shared_transport(), so the board is connected once, and
+through send_many(), which packs consecutive commands into one
+newline-separated rr_gcode request. A requests.Session must not be used
+by two threads at once, code running on another thread (pollers, the
+sender's streaming thread) works on a clone() with its own session:
+
+    transport = shared_transport("192.168.0.4")
+    for result in transport.send_many(["G90", "G1 F1000 Z40", "G1 X10 Y11 Z12", "G4 S1"]):
+        if result.error:
+            print(result.code, result.reply)
+"""
+
+import asyncio
+import json
+import re
+import socket
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BUFFER_SIZE = 255  # Reported "buff" of an empty RRF HTTP G-code channel
+MAX_PACKET_BYTES = 200  # Largest packed rr_gcode request, leaves room in the buffer for the commands still queued
+# Commands that wait for the machine (or the user). They end a packet, so a reply read after the packet
+# belongs to the commands before them and nothing queued behind a wait is counted as sent.
+BLOCKING_COMMANDS = ("M400", "G4", "G28", "G29", "G30", "G32", "M0", "M1", "M25", "M98", "M109", "M116",
+                     "M190", "M191", "M226")
+# Meta commands may open blocks spanning several lines, they are always sent on their own
+_META = re.compile(r'^(if|elif|else|while|break|continue|abort|var|global|set|echo)\b')
+_COMMAND = re.compile(r'^([GMT])0*(\d+(?:\.\d+)?)', re.IGNORECASE)
+_REPLY_LINE = re.compile(r'^(Error|Warning):\s*(?:([GMT]\d+(?:\.\d+)?):\s*)?', re.IGNORECASE)
+
+# Outcome of one command of send_many(): reply holds the reply lines attributed to it,
+# error is True if one of them is an "Error:" line
+CommandResult = namedtuple("CommandResult", ["code", "reply", "error"])
+
+
+def command_word(code):
+    """Returns the normalised command of a line ("g01 X1" -> "G1") or None for meta commands and blank lines"""
+    match = _COMMAND.match(code.strip())
+    return f"{match.group(1).upper()}{match.group(2)}" if match else None
+
+
+def clean_code(code):
+    """Strips comments and whitespace, returns "" for lines without a command"""
+    code = code.strip()
+    if '"' not in code:
+        # Quoted strings may contain ";", those lines are sent as they are
+        code = code.partition(";")[0].strip()
+    return code
+
+
+def is_blocking(code):
+    command = command_word(code)
+    if command == "M291":
+        # Only message boxes with S2/S3 wait for the user
+        return re.search(r'\bS[23]\b', code) is not None
+    return command in BLOCKING_COMMANDS
+
+
+def pack_commands(codes, limit=MAX_PACKET_BYTES, max_commands=None):
+    """
+    Groups commands, in order, into packets that are each sent as one newline-separated rr_gcode request.
+    A packet ends when the next command would not fit into limit bytes (or max_commands), after a
+    blocking command, and around meta commands (if/while/var/...), which always go alone.
+    Lines without a command are dropped. Returns a list of lists of codes.
+    """
+    packets = []
+    packet = []
+    size = 0
+    for code in codes:
+        code = clean_code(code)
+        if not code:
+            continue
+        meta = _META.match(code) is not None
+        if packet and (meta or size + len(code) + 1 > limit or (max_commands and len(packet) >= max_commands)):
+            packets.append(packet)
+            packet, size = [], 0
+        packet.append(code)
+        size += len(code) + 1
+        if meta or is_blocking(code):
+            packets.append(packet)
+            packet, size = [], 0
+    if packet:
+        packets.append(packet)
+    return packets
+
+
+def attribute_reply(codes, reply, replies=None, start=0):
+    """
+    Splits the rr_reply text read after a packet over the commands that produced it. Lines prefixed
+    with a command ("Error: G1: target position outside machine limits") go to the first command with
+    that command word in the packet codes[start:] that has no reply yet. Commands keep running after
+    their packet was sent, so if the packet has no such command the line goes to the latest one of the
+    earlier packets codes[:start]. Other lines go to the last command of the packet.
+    :param replies: Reply lines per command collected so far (extended in place), None to start empty
+    :return: List of CommandResult in the order of codes
+    """
+    if replies is None:
+        replies = [[] for _ in codes]
+    words = [command_word(code) for code in codes]
+    for line in (reply or "").splitlines():
+        line = line.strip()
+        if not line or not codes:
+            continue
+        index = len(codes) - 1
+        match = _REPLY_LINE.match(line)
+        if match and match.group(2):
+            word = command_word(match.group(2))
+            packet = [i for i in range(start, len(codes)) if words[i] == word]
+            earlier = [i for i in range(start) if words[i] == word]
+            if packet:
+                index = next((i for i in packet if not replies[i]), packet[-1])
+            elif earlier:
+                index = earlier[-1]
+        replies[index].append(line)
+    return [CommandResult(code, "\n".join(lines), any(line.lower().startswith("error") for line in lines))
+            for code, lines in zip(codes, replies)]
+
+
+def pooled_session(connections=1):
+    """requests.Session keeping up to connections keep-alive connections per board, so requests do not
+    open a new connection each. Sessions are not thread-safe, every DuetTransport gets its own."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=connections))
+    return session
+
+
+_shared_transports = {}
+_shared_lock = threading.Lock()
+
+
+def shared_transport(host, password="reprap", timeout=5.0):
+    """Returns the DuetTransport of a board, created and connected (rr_connect) on first use.
+    Callers on the same thread share it, other threads use a clone() of it."""
+    with _shared_lock:
+        transport = _shared_transports.get(host)
+        if transport is None:
+            transport = DuetTransport(host, password=password, timeout=timeout, session=pooled_session())
+            transport.connect()
+            _shared_transports[host] = transport
+        return transport
+
+
+class DuetError(Exception):
+    """Raised when the board rejects a request or reports an error"""
+
+
+class _HTTPConnection:
+    """One keep-alive HTTP/1.1 connection on asyncio streams (reopened when the board closes it)"""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.headers = {}
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        # Requests are tiny, Nagle + delayed ACK would add ~40 ms to each one
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def request(self, path, params=None):
+        """GET path?params and return (status, body bytes)"""
+        target = f"{path}?{urlencode(params)}" if params else path
+        headers = "".join(f"{name}: {value}\r\n" for name, value in self.headers.items())
+        request = (f"GET {target} HTTP/1.1\r\nHost: {self.host}\r\n{headers}"
+                   "Connection: keep-alive\r\n\r\n").encode()
+        for attempt in range(2):
+            if self.writer is None:
+                await self._open()
+            try:
+                self.writer.write(request)
+                await self.writer.drain()
+                return await asyncio.wait_for(self._read_response(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The board drops idle connections, retry once on a fresh one
+                self.close()
+                if attempt:
+                    raise
+            except BaseException:
+                # A timed out or cancelled request leaves the stream in an unknown state
+                self.close()
+                raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                body += await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            self.close()
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class DuetTransport:
+    def __init__(self, host, password="reprap", timeout=5.0, session=None):
+        """
+        :param host: IP or host name of the Duet
+        :param password: Board password (rr_connect)
+        :param timeout: Seconds before a request is considered lost
+        :param session: Optional requests.Session to reuse
+        """
+        self.host = host
+        self.base_url = f"http://{host}"
+        self.password = password
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.buffer_free = DEFAULT_BUFFER_SIZE  # Last "buff" reported by rr_gcode
+        self.buffer_size = 0  # Largest "buff" seen, i.e. the size of the empty buffer (learned from the first reply)
+
+    def _get(self, endpoint, **params):
+        try:
+            response = self.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DuetError(f"{endpoint} failed: {e}") from e
+        if not response.ok:
+            raise DuetError(f"{endpoint} failed: HTTP {response.status_code}")
+        return response
+
+    def connect(self):
+        result = self._get("rr_connect", password=self.password, time=time.strftime("%Y-%m-%dT%H:%M:%S")).json()
+        if result.get("err", 0) != 0:
+            raise DuetError(f"rr_connect refused (err {result['err']})")
+        if "sessionKey" in result:
+            # RRF 3.5+ identifies the session by this header instead of the client IP
+            self.session.headers["X-Session-Key"] = str(result["sessionKey"])
+        return result
+
+    def disconnect(self):
+        return self._get("rr_disconnect").json()
+
+    def clone(self):
+        """Returns a transport to the same board for another thread: its own session and buffer tracking,
+        authorised by the session key of this one instead of another rr_connect"""
+        transport = DuetTransport(self.host, password=self.password, timeout=self.timeout, session=pooled_session())
+        if "X-Session-Key" in self.session.headers:
+            transport.session.headers["X-Session-Key"] = self.session.headers["X-Session-Key"]
+        transport.buffer_size = self.buffer_size
+        return transport
+
+    def _update_buffer(self, result):
+        if "buff" in result:
+            self.buffer_free = int(result["buff"])
+            self.buffer_size = max(self.buffer_size, self.buffer_free)
+        return self.buffer_free
+
+    def send(self, code):
+        """Queues a command (or several separated by newlines) without waiting for it to run.
+        Returns the free space of the G-code buffer reported by the board."""
+        return self._update_buffer(self._get("rr_gcode", gcode=code).json())
+
+    def poll_buffer(self):
+        """Refreshes buffer_free without queueing anything"""
+        return self.send("")
+
+    def wait_buffer(self, size, poll_interval=0.01):
+        """Blocks until the G-code buffer has room for size bytes (at most the size of the empty buffer)"""
+        size = min(size, self.buffer_size or size)
+        while self.buffer_free < size:
+            time.sleep(poll_interval)
+            self.poll_buffer()
+        return self.buffer_free
+
+    def send_many(self, codes, read_reply=True, limit=MAX_PACKET_BYTES):
+        """
+        Sends commands in order, consecutive ones packed into a single request (see pack_commands).
+        Each packet waits for room in the firmware buffer instead of overflowing it.
+        :param read_reply: Read rr_reply after every packet and attribute it to the commands (see attribute_reply),
+                           errors of commands still running when this returns show up in later replies
+        :return: List of CommandResult, one per sent command (empty replies if read_reply is False)
+        """
+        if self.buffer_size:
+            limit = min(limit, self.buffer_size)
+        sent = []
+        replies = []
+        for packet in pack_commands(codes, limit):
+            code = "\n".join(packet)
+            self.wait_buffer(len(code) + 1)
+            self.send(code)
+            start = len(sent)
+            sent.extend(packet)
+            replies.extend([] for _ in packet)
+            if read_reply:
+                attribute_reply(sent, self.reply(), replies, start)
+        return [CommandResult(code, "\n".join(lines), any(line.lower().startswith("error") for line in lines))
+                for code, lines in zip(sent, replies)]
+
+    def reply(self):
+        """Returns the replies of the commands run since the last call"""
+        return self._get("rr_reply").text
+
+    def get_model(self, key=None, flags="d99vn"):
+        params = {"flags": flags}
+        if key is not None:
+            params["key"] = key
+        return self._get("rr_model", **params).json().get("result")
+
+    def upload(self, path, data):
+        """Writes a file on the board's SD card, e.g. upload("/macros/layer.g", text)"""
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            response = self.session.post(f"{self.base_url}/rr_upload", params={"name": path},
+                                         data=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DuetError(f"rr_upload failed: {e}") from e
+        if not response.ok or response.json().get("err", 0) != 0:
+            raise DuetError(f"rr_upload of {path} failed")
+
+    def get_status(self):
+        return self.get_model(key="state.status")
+
+    def wait_idle(self, poll_interval=0.1, timeout=None):
+        """Blocks until the board reports idle. Returns False if timeout (seconds) ran out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while str(self.get_status()).lower() != "idle":
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def sync(self, poll_interval=0.1, timeout=None):
+        """Waits until every queued command has run (M400) and the board is idle"""
+        self.send("M400")
+        return self.wait_idle(poll_interval, timeout)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncDuetTransport:
+    """asyncio version of DuetTransport.
+
+    Commands go through one keep-alive connection in order, while status
+    and object model reads use their own connections, so polling runs
+    concurrently with sending (and with sensor work in the same event loop).
+    """
+
+    def __init__(self, host, password="reprap", timeout=5.0, port=80, status_connections=2):
+        """
+        :param host: IP or host name of the Duet, "host:port" overrides port
+        :param status_connections: Connections reserved for object model reads
+        """
+        if ":" in host:
+            host, port = host.rsplit(":", 1)
+            port = int(port)
+        self.host = host
+        self.password = password
+        self.timeout = timeout
+        self.buffer_free = DEFAULT_BUFFER_SIZE
+        self.buffer_size = 0
+        self._command = _HTTPConnection(host, port, timeout)
+        self._command_lock = asyncio.Lock()
+        self._status = asyncio.Queue()
+        self._connections = [self._command]
+        for _ in range(status_connections):
+            connection = _HTTPConnection(host, port, timeout)
+            self._connections.append(connection)
+            self._status.put_nowait(connection)
+
+    async def _get(self, connection, endpoint, params=None):
+        try:
+            status, body = await connection.request(f"/{endpoint}", params)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            raise DuetError(f"{endpoint} failed: {e!r}") from e
+        if status != 200:
+            raise DuetError(f"{endpoint} failed: HTTP {status}")
+        return body
+
+    async def _get_command(self, endpoint, params=None):
+        async with self._command_lock:
+            return await self._get(self._command, endpoint, params)
+
+    async def _get_status(self, endpoint, params=None):
+        connection = await self._status.get()
+        try:
+            return await self._get(connection, endpoint, params)
+        finally:
+            self._status.put_nowait(connection)
+
+    async def connect(self):
+        params = {"password": self.password, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        result = json.loads(await self._get_command("rr_connect", params))
+        if result.get("err", 0) != 0:
+            raise DuetError(f"rr_connect refused (err {result['err']})")
+        if "sessionKey" in result:
+            for connection in self._connections:
+                connection.headers["X-Session-Key"] = str(result["sessionKey"])
+        return result
+
+    async def disconnect(self):
+        return json.loads(await self._get_command("rr_disconnect"))
+
+    def _update_buffer(self, result):
+        if "buff" in result:
+            self.buffer_free = int(result["buff"])
+            self.buffer_size = max(self.buffer_size, self.buffer_free)
+        return self.buffer_free
+
+    async def send(self, code):
+        """Queues a command, returns the free space of the G-code buffer"""
+        return self._update_buffer(json.loads(await self._get_command("rr_gcode", {"gcode": code})))
+
+    async def poll_buffer(self):
+        return await self.send("")
+
+    async def reply(self):
+        return (await self._get_command("rr_reply")).decode("utf-8", errors="replace")
+
+    async def get_model(self, key=None, flags="d99vn"):
+        params = {"flags": flags}
+        if key is not None:
+            params["key"] = key
+        return json.loads(await self._get_status("rr_model", params)).get("result")
+
+    async def get_status(self):
+        return await self.get_model(key="state.status")
+
+    async def wait_idle(self, poll_interval=0.1, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while str(await self.get_status()).lower() != "idle":
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
+
+    async def sync(self, poll_interval=0.1, timeout=None):
+        await self.send("M400")
+        return await self.wait_idle(poll_interval, timeout)
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            await self.disconnect()
+        finally:
+            self.close()
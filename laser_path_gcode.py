@@ -6,6 +6,7 @@ over the region that was just printed, so we can measure height.
 """
 
 from postprocessor_interface import PrintProcessorInterface
+from processors.gcode_parser import tokenize
 
 
 class LaserPathGcode(PrintProcessorInterface):
@@ -29,23 +30,35 @@ class LaserPathGcode(PrintProcessorInterface):
         self.last_z = 0.0
         self.extract_coordinates()
 
+    @classmethod
+    def from_extents(cls, extents, layer):
+        """
+        Builds the scanner from precomputed extents instead of
+        re-reading the layer's G-code lines.
+
+        :param extents: LayerExtents of the job (PreProcessor.parse_extents())
+        :param layer: layer index
+        """
+        scanner = cls([])
+        values = (extents.min_x[layer], extents.max_x[layer],
+                  extents.min_y[layer], extents.max_y[layer])
+        # Layers without moves are NaN, keep the defaults of extract_coordinates()
+        if not any(value != value for value in values):
+            scanner.min_x, scanner.max_x, scanner.min_y, scanner.max_y = (float(value) for value in values)
+        if extents.z[layer] == extents.z[layer]:
+            scanner.last_z = float(extents.z[layer])
+        return scanner
+
     def extract_coordinates(self):
         """
         Looks through the existing G-code lines, tries to find min/max
         X/Y, and the last Z used. This is a simplistic approach.
         """
-        for line in self.gcode_lines:
-            if line.startswith("G1") and ("X" in line) and ("Y" in line):
-                # Example parse for X, Y, Z
-                tokens = line.split()
-                x_val, y_val, z_val = None, None, None
-                for t in tokens:
-                    if t.startswith("X"):
-                        x_val = float(t[1:])
-                    elif t.startswith("Y"):
-                        y_val = float(t[1:])
-                    elif t.startswith("Z"):
-                        z_val = float(t[1:])
+        for record in tokenize(self.gcode_lines):
+            if record.command == "G1" and "X" in record.params and "Y" in record.params:
+                x_val = record.params["X"]
+                y_val = record.params["Y"]
+                z_val = record.params.get("Z")
                 # Update min/max
                 if x_val is not None:
                     if self.min_x is None or x_val < self.min_x:
@@ -1,21 +1,95 @@
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from processors import * 
 from sender import *
 from collection import *
 
 class Main():
   
-  def __init__(self, gcode_file):
+  def __init__(self, gcode_file, send_mode="pipelined", measure=None, fallback=FALLBACK_LAST_OFFSET, deadline_margin=1.0,
+               streamer=None):
+    """
+    Args:
+      gcode_file (str): Path to the gcode file
+      send_mode (str, optional): Sender mode, "line", "pipelined" or "upload" (each layer runs as a macro)
+      measure (callable, optional): measure(layer) -> measured top height of a welded layer, see PostProcessor
+      fallback (str, optional): What is sent when the next layer is not regenerated in time, FALLBACK_LAST_OFFSET
+                  or FALLBACK_UNCORRECTED
+      deadline_margin (float, optional): Seconds the next layer may take past the predicted end of the current one,
+                  and past the return of the measurement of the current one once that came in (measuring only
+                  finishes after the layer)
+      streamer (LaserStreamer, optional): Laser stream running during the print, its recording is split by layer
+    """
     self.gcode_file = "test.gcode"
-    self.preprocessor = PreProcessor(gcode_file)
-    self.postprocessor = PostProcessor()
-    self.sender = Sender()
+    self.preprocessor = PreProcessor(gcode_file, indexed=True, cache=JobCache())
+    self.preprocessor.prepare()
+    # Regenerated layers are always built from the planned ones, not from earlier corrections
+    self.postprocessor = PostProcessor(self.preprocessor.parse_layers(), self.preprocessor.parse_extents(), measure)
+    self.sender = Sender(mode=send_mode)
+    self.estimator = self.preprocessor.parse_motion()
     
     # Layer Logic
-    self.layers = self.preprocessor.parse_layers()
+    self.layers = self.preprocessor.parse_layers(compact=True)
     self.current_layer = 0
     self.total_layers = len(self.layers)
     
+    # The next layer is regenerated in the background while the current one runs
+    self.fallback = fallback
+    self.deadline_margin = deadline_margin
+    self.streamer = streamer
+    self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LayerWorker")
+    self.pending = None # (layer, Future, deadline) of the layer being regenerated
+    self.wanted_layer = None # Layer the worker should regenerate, jobs for other layers are stale
+    
+  def start_next_layer(self, layer, deadline):
+    """Starts regenerating a layer in the worker, it has to be done by deadline (a time.time() value)"""
+    self.wanted_layer = layer
+    self.pending = (layer, self.worker.submit(self._regenerate, layer), deadline)
+    
+  def _regenerate(self, layer):
+    # A job queued behind a late one that is still running may have been given up on in the meantime
+    if self.wanted_layer != layer:
+      return None
+    return self.postprocessor.gen_next_layer(layer)
+    
+  def _wait_regenerated(self, layer, future, deadline):
+    """Result of a regeneration job, raises FutureTimeout once it missed its deadline"""
+    while True:
+      try:
+        return future.result(timeout=max(deadline - time.time(), 0.0))
+      except FutureTimeout:
+        # Measuring only finishes after the layer, the regeneration gets the margin from there
+        measured = self.postprocessor.measured.get(layer - 1)
+        if measured is None or measured + self.deadline_margin <= deadline:
+          raise
+        deadline = measured + self.deadline_margin
+    
+  def take_layer(self, layer):
+    """
+    Returns the layer to send: the regenerated one if the worker finished by its deadline, the fallback otherwise
+    """
+    if self.pending is None or self.pending[0] != layer:
+      return self.layers[layer]
+    
+    _, future, deadline = self.pending
+    self.pending = None
+    try:
+      regenerated = self._wait_regenerated(layer, future, deadline)
+    except FutureTimeout:
+      # A late result is dropped, the offset it measured still counts for the layers after this one.
+      # A running job cannot be stopped, the next one queues behind it and gets the worker when it returns.
+      self.wanted_layer = None
+      future.cancel()
+      print(f"Layer {layer + 1} missed its deadline, sending it with the {self.fallback} fallback.")
+      regenerated = self.postprocessor.fallback_layer(layer, self.fallback)
+    except Exception as e:
+      print(f"Layer {layer + 1} could not be regenerated ({e}), sending it with the {self.fallback} fallback.")
+      regenerated = self.postprocessor.fallback_layer(layer, self.fallback)
+    
+    # Swapped in whole, the sender never sees a partially regenerated layer
+    self.layers[layer] = regenerated
+    return regenerated
+    
   def run(self):
     """
     Runs a single layer of the print with all processing
@@ -26,23 +100,30 @@ class Main():
     if self.current_layer >= self.total_layers:
       Exception("Layer index exceeds total layers")
     
-    # Prints current layer 
-    self.sender.send_layer(self.layers[self.current_layer])
+    layer = self.take_layer(self.current_layer)
+    duration = float(self.estimator.layer_time[self.current_layer])
+    if self.current_layer + 1 < self.total_layers:
+      # Regenerate the next layer while this one runs, it is due when this one is predicted to end
+      self.start_next_layer(self.current_layer + 1, time.time() + duration + self.deadline_margin)
+    
+    if self.streamer is not None:
+      self.streamer.set_layer(self.current_layer)
+    # Prints current layer, the sender sleeps through its predicted run time before checking the machine
+    self.sender.send_layer(layer, duration=duration)
     self.current_layer += 1
-    print(f"Layer {self.current_layer} sent.")
+    print(f"Layer {self.current_layer} sent, about {self.estimator.remaining(self.current_layer):.0f} s left.")
     
     if self.current_layer == self.total_layers:
       # If all layers are done, exit
       print("All layers sent.")
+      self.worker.shutdown(wait=False)
+      self.preprocessor.close()
       return True
-    else:
-      # Otherwise, generate next layer and replace current layer in queue 
-      self.layers[self.current_layer] = self.postprocessor.gen_next_layer()
-      return False
+    return False
       
   def run_all(self):
     """Prints all layers"""
+    # Layers run back to back, send_layer returns as soon as the machine has finished the layer
     while True:
       if self.run():
-        break
-      time.sleep(0.5)
\ No newline at end of file
+        break
\ No newline at end of file
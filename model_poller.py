@@ -0,0 +1,209 @@
+"""
+model_poller.py
+
+One background poller for the Duet object model. Every interval it
+fetches the frequently changing values of the whole model in a single
+rr_model request ("f" flag) and keeps the last snapshot with its
+timestamp. Keys that are not part of the live values (e.g. "global")
+are only re-read when the firmware's "seqs" counter of their branch
+changes. Subscribers get a callback when a key they watch changes, so
+nothing else needs to poll the board on its own.
+
+The fast interval only applies while someone waits on the model
+(wait_for, wait_idle) or during a burst(), otherwise the snapshot and
+the subscribers are refreshed every idle_interval.
+"""
+
+import threading
+import time
+
+DEFAULT_KEYS = ("state.status", "move.axes[].machinePosition")
+LIVE_FLAGS = "d99fn"  # Frequently changing values of the whole model
+KEY_FLAGS = "d99vn"  # Verbose read of a single key
+
+
+def extract(model, path):
+    """
+    Reads a dotted key from an object model dict. "[]" maps over a list:
+    extract(model, "move.axes[].machinePosition") -> [x, y, z, ...]
+    Returns None if the key is missing.
+    """
+    if not path:
+        return model
+    name, _, rest = path.partition(".")
+    if name.endswith("[]"):
+        items = model.get(name[:-2]) if isinstance(model, dict) else None
+        if not isinstance(items, list):
+            return None
+        return [extract(item, rest) for item in items]
+    if not isinstance(model, dict) or name not in model:
+        return None
+    return extract(model[name], rest)
+
+
+class ModelPoller:
+    def __init__(self, transport, keys=DEFAULT_KEYS, interval=0.1, idle_interval=0.5):
+        """
+        :param transport: DuetTransport used only by this poller (its own session)
+        :param keys: Object model keys kept in the snapshot
+        :param interval: Seconds between polls while a wait_for() is waiting
+        :param idle_interval: Seconds between polls while nobody waits (at least interval)
+        """
+        self.transport = transport
+        self.keys = list(keys)
+        self.interval = interval
+        self.idle_interval = max(idle_interval, interval)
+
+        self.snapshot = {}  # Key -> latest value
+        self.timestamps = {}  # Key -> time.time() the request for the value was sent
+        self.updated = 0.0  # time.time() the latest poll was sent
+        self.polls = 0
+        self.requests = 0  # HTTP requests sent by the poller
+
+        self._seqs = {}
+        self._subscribers = []  # (callback, keys or None)
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._waiters = 0  # Threads blocked in wait_for()
+        self._burst_until = 0.0  # time.time() up to which burst_interval applies
+        self._burst_interval = interval
+        self._thread = None
+        self.error = None
+
+    def watch(self, key):
+        """Adds a key to the snapshot"""
+        if key not in self.keys:
+            self.keys.append(key)
+
+    def subscribe(self, callback, keys=None):
+        """
+        Calls callback(key, value, previous, timestamp) from the poller thread whenever
+        one of keys (all keys if None) changes. Returns callback for unsubscribe().
+        """
+        for key in keys or []:
+            self.watch(key)
+        self._subscribers.append((callback, set(keys) if keys else None))
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers = [entry for entry in self._subscribers if entry[0] != callback]
+
+    def poll(self):
+        """Reads the model once, updates the snapshot and notifies subscribers"""
+        # Stamped before the request, a response to a request sent before a command must not count as after it
+        now = time.time()
+        live = self.transport.get_model(flags=LIVE_FLAGS) or {}
+        self.requests += 1
+
+        values = {}
+        seqs = live.get("seqs", {})
+        for key in self.keys:
+            value = extract(live, key)
+            if value is None:
+                # Not a live value: only re-read when the firmware reports a change of its branch
+                branch = key.partition(".")[0].partition("[")[0]
+                seq = seqs.get(branch)
+                if key in self.snapshot and seq is not None and self._seqs.get(branch) == seq:
+                    continue
+                value = self.transport.get_model(key=key, flags=KEY_FLAGS)
+                self.requests += 1
+            values[key] = value
+        self._seqs = dict(seqs)
+
+        changes = []
+        with self._condition:
+            for key, value in values.items():
+                previous = self.snapshot.get(key)
+                if key not in self.snapshot or previous != value:
+                    changes.append((key, value, previous))
+                self.snapshot[key] = value
+                self.timestamps[key] = now
+            self.updated = now
+            self.polls += 1
+            self._condition.notify_all()
+
+        for key, value, previous in changes:
+            for callback, keys in list(self._subscribers):
+                if keys is None or key in keys:
+                    callback(key, value, previous, now)
+        return self.snapshot
+
+    def get(self, key, default=None):
+        return self.snapshot.get(key, default)
+
+    def wait_for(self, predicate, after=None, timeout=None):
+        """
+        Blocks until predicate(snapshot) is true for a snapshot taken after the
+        time.time() value after (e.g. the time a command was sent).
+        Returns False if timeout (seconds) ran out first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._waiters += 1
+            if self._waiters == 1 and self._thread is not None:
+                # The poller may be sleeping through an idle interval
+                self.wake()
+            try:
+                while (after is not None and self.updated <= after) or not predicate(self.snapshot):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    if self._thread is None:
+                        # Not started: poll from the calling thread
+                        self._condition.release()
+                        try:
+                            self.poll()
+                            time.sleep(self.interval)
+                        finally:
+                            self._condition.acquire()
+                    else:
+                        self._condition.wait(remaining)
+            finally:
+                self._waiters -= 1
+        return True
+
+    def wait_idle(self, after=None, timeout=None):
+        self.watch("state.status")
+        return self.wait_for(lambda snapshot: str(snapshot.get("state.status")).lower() == "idle", after, timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                self.error = None
+            except Exception as e:
+                # Keep polling through dropped requests, the error is kept for callers to inspect
+                self.error = e
+            self._wake.wait(self._next_interval())
+            self._wake.clear()
+
+    def _next_interval(self):
+        if time.time() < self._burst_until:
+            return self._burst_interval
+        return self.interval if self._waiters else self.idle_interval
+
+    def wake(self):
+        """Polls right away instead of at the next interval"""
+        self._wake.set()
+
+    def burst(self, until, interval):
+        """Polls right away and then every interval seconds until the time.time() value until,
+        e.g. around the predicted end of a motion"""
+        self._burst_interval = interval
+        self._burst_until = until
+        self.wake()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ModelPoller", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
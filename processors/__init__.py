@@ -1,2 +1,11 @@
-from postprocessor import *
-from preprocessor import *
\ No newline at end of file
+from .compact_layer import *
+from .gcode_parser import *
+from .job_cache import *
+from .layer_extents import *
+from .motion_estimator import *
+from .move_table import *
+from .pipeline import *
+from .weld_segments import *
+from .section_parser import *
+from .postprocessor import *
+from .preprocessor import *
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""Parallel preprocessing of whole job directories
+
+Usage:
+    python -m processors.batch <directory or glob> [--workers N] [--manifest manifest.json] [--no-cache]
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from .job_cache import JobCache, DEFAULT_CACHE_DIR
+from .preprocessor import PreProcessor
+
+def find_jobs(source: str) -> list:
+  """Returns the gcode files of a directory, or the files matching a glob pattern, sorted"""
+  if os.path.isdir(source):
+    return sorted(glob.glob(os.path.join(source, "*.gcode")))
+  return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+def preprocess_job(path: str, processors=None, cache_dir: str = DEFAULT_CACHE_DIR) -> dict:
+  """Preprocesses one job and returns its manifest entry. Never raises, failures are reported in the entry"""
+
+  entry = {"job": path, "ok": False, "error": None, "from_cache": False, "pid": os.getpid(), "timings": {}}
+  timings = entry["timings"]
+  started = time.perf_counter()
+
+  try:
+    stage = time.perf_counter()
+    cache = JobCache(cache_dir) if cache_dir else None
+    with PreProcessor(path, cache=cache, processors=processors) as preprocessor:
+      entry["from_cache"] = preprocessor.from_cache
+      timings["sections"] = time.perf_counter() - stage
+
+      stage = time.perf_counter()
+      entry["layers"] = len(preprocessor.parse_layers())
+      timings["layers"] = time.perf_counter() - stage
+
+      stage = time.perf_counter()
+      preprocessor.run_processors()
+      timings["processors"] = time.perf_counter() - stage
+
+      stage = time.perf_counter()
+      entry["moves"] = len(preprocessor.parse_moves())
+      timings["moves"] = time.perf_counter() - stage
+
+      stage = time.perf_counter()
+      preprocessor.prepare()
+      timings["cache"] = time.perf_counter() - stage
+
+    entry["ok"] = True
+  except Exception as e:
+    entry["error"] = f"{type(e).__name__}: {e}"
+    entry["traceback"] = traceback.format_exc()
+
+  entry["seconds"] = time.perf_counter() - started
+  return entry
+
+def _failed_entry(job: str, error: Exception) -> dict:
+  """Manifest entry of a job whose worker died (e.g. killed or out of memory)"""
+  return {"job": job, "ok": False, "error": f"{type(error).__name__}: {error}", "seconds": None}
+
+def _preprocess_isolated(job: str, processors, cache_dir: str) -> dict:
+  """Preprocesses one job in a process of its own"""
+  with ProcessPoolExecutor(max_workers=1) as pool:
+    try:
+      return pool.submit(preprocess_job, job, processors, cache_dir).result()
+    except Exception as e:
+      return _failed_entry(job, e)
+
+def preprocess_batch(source, processors=None, cache_dir: str = DEFAULT_CACHE_DIR, workers: int = None, manifest_path: str = None) -> dict:
+  """Preprocesses every job in a process pool
+  Args:
+    source (str or list[str]): Directory, glob pattern or list of gcode paths
+    processors (optional): Default processors for every job, must be picklable
+    cache_dir (str, optional): Job cache directory, None disables the cache
+    workers (int, optional): Pool size, defaults to the number of CPUs
+    manifest_path (str, optional): Also writes the manifest to this JSON file
+  Returns:
+    dict: Manifest with one entry per job (in input order) and totals
+  """
+
+  jobs = find_jobs(source) if isinstance(source, str) else list(source)
+  started = time.perf_counter()
+  entries = {}
+
+  if jobs:
+    suspects = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+      futures = {pool.submit(preprocess_job, job, processors, cache_dir): job for job in jobs}
+      for future in as_completed(futures):
+        job = futures[future]
+        try:
+          entries[job] = future.result()
+        except BrokenProcessPool:
+          # A dying worker breaks the whole pool and fails every unfinished job with it, which one died is unknown
+          suspects.append(job)
+        except Exception as e:
+          entries[job] = _failed_entry(job, e)
+
+    if suspects:
+      # Rerun the unfinished jobs with one process each, so only the job that kills its worker fails
+      with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as runner:
+        for job, entry in zip(suspects, runner.map(lambda job: _preprocess_isolated(job, processors, cache_dir), suspects)):
+          entries[job] = entry
+
+  manifest = {
+    "jobs": [entries[job] for job in jobs],
+    "total": len(jobs),
+    "failed": sum(1 for entry in entries.values() if not entry["ok"]),
+    "seconds": time.perf_counter() - started,
+  }
+
+  if manifest_path:
+    with open(manifest_path, "w") as f:
+      json.dump(manifest, f, indent=2)
+
+  return manifest
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Preprocess every gcode job of a directory or glob in parallel")
+  parser.add_argument("source", help="Directory or glob pattern of gcode files")
+  parser.add_argument("--workers", type=int, default=None)
+  parser.add_argument("--manifest", default=None, help="Write the manifest to this JSON file")
+  parser.add_argument("--no-cache", action="store_true")
+  args = parser.parse_args()
+
+  manifest = preprocess_batch(args.source, cache_dir=None if args.no_cache else DEFAULT_CACHE_DIR,
+                              workers=args.workers, manifest_path=args.manifest)
+  for entry in manifest["jobs"]:
+    status = "ok" if entry["ok"] else f"FAILED ({entry['error']})"
+    seconds = f"{entry['seconds']:.2f}s" if entry["seconds"] is not None else "-"
+    print(f"{entry['job']}: {status} {seconds}")
+  print(f"{manifest['total'] - manifest['failed']}/{manifest['total']} jobs preprocessed in {manifest['seconds']:.2f}s")
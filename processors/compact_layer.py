@@ -0,0 +1,134 @@
+"""Compact in memory representation of gcode layers: interned line templates plus array backed numbers"""
+
+import re
+
+import numpy as np
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+_MAX_DIGITS = 18 # Mantissas have to fit into int64
+
+def _format_number(mantissa: int, decimals: int) -> str:
+  digits = str(abs(mantissa))
+  if decimals:
+    digits = digits.rjust(decimals + 1, "0")
+    digits = digits[:-decimals] + "." + digits[-decimals:]
+  return "-" + digits if mantissa < 0 else digits
+
+class LinePool():
+  """Interns line templates (a line with its numbers cut out, e.g. "G1 X{} Y{} ;Removed extrusion in weld_control.py")
+  so every distinct template is stored once, no matter how many layers use it"""
+
+  def __init__(self):
+    self.templates = []
+    self.ids = {}
+
+  def intern(self, template: str) -> int:
+    template_id = self.ids.get(template)
+    if template_id is None:
+      template_id = len(self.templates)
+      self.ids[template] = template_id
+      self.templates.append(template)
+    return template_id
+
+  def __len__(self):
+    return len(self.templates)
+
+class CompactLayer():
+  """Read only sequence of lines stored as struct of arrays
+  template: int32: Template id (LinePool) per line
+  value_offsets: int32: Numbers of line i are value_offsets[i]:value_offsets[i + 1]
+  mantissa: int32 (int64 if needed), decimals: int8: Each number as a scaled integer and its number of decimals (180.683 -> 180683, 3)
+  Lines decode back to exactly the text they were built from, lines whose numbers would not survive the
+  round trip (e.g. "-0", "1.", "007") are kept whole as their own template."""
+
+  __slots__ = ("pool", "template", "value_offsets", "mantissa", "decimals")
+
+  def __init__(self, lines, pool: LinePool = None):
+    """
+    Args:
+      lines: Iterable of gcode lines
+      pool (LinePool, optional): Shared template pool, pass the same pool for all layers of a job
+    """
+    self.pool = pool if pool is not None else LinePool()
+
+    templates = []
+    offsets = [0]
+    mantissas = []
+    decimals = []
+    for line in lines:
+      template, numbers = self._encode(line)
+      templates.append(self.pool.intern(template))
+      for mantissa, places in numbers:
+        mantissas.append(mantissa)
+        decimals.append(places)
+      offsets.append(len(mantissas))
+
+    self.template = np.array(templates, dtype=np.int32)
+    self.value_offsets = np.array(offsets, dtype=np.int32)
+    self.mantissa = np.array(mantissas, dtype=np.int64)
+    if len(mantissas) and np.abs(self.mantissa).max() < 2 ** 31:
+      # Coordinates with up to 3 decimals fit into int32 for any realistic build volume
+      self.mantissa = self.mantissa.astype(np.int32)
+    self.decimals = np.array(decimals, dtype=np.int8)
+
+  @staticmethod
+  def _encode(line: str):
+    """Splits a line into its template and (mantissa, decimals) pairs, falls back to the whole line"""
+    numbers = []
+    parts = []
+    position = 0
+    for match in _NUMBER.finditer(line):
+      text = match.group()
+      integer, _, fraction = text.partition(".")
+      if len(integer) + len(fraction) > _MAX_DIGITS:
+        return line.replace("{", "{{").replace("}", "}}"), ()
+      number = (int(integer + fraction), len(fraction))
+      if _format_number(*number) != text:
+        return line.replace("{", "{{").replace("}", "}}"), ()
+      parts.append(line[position:match.start()].replace("{", "{{").replace("}", "}}"))
+      parts.append("{}")
+      numbers.append(number)
+      position = match.end()
+    parts.append(line[position:].replace("{", "{{").replace("}", "}}"))
+    return "".join(parts), numbers
+
+  def __len__(self):
+    return len(self.template)
+
+  def _line(self, index: int, mantissa: list, decimals: list) -> str:
+    start, end = self.value_offsets[index], self.value_offsets[index + 1]
+    template = self.pool.templates[self.template[index]]
+    if start == end:
+      return template.format()
+    return template.format(*(_format_number(mantissa[i], decimals[i]) for i in range(start, end)))
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(len(self)))]
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError("Line index out of range")
+    return self._line(index, self.mantissa, self.decimals)
+
+  def __iter__(self):
+    # Python ints/lists are much faster to index than numpy scalars when decoding a whole layer
+    templates = self.pool.templates
+    offsets = self.value_offsets.tolist()
+    mantissa = self.mantissa.tolist()
+    decimals = self.decimals.tolist()
+    for index, template_id in enumerate(self.template.tolist()):
+      start, end = offsets[index], offsets[index + 1]
+      yield templates[template_id].format(*(_format_number(mantissa[i], decimals[i]) for i in range(start, end)))
+
+  def to_lines(self) -> list:
+    return list(self)
+
+  def __eq__(self, other):
+    if isinstance(other, (CompactLayer, list)):
+      return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    return NotImplemented
+
+  def nbytes(self) -> int:
+    """Bytes held by the arrays of this layer (the shared pool is not included)"""
+    return self.template.nbytes + self.value_offsets.nbytes + self.mantissa.nbytes + self.decimals.nbytes
@@ -0,0 +1,225 @@
+"""Single pass G-code tokenizer shared by every parser in the project"""
+
+import re
+
+MOTION_COMMANDS = frozenset(("G0", "G1", "G2", "G3"))
+LAYER_MARKER = ";LAYER:" # Comment the slicer (Cura) starts every layer with
+# Commands taking an unquoted free text argument instead of parameters (messages, file names)
+TEXT_COMMANDS = frozenset(("M23", "M28", "M30", "M32", "M117", "M118", "M928"))
+_COMMAND_CACHE_SIZE = 4096
+_UPPER = {chr(code): chr(code).upper() for code in range(ord("A"), ord("z") + 1) if chr(code).isalpha()}
+_COMMANDS = {} # Word -> normalized command (or None), most files use a handful of distinct command words
+
+# Fallback for words without separating spaces (G1F9000) and quoted strings (M291 P"Weld On")
+_WORD = re.compile(r'([A-Za-z])[ \t]*("(?:[^"]|"")*"|[-+]?(?:\d+\.?\d*|\.\d+))?')
+
+class GcodeLine():
+  """A single tokenized line of gcode
+  command: str: Command word such as "G1", "M42" or "T0". None for comment only or blank lines
+  params: dict: Parameter letter -> float, str (quoted values) or None (bare letters like G28 XY)
+  comment: str: Comment including the leading ";" or None
+  line_number: int: Line number in the original file
+  raw: str: Original line without line ending
+  Line numbers (N<n>) and checksums (*<n>) of host protocol lines are dropped."""
+
+  __slots__ = ("command", "comment", "line_number", "raw", "_words", "_params")
+
+  def __init__(self, command, words, comment, line_number, raw):
+    self.command = command
+    self.comment = comment
+    self.line_number = line_number
+    self.raw = raw
+    self._words = words
+    self._params = None
+
+  @property
+  def params(self):
+    # Parameters are converted on first access so marker scans (e.g. ;LAYER:) never pay for float parsing
+    if self._params is None:
+      # The argument of TEXT_COMMANDS is free text, see text
+      self._params = {} if self.command in TEXT_COMMANDS else _parse_words(self._words)
+    return self._params
+
+  @property
+  def text(self):
+    """Free text argument of TEXT_COMMANDS (e.g. the message of M117, unquoted), None for other commands"""
+    if self.command not in TEXT_COMMANDS:
+      return None
+    text = " ".join(self._words)
+    if len(text) > 1 and text[0] == '"' and text[-1] == '"':
+      text = text[1:-1].replace('""', '"')
+    return text
+
+  def get(self, letter, default=None):
+    """Returns the value of a parameter or default if the line does not have it"""
+    return self.params.get(letter, default)
+
+  def is_move(self):
+    return self.command in MOTION_COMMANDS
+
+  def __repr__(self):
+    return f"GcodeLine({self.line_number}: {self.command} {self.params} {self.comment!r})"
+
+def _convert(value):
+  if not value:
+    return None
+  if value[0] == '"':
+    return value[1:-1].replace('""', '"')
+  return float(value)
+
+def _parse_words(words):
+  params = {}
+  try:
+    # Common case: every word is a letter and a number
+    for word in words:
+      params[_UPPER[word[0]]] = float(word[1:])
+    return params
+  except (KeyError, ValueError):
+    params.clear()
+  for word in words:
+    letter = word[0].upper()
+    value = word[1:]
+    if not value:
+      params[letter] = None
+    elif value[0] == '"':
+      params[letter] = value[1:-1].replace('""', '"')
+    else:
+      try:
+        params[letter] = float(value)
+      except ValueError:
+        # Words without separating spaces, e.g. XY or X1Y2
+        for letter, value in _WORD.findall(word):
+          params[letter.upper()] = _convert(value)
+  return params
+
+def _command(word):
+  """Returns the normalized command word (G01 -> G1, G29.1 stays) or None if word is not a command"""
+  command = _COMMANDS.get(word)
+  if command is not None:
+    return command
+  letter = word[0].upper()
+  if letter not in "GMT":
+    return None
+  number = word[1:]
+  if number.isdigit():
+    command = letter + (number.lstrip("0") or "0")
+  else:
+    whole, dot, fraction = number.partition(".")
+    if not (whole.isdigit() and dot and fraction.isdigit()):
+      return None
+    command = letter + (whole.lstrip("0") or "0") + dot + fraction
+  if len(_COMMANDS) < _COMMAND_CACHE_SIZE:
+    _COMMANDS[word] = command
+  return command
+
+def _split_quoted(raw):
+  """Words and comment of a line with quoted strings, which may contain spaces, ";" and '*'"""
+  words = []
+  parts = raw.split('"')
+  for i, part in enumerate(parts):
+    if i % 2:
+      # Quoted string, belongs to the word before it (P"text"). "" escapes leave empty parts in between.
+      if words:
+        words[-1] += '"' + part + '"'
+      else:
+        words.append('"' + part + '"')
+      continue
+    code, separator, comment = part.partition(";")
+    tokens = code.split()
+    if i and tokens and not code[0].isspace():
+      words[-1] += tokens.pop(0)
+    words.extend(tokens)
+    if separator:
+      return words, '"'.join([separator + comment] + parts[i + 1:]).rstrip()
+  return words, None
+
+def _parse_slow(raw, line_number):
+  """Tokenizes a line with quoted strings, a line number or a command that is not cached yet"""
+  if '"' in raw:
+    # Quoted strings may contain ";" so the line has to be split around them
+    words, comment = _split_quoted(raw)
+    if words and "*" in words[-1] and words[-1].rfind("*") > words[-1].rfind('"'):
+      # Checksum after the last quoted string
+      last = words.pop()
+      last = last[:last.rfind("*")]
+      if last:
+        words.append(last)
+  else:
+    code, separator, comment = raw.partition(";")
+    comment = separator + comment.rstrip() if separator else None
+    words = code.partition("*")[0].split()
+  if words and words[0][0] in "Nn" and words[0][1:].isdigit():
+    # Line number of the host protocol
+    words = words[1:]
+  if not words:
+    return GcodeLine(None, (), comment, line_number, raw)
+
+  first = words[0]
+  command = _command(first)
+  if command is None:
+    # Command glued to its first parameter, e.g. G1F9000
+    match = _WORD.match(first)
+    if match is not None and match.group(2) and match.group(2)[0] != '"':
+      command = _command(match.group(1) + match.group(2))
+      if command is not None:
+        return GcodeLine(command, [first[match.end():]] + words[1:], comment, line_number, raw)
+    return GcodeLine(command, words, comment, line_number, raw)
+  return GcodeLine(command, words[1:], comment, line_number, raw)
+
+def parse_line(line: str, line_number: int = 0) -> GcodeLine:
+  """Tokenizes one line of gcode"""
+  return next(tokenize((line,), line_number))
+
+def tokenize(lines, start: int = 1):
+  """Yields a GcodeLine for every line of an iterable of strings (e.g. a list of lines or an open file)
+  Args:
+    lines: Iterable of gcode lines
+    start (int, optional): Line number of the first line
+  """
+  # Plain lines with a known command word are handled inline, everything else goes through _parse_slow()
+  commands = _COMMANDS
+  line_type = GcodeLine
+  for line_number, line in enumerate(lines, start):
+    raw = line.rstrip("\r\n")
+    if '"' in raw or "*" in raw:
+      yield _parse_slow(raw, line_number)
+      continue
+    code, separator, comment = raw.partition(";")
+    comment = separator + comment.rstrip() if separator else None
+    words = code.split()
+    if not words:
+      yield line_type(None, (), comment, line_number, raw)
+      continue
+    command = commands.get(words[0])
+    if command is None:
+      yield _parse_slow(raw, line_number)
+      continue
+    yield line_type(command, words[1:], comment, line_number, raw)
+
+def is_layer_marker(line: str) -> bool:
+  """True if the comment of a line starts with LAYER_MARKER, with or without code before it. Lines without the
+  marker text are rejected by a substring test, so scanning for layers does not tokenize every line."""
+  if LAYER_MARKER not in line:
+    return False
+  if '"' not in line:
+    return line.find(";") == line.find(LAYER_MARKER)
+  comment = parse_line(line).comment
+  return comment is not None and comment.startswith(LAYER_MARKER)
+
+def _word_pattern(letter):
+  return re.compile(r'(?<![A-Za-z])[' + letter.upper() + letter.lower() + r'][ \t]*[-+]?(?:\d+\.?\d*|\.\d+)')
+
+def replace_word(line: str, letter: str, value: float) -> str:
+  """Replaces the value of a parameter in the code part of a line, the comment is kept as is
+  Example: replace_word("G1 X10 Z5 ;wall", "Z", 5.2) -> "G1 X10 Z5.2 ;wall"
+  """
+  code, separator, comment = line.partition(";")
+  text = f"{float(value):.3f}".rstrip("0").rstrip(".")
+  code = _word_pattern(letter).sub(lambda match: letter.upper() + text, code, count=1)
+  return code + separator + comment
+
+def remove_word(line: str, letter: str) -> str:
+  """Removes a parameter (e.g. the E of a move) from the code part of a line"""
+  code, separator, comment = line.partition(";")
+  code = re.sub(r'[ \t]*' + _word_pattern(letter).pattern, "", code)
+  return code + separator + comment
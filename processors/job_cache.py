@@ -0,0 +1,75 @@
+"""On-disk cache of preprocessed jobs keyed by the gcode content and the processor configuration"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+CACHE_VERSION = 5 # Bump whenever the layout or the parsing rules of a cached payload change
+DEFAULT_CACHE_DIR = ".arcment_cache"
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+  """SHA-256 of a file's content, read in chunks"""
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+def processor_fingerprint(processors) -> str:
+  """Describes a processor set by class and configuration, so changing either produces a new key.
+  The configuration comes from processor.config(), runtime state (e.g. the modal state of a run) is left out."""
+  parts = []
+  for processor in processors or []:
+    cls = type(processor)
+    config = sorted((name, repr(value)) for name, value in processor.config().items())
+    parts.append(f"{cls.__module__}.{cls.__qualname__}:{config}")
+  return "|".join(parts)
+
+class JobCache():
+  """Stores everything PreProcessor derives from a job (sections, layer index, move table, ...) as one pickle
+  per key. The key hashes the file content and the processor set, so stale entries are never read back."""
+
+  def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+    self.cache_dir = cache_dir
+
+  def key(self, path: str, processors=None) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION}".encode())
+    digest.update(file_digest(path).encode())
+    digest.update(processor_fingerprint(processors).encode())
+    return digest.hexdigest()
+
+  def path(self, key: str) -> str:
+    return os.path.join(self.cache_dir, key + ".pkl")
+
+  def load(self, key: str):
+    """Returns the cached payload (dict) or None on a miss or an unreadable entry"""
+    try:
+      with open(self.path(key), "rb") as f:
+        payload = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+      return None
+    if not isinstance(payload, dict) or payload.get("version") != CACHE_VERSION:
+      return None
+    return payload
+
+  def store(self, key: str, payload: dict):
+    """Writes the payload atomically so a crashed or parallel writer never leaves a partial entry"""
+    os.makedirs(self.cache_dir, exist_ok=True)
+    payload = dict(payload, version=CACHE_VERSION)
+    fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp_path, self.path(key))
+    except BaseException:
+      os.unlink(tmp_path)
+      raise
+
+  def clear(self):
+    if not os.path.isdir(self.cache_dir):
+      return
+    for name in os.listdir(self.cache_dir):
+      if name.endswith(".pkl"):
+        os.unlink(os.path.join(self.cache_dir, name))
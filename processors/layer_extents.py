@@ -0,0 +1,78 @@
+"""Per layer extents (bounding box, Z level, path length, centroid) of a whole job"""
+
+import numpy as np
+
+from .move_table import MoveTable
+
+class LayerExtents():
+  """Struct of arrays with one entry per layer, computed from a MoveTable in a single vectorized pass
+  min_x, max_x, min_y, max_y: float32: Bounding box of the torch positions reached in the layer
+  z: float32: Z at the end of the layer (the last Z of LaserPathGcode)
+  min_z, max_z: float32: Z range of the layer
+  path_length: float32: Distance travelled by all moves of the layer in mm
+  weld_length: float32: Part of path_length travelled with the welder on
+  centroid: (layer_count, 2) float32: Path length weighted centroid (X, Y), mean of the positions if nothing moves
+  Layers without moves are NaN, except for the lengths which are 0"""
+
+  def __init__(self, table: MoveTable):
+    self.layer_count = table.layer_count
+    count = self.layer_count
+    starts = table.layer_offsets[:-1]
+    ends = table.layer_offsets[1:]
+    has_moves = ends > starts
+    index = starts[has_moves]
+
+    bounds = table.layer_bounds()
+    self.min_x, self.max_x, self.min_y, self.max_y = (bounds[:, i].copy() for i in range(4))
+
+    self.z = np.full(count, np.nan, dtype=np.float32)
+    self.min_z = np.full(count, np.nan, dtype=np.float32)
+    self.max_z = np.full(count, np.nan, dtype=np.float32)
+    self.path_length = np.zeros(count, dtype=np.float32)
+    self.weld_length = np.zeros(count, dtype=np.float32)
+    self.centroid = np.full((count, 2), np.nan, dtype=np.float32)
+    if not has_moves.any():
+      return
+
+    self.z[has_moves] = table.abs_z[ends[has_moves] - 1]
+    self.min_z[has_moves] = np.fmin.reduceat(table.abs_z, index)
+    self.max_z[has_moves] = np.fmax.reduceat(table.abs_z, index)
+
+    # Each move counts towards the layer it ends in, including the travel from the previous layer
+    position = np.column_stack((table.abs_x, table.abs_y, table.abs_z)).astype(np.float64)
+    step = np.zeros(len(table), dtype=np.float64)
+    step[1:] = np.sqrt(np.sum(np.diff(position, axis=0) ** 2, axis=1))
+    step = np.nan_to_num(step)
+    self.path_length[has_moves] = np.add.reduceat(step, index)
+    self.weld_length[has_moves] = np.add.reduceat(np.where(table.welder, step, 0.0), index)
+
+    # Length weighted midpoints of the moves, layers that do not move fall back to the mean position
+    midpoint = np.empty((len(table), 2), dtype=np.float64)
+    midpoint[0] = position[0, :2]
+    midpoint[1:] = (position[1:, :2] + position[:-1, :2]) / 2
+    weighted = np.where(step[:, None] > 0, midpoint * step[:, None], 0.0)
+    weighted_sum = np.add.reduceat(weighted, index, axis=0)
+    known = ~np.isnan(position[:, :2])
+    position_sum = np.add.reduceat(np.where(known, position[:, :2], 0.0), index, axis=0)
+    position_count = np.add.reduceat(known, index, axis=0)
+    length = self.path_length[has_moves].astype(np.float64)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+      self.centroid[has_moves] = np.where(length > 0, weighted_sum / length, position_sum / position_count)
+
+  def __len__(self):
+    return self.layer_count
+
+  def bounds(self, layer: int) -> tuple:
+    """(min_x, max_x, min_y, max_y) of a layer"""
+    return (float(self.min_x[layer]), float(self.max_x[layer]), float(self.min_y[layer]), float(self.max_y[layer]))
+
+  def layer(self, layer: int) -> dict:
+    """All extents of one layer"""
+    return {
+      "bounds": self.bounds(layer),
+      "z": float(self.z[layer]),
+      "z_range": (float(self.min_z[layer]), float(self.max_z[layer])),
+      "path_length": float(self.path_length[layer]),
+      "weld_length": float(self.weld_length[layer]),
+      "centroid": (float(self.centroid[layer, 0]), float(self.centroid[layer, 1])),
+    }
@@ -0,0 +1,216 @@
+"""Memory mapped index of the sections and layers of a gcode file"""
+
+import mmap
+
+from .preprocessors.processor_interface import Sections
+from .gcode_parser import is_layer_marker
+from .compact_layer import LinePool, CompactLayer
+from .section_parser import SECTIONS, SECTION_END_MARKERS, FILE_END_MARKER
+
+_LAYER_MARKER = Sections.CURA_LAYER.encode()
+
+def decode_lines(data) -> list:
+  """Decodes a byte range of gcode into stripped lines (same as reading the file line by line)"""
+  return [line.strip() for line in bytes(data).decode("utf-8", errors="replace").splitlines()]
+
+class LayerIndex():
+  """Maps a gcode file and records the byte offsets of the section end markers and each ;LAYER: marker.
+  Nothing is decoded until a section or layer is requested, so opening a file costs one scan over the mapping
+  and the resident memory does not grow with the file size."""
+
+  def __init__(self, path: str, offsets: dict = None):
+    """
+    Args:
+      path (str): Path to the gcode file
+      offsets (dict, optional): Offsets from a previous offsets() call on the same file content (e.g. from
+                  the job cache), skips scanning the file
+    """
+    self.path = path
+    self._file = open(path, "rb")
+    try:
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      # Empty files can not be mapped
+      self._map = b""
+
+    self.section_offsets = {} # Section -> (start, end) byte offsets
+    self.layer_offsets = [] # Start byte offset of every layer, plus the end of the movements section
+    self._line_cache = {}
+
+    if offsets is not None:
+      self.section_offsets = dict(offsets["sections"])
+      self.layer_offsets = list(offsets["layers"])
+      self._line_cache = dict(offsets.get("lines", {}))
+    else:
+      self._index_sections()
+      self._index_layers()
+
+  def offsets(self) -> dict:
+    """Everything needed to rebuild this index without scanning the file"""
+    return {"sections": dict(self.section_offsets), "layers": list(self.layer_offsets), "lines": dict(self._line_cache)}
+
+  def _find_markers(self, marker: bytes):
+    """Yields the (line start, line end) offsets of every line that consists of marker only"""
+    position = self._map.find(marker)
+    while position != -1:
+      line_start = self._map.rfind(b"\n", 0, position) + 1
+      line_end = self._map.find(b"\n", position)
+      line_end = len(self._map) if line_end == -1 else line_end + 1
+      if bytes(self._map[line_start:line_end]).strip() == marker:
+        yield line_start, line_end
+      position = self._map.find(marker, position + len(marker))
+
+  def _index_sections(self):
+    # One memchr based find per marker is far faster than a multiline regex over the whole mapping
+    markers = []
+    for marker in SECTION_END_MARKERS + [FILE_END_MARKER]:
+      for line_start, line_end in self._find_markers(marker.encode()):
+        markers.append((line_start, line_end, marker))
+    markers.sort()
+
+    start = 0
+    section = 0
+    end = len(self._map)
+    for line_start, line_end, marker in markers:
+      # The end marker belongs to the section it closes
+      self.section_offsets[SECTIONS[section]] = (start, line_end)
+      start = line_end
+      if marker == FILE_END_MARKER or section == len(SECTIONS) - 1:
+        end = start
+        break
+      section += 1
+    if start < end:
+      self.section_offsets[SECTIONS[section]] = (start, end)
+
+  def _index_layers(self):
+    start, end = self.section_offsets.get(Sections.GCODE_MOVEMENTS_SECTION, (0, 0))
+    if start == end:
+      return
+
+    self.layer_offsets.append(start)
+    position = self._map.find(_LAYER_MARKER, start, end)
+    while position != -1:
+      line_start = self._map.rfind(b"\n", start, position) + 1 or start
+      line_end = self._map.find(b"\n", position, end)
+      line = bytes(self._map[line_start:end if line_end == -1 else line_end]).decode("utf-8", errors="replace")
+      # Only a marker that starts the comment of its line counts, the same rule as LayerParser and MoveTable
+      if is_layer_marker(line) and line_start > self.layer_offsets[-1]:
+        self.layer_offsets.append(line_start)
+      position = self._map.find(_LAYER_MARKER, position + len(_LAYER_MARKER), end)
+    self.layer_offsets.append(end)
+
+  def __len__(self):
+    """Number of layers"""
+    return max(len(self.layer_offsets) - 1, 0)
+
+  def section_view(self, section: str) -> memoryview:
+    """Zero copy view of a section's bytes"""
+    start, end = self.section_offsets.get(section, (0, 0))
+    return memoryview(self._map)[start:end]
+
+  def section(self, section: str) -> list:
+    """Decodes a section into a list of stripped lines"""
+    return decode_lines(self.section_view(section))
+
+  def iter_section(self, section: str):
+    """Yields the stripped lines of a section one at a time without materializing the section"""
+    start, end = self.section_offsets.get(section, (0, 0))
+    while start < end:
+      line_end = self._map.find(b"\n", start, end)
+      line_end = end if line_end == -1 else line_end + 1
+      yield bytes(self._map[start:line_end]).decode("utf-8", errors="replace").strip()
+      start = line_end
+
+  def layer_view(self, layer: int) -> memoryview:
+    """Zero copy view of a layer's bytes"""
+    return memoryview(self._map)[self.layer_offsets[layer]:self.layer_offsets[layer + 1]]
+
+  def layer(self, layer: int) -> list:
+    """Decodes a layer into a list of stripped lines"""
+    if layer < 0:
+      layer += len(self)
+    if not 0 <= layer < len(self):
+      raise IndexError("Layer index out of range")
+    return decode_lines(self.layer_view(layer))
+
+  def line_number(self, offset: int) -> int:
+    """Returns the 1 based line number of a byte offset, counted in chunks so memory stays flat"""
+    if offset in self._line_cache:
+      return self._line_cache[offset]
+    count = 0
+    chunk = 1 << 20
+    for position in range(0, offset, chunk):
+      count += self._map[position:min(position + chunk, offset)].count(b"\n")
+    self._line_cache[offset] = count + 1
+    return count + 1
+
+  def section_start_line(self, section: str) -> int:
+    return self.line_number(self.section_offsets.get(section, (0, 0))[0])
+
+  def close(self):
+    """Closes the mapping. Views handed out by section_view/layer_view must be released first"""
+    if isinstance(self._map, mmap.mmap):
+      self._map.close()
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+class LazySections():
+  """Read only mapping of section -> list of lines that decodes a section every time it is accessed"""
+
+  def __init__(self, index: LayerIndex):
+    self.index = index
+
+  def __getitem__(self, section):
+    return self.index.section(section)
+
+  def __contains__(self, section):
+    return section in self.index.section_offsets
+
+  def __iter__(self):
+    return iter(self.index.section_offsets)
+
+  def __len__(self):
+    return len(self.index.section_offsets)
+
+  def keys(self):
+    return self.index.section_offsets.keys()
+
+class LazyLayers():
+  """List like sequence of layers backed by a LayerIndex. Layers are decoded when asked for and never kept,
+  layers replaced through assignment (e.g. regenerated by the postprocessor) are stored as given, or as
+  CompactLayer when a LinePool is passed"""
+
+  def __init__(self, index: LayerIndex, pool: LinePool = None):
+    self.index = index
+    self.pool = pool
+    self.replaced = {}
+
+  def __len__(self):
+    return len(self.index)
+
+  def __getitem__(self, layer):
+    if isinstance(layer, slice):
+      return [self[i] for i in range(*layer.indices(len(self)))]
+    if layer < 0:
+      layer += len(self)
+    if layer in self.replaced:
+      return self.replaced[layer]
+    return self.index.layer(layer)
+
+  def __setitem__(self, layer, gcode):
+    if layer < 0:
+      layer += len(self)
+    if not 0 <= layer < len(self):
+      raise IndexError("Layer index out of range")
+    if self.pool is not None and not isinstance(gcode, (str, CompactLayer)):
+      gcode = CompactLayer(gcode, self.pool)
+    self.replaced[layer] = gcode
+
+  def __iter__(self):
+    for layer in range(len(self)):
+      yield self[layer]
@@ -0,0 +1,237 @@
+"""Kinematic duration estimate of a job: trapezoidal velocity profiles limited by M201/M203/M204 and jerk (M205/M566)"""
+
+import math
+
+import numpy as np
+
+from .gcode_parser import parse_line
+from .move_table import MoveTable
+
+DEFAULT_FEED = 3000.0 # mm/min until the first F word
+DEFAULT_ACCELERATION = 1000.0 # mm/s², M204 P/T
+DEFAULT_JERK = 15.0 # mm/s instantaneous speed change per axis (M566 X900 Y900 Z900 in mm/min)
+
+def _plan_junctions(junction: np.ndarray, reach: np.ndarray) -> np.ndarray:
+  """Lowers the junction speeds to what the moves between them can reach, like the firmware planner
+  A backward pass leaves every move room to decelerate into the next junction, a forward pass to accelerate
+  from the previous one. Limits travel across any number of moves within the two passes.
+  Args:
+    junction (np.ndarray): Speed limit at each junction, junction i sits between move i - 1 and move i
+    reach (np.ndarray): 2 * a * d of each move, the change in v² it allows
+  Returns:
+    np.ndarray: Reachable junction speeds
+  """
+  speeds = junction.tolist()
+  reach = reach.tolist()
+  for i in range(len(reach) - 1, -1, -1):
+    speeds[i] = min(speeds[i], math.sqrt(speeds[i + 1] ** 2 + reach[i]))
+  for i in range(1, len(speeds)):
+    speeds[i] = min(speeds[i], math.sqrt(speeds[i - 1] ** 2 + reach[i - 1]))
+  return np.array(speeds, dtype=np.float64)
+
+class MotionSettings():
+  """Machine limits that shape the velocity profiles, updated by the commands that set them
+  print_acceleration, travel_acceleration: mm/s² for moves with the welder on / off (M204 P / T, S sets both)
+  jerk: [x, y, z] mm/s allowed instantaneous speed change per axis (M205 X/Y/Z in mm/s, M566 X/Y/Z in mm/min)
+  axis_acceleration: [x, y, z] mm/s² (M201)
+  max_speed: [x, y, z] mm/s (M203, given in mm/min)"""
+
+  def __init__(self, acceleration: float = DEFAULT_ACCELERATION, jerk: float = DEFAULT_JERK):
+    self.print_acceleration = acceleration
+    self.travel_acceleration = acceleration
+    self.jerk = [jerk] * 3
+    self.axis_acceleration = [np.inf] * 3
+    self.max_speed = [np.inf] * 3
+
+  def copy(self):
+    settings = MotionSettings()
+    settings.print_acceleration = self.print_acceleration
+    settings.travel_acceleration = self.travel_acceleration
+    settings.jerk = list(self.jerk)
+    settings.axis_acceleration = list(self.axis_acceleration)
+    settings.max_speed = list(self.max_speed)
+    return settings
+
+  def apply(self, code) -> float:
+    """Updates the limits from a command (str or parsed line)
+    Returns:
+      float: Seconds the command dwells (G4), 0 for everything else
+    """
+    record = parse_line(code) if isinstance(code, str) else code
+    params = record.params
+    command = record.command
+    if command == "G4":
+      return float(params.get("S") or 0.0) + float(params.get("P") or 0.0) / 1000.0
+    if command == "M204":
+      if isinstance(params.get("S"), float):
+        self.print_acceleration = self.travel_acceleration = params["S"]
+      if isinstance(params.get("P"), float):
+        self.print_acceleration = params["P"]
+      if isinstance(params.get("T"), float):
+        self.travel_acceleration = params["T"]
+    elif command in ("M201", "M203", "M205", "M566"):
+      values = {"M201": self.axis_acceleration, "M203": self.max_speed, "M205": self.jerk, "M566": self.jerk}[command]
+      scale = 1.0 / 60.0 if command in ("M203", "M566") else 1.0
+      for axis, letter in enumerate("XYZ"):
+        if isinstance(params.get(letter), float) and params[letter] > 0:
+          values[axis] = params[letter] * scale
+    return 0.0
+
+  def as_array(self) -> np.ndarray:
+    """[print_acceleration, travel_acceleration, jerk x, y, z, axis_acceleration x, y, z, max_speed x, y, z]"""
+    return np.array([self.print_acceleration, self.travel_acceleration] + self.jerk + self.axis_acceleration + self.max_speed,
+                    dtype=np.float64)
+
+  @classmethod
+  def from_gcode(cls, gcode, settings=None):
+    """Limits in effect after running gcode (e.g. the startup script), starting from settings or the defaults"""
+    settings = settings.copy() if settings is not None else cls()
+    for line in gcode:
+      record = parse_line(line)
+      if record.command is not None:
+        settings.apply(record)
+    return settings
+
+class MotionEstimator():
+  """Predicted duration of every move, weld bead and layer of a MoveTable
+  Moves follow trapezoidal profiles: they accelerate from the junction speed with the previous move to the
+  feedrate (capped by M203) and decelerate into the next junction. Junction speeds are limited by jerk and by
+  what the neighbouring moves can reach, dwells (G4, e.g. the G4 P0 around the welder switches) and layer
+  boundaries (the sender waits for every layer) stop the machine.
+  move_time: float64: Seconds per move table row, without dwells
+  dwell_time: float64: Seconds dwelled right before each row
+  cumulative: float64: Seconds from the start of the table to the end of row i - 1 (len(table) + 1 entries)
+  layer_time: float64: Seconds per layer, including its dwells
+  end_position: (x, y, z) after the last move (start if there are no moves), to chain estimates of consecutive parts"""
+
+  def __init__(self, table: MoveTable, settings: MotionSettings = None, stop_at_layers: bool = True, start=None):
+    """
+    Args:
+      table (MoveTable): Moves of the job, its motion_events carry limit changes and dwells
+      settings (MotionSettings, optional): Limits before the first row (e.g. MotionSettings.from_gcode(startup_script))
+      stop_at_layers (bool, optional): The machine comes to a stop between layers
+      start (optional): (x, y, z) the first move starts from, unknown (the move takes no time) if None
+    """
+    self.layer_count = table.layer_count
+    self.layer_offsets = table.layer_offsets
+    count = len(table)
+    settings = settings.copy() if settings is not None else MotionSettings()
+
+    # Limits in effect for each row: one snapshot per limit change, rows map to the latest change before them
+    events = table.motion_events
+    snapshots = [settings.as_array()]
+    change_rows = []
+    self.dwell_time = np.zeros(count, dtype=np.float64)
+    layer_dwell = np.zeros(self.layer_count, dtype=np.float64)
+    stops = np.zeros(count + 1, dtype=bool)
+    for row, layer, code in zip(events["rows"].tolist(), events["layer"].tolist(), events["codes"]):
+      dwell = settings.apply(code)
+      if code.split(maxsplit=1)[0].upper() == "G4":
+        stops[row] = True
+        if row < count:
+          self.dwell_time[row] += dwell
+        if layer < self.layer_count:
+          layer_dwell[layer] += dwell
+      else:
+        snapshots.append(settings.as_array())
+        change_rows.append(row)
+    limits = np.array(snapshots)[np.searchsorted(np.array(change_rows, dtype=np.int64), np.arange(count), side="right")]
+
+    position = np.column_stack((table.abs_x, table.abs_y, table.abs_z)).astype(np.float64)
+    self.end_position = tuple(float(v) for v in position[-1]) if count else (tuple(start) if start is not None else None)
+    delta = np.zeros((count, 3), dtype=np.float64)
+    if count > 1:
+      delta[1:] = np.diff(position, axis=0)
+    if count and start is not None:
+      delta[0] = position[0] - np.asarray(start, dtype=np.float64)
+    delta = np.nan_to_num(delta) # Axes with unknown start positions do not count
+    distance = np.sqrt(np.sum(delta ** 2, axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+      unit = np.where(distance[:, None] > 0, delta / distance[:, None], 0.0)
+      component = np.abs(unit)
+
+      # Cruise speed and acceleration along the move, capped by the per axis limits
+      feed = table.feed.astype(np.float64)
+      speed = np.where(feed > 0, feed, DEFAULT_FEED) / 60.0
+      speed = np.fmin(speed, np.min(np.where(component > 0, limits[:, 8:11] / component, np.inf), axis=1))
+      acceleration = np.where(table.welder, limits[:, 0], limits[:, 1])
+      acceleration = np.fmin(acceleration, np.min(np.where(component > 0, limits[:, 5:8] / component, np.inf), axis=1))
+      acceleration = np.where(acceleration > 0, acceleration, DEFAULT_ACCELERATION)
+
+      # Junction i sits between row i - 1 and row i, the speed change per axis has to stay within jerk
+      junction = np.zeros(count + 1, dtype=np.float64)
+      if count > 1:
+        turn = np.abs(unit[1:] - unit[:-1])
+        jerk_limit = np.min(np.where(turn > 0, limits[1:, 2:5] / turn, np.inf), axis=1)
+        junction[1:count] = np.fmin(np.fmin(speed[:-1], speed[1:]), jerk_limit)
+    junction[~np.isfinite(junction)] = 0.0
+    stops[0] = stops[count] = True
+    if stop_at_layers:
+      stops[self.layer_offsets[1:-1]] = True
+    junction[stops] = 0.0
+
+    # Forward and backward reachability: a move can only change its speed by 2 * a * d in v²
+    reach = 2.0 * acceleration * distance
+    junction = _plan_junctions(junction, reach)
+
+    entry, leave = junction[:-1], junction[1:]
+    cruise = np.maximum(speed, np.maximum(entry, leave))
+    with np.errstate(divide="ignore", invalid="ignore"):
+      accelerate = (cruise ** 2 - entry ** 2) / (2.0 * acceleration)
+      decelerate = (cruise ** 2 - leave ** 2) / (2.0 * acceleration)
+      trapezoid = (cruise - entry) / acceleration + (cruise - leave) / acceleration + (distance - accelerate - decelerate) / cruise
+      # Too short to reach the cruise speed: accelerate to the peak speed and decelerate straight away
+      peak = np.sqrt(np.maximum((reach + entry ** 2 + leave ** 2) / 2.0, np.maximum(entry, leave) ** 2))
+      triangle = (peak - entry) / acceleration + (peak - leave) / acceleration
+      move_time = np.where(accelerate + decelerate <= distance, trapezoid, triangle)
+    self.move_time = np.where(distance > 0, np.nan_to_num(move_time), 0.0)
+
+    self.cumulative = np.concatenate(([0.0], np.cumsum(self.move_time + self.dwell_time)))
+    self.layer_time = layer_dwell
+    starts = self.layer_offsets[:-1]
+    has_moves = self.layer_offsets[1:] > starts
+    if has_moves.any():
+      self.layer_time[has_moves] += np.add.reduceat(self.move_time, starts[has_moves])
+
+  @classmethod
+  def from_gcode(cls, gcode, settings: MotionSettings = None, position=None, stop_at_layers: bool = True):
+    """Estimator for a list of gcode lines (e.g. a scan or a single layer)
+    Args:
+      position (optional): (x, y, z) of the machine before the first line, the first move starts from it
+    """
+    gcode = list(gcode)
+    if position is not None:
+      # Only the table sees this line, it resolves relative moves and axes the lines do not set
+      gcode = ["G92 " + " ".join(f"{letter}{float(value):.3f}" for letter, value in zip("XYZ", position))] + gcode
+    return cls(MoveTable.from_gcode(gcode, 0 if position is not None else 1), settings, stop_at_layers, position)
+
+  def __len__(self):
+    return len(self.move_time)
+
+  @property
+  def total_time(self) -> float:
+    return float(self.cumulative[-1])
+
+  def start_time(self, row: int) -> float:
+    """Seconds from the start of the table until row starts moving (after its dwells)"""
+    return float(self.cumulative[row] + self.dwell_time[row])
+
+  def end_time(self, row: int) -> float:
+    """Seconds from the start of the table until row has finished"""
+    return float(self.cumulative[row + 1])
+
+  def rows_time(self, start: int, end: int) -> float:
+    """Seconds to run rows start:end"""
+    return float(self.cumulative[end] - self.cumulative[start])
+
+  def segment_times(self, segments) -> np.ndarray:
+    """Seconds per weld bead (WeldSegments built from the same table)"""
+    return self.cumulative[segments.row_end] - self.cumulative[segments.row_start]
+
+  def etas(self, start_layer: int = 0) -> np.ndarray:
+    """Seconds from the start of start_layer until each following layer is done"""
+    return np.cumsum(self.layer_time[start_layer:])
+
+  def remaining(self, layer: int) -> float:
+    """Seconds left in the job before layer starts"""
+    return float(self.layer_time[layer:].sum())
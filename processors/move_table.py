@@ -0,0 +1,240 @@
+"""Columnar NumPy table of the moves in the gcode movements section"""
+
+from array import array
+
+import numpy as np
+
+from .gcode_parser import LAYER_MARKER, is_layer_marker, tokenize
+from .preprocessors.processor_interface import Sections
+
+WELDER_PIN = 1 # M42 P1 switches the welder
+WELD_EVENT_FIELDS = ("on_rows", "off_rows", "on_lines", "off_lines", "layer", "feature")
+TIMING_COMMANDS = ("G4", "M201", "M203", "M204", "M205", "M566") # Dwells and the limits that shape move durations
+
+class MoveTable():
+  """Struct of arrays with one row per move (G0/G1/G2/G3 carrying at least one axis)
+  x, y, z, f: float32: Values as written on the line, NaN where the line does not set them
+  abs_x, abs_y, abs_z: float32: Modal resolved absolute position after the move (G90/G91/G92 aware)
+  feed: float32: Modal feedrate in mm/min
+  line: int32: Line number in the original file
+  layer: int32: Layer index, matching the indices of PreProcessor.parse_layers()
+  feature: int16: Index into features (;TYPE: markers), -1 before the first marker
+  welder: bool: Welder state (M42 P1) while the move runs
+  weld_events: dict: Per M42 P1 S1 ... S0 span, arrays of the row count at the switch on ("on_rows") and switch off
+              ("off_rows"), their line numbers ("on_lines", "off_lines") and the layer/feature at switch on
+  motion_events: dict: Every TIMING_COMMANDS line in order, arrays of the row count before it ("rows"), its line
+              number ("lines") and layer ("layer"), plus the command text ("codes", list[str])"""
+
+  COLUMNS = ("x", "y", "z", "f", "abs_x", "abs_y", "abs_z", "feed", "line", "layer", "feature", "welder")
+
+  def __init__(self, columns: dict, features: list, layer_count: int, weld_events: dict = None, motion_events: dict = None):
+    for name in self.COLUMNS:
+      setattr(self, name, columns[name])
+    self.features = features
+    self.layer_count = layer_count
+    self.weld_events = weld_events or {name: np.empty(0, dtype=np.int64) for name in WELD_EVENT_FIELDS}
+    self.motion_events = motion_events or dict({name: np.empty(0, dtype=np.int64) for name in ("rows", "lines", "layer")}, codes=[])
+
+    # CSR style offsets so the rows of a layer are a slice: layer_offsets[i]:layer_offsets[i + 1]
+    self.layer_offsets = np.searchsorted(self.layer, np.arange(layer_count + 1)).astype(np.int64)
+
+  @classmethod
+  def from_gcode(cls, gcode, start: int = 1):
+    """Builds the table from gcode lines in a single pass
+    Args:
+      gcode: Iterable of gcode lines (usually the movements section)
+      start (int, optional): Line number of the first line
+    """
+
+    nan = float("nan")
+    cols = {name: array("f") for name in ("x", "y", "z", "f", "abs_x", "abs_y", "abs_z", "feed")}
+    line_col, layer_col, feature_col, welder_col = array("i"), array("i"), array("h"), array("b")
+
+    features = []
+    feature_ids = {}
+    feature = -1
+    layer = 0
+    lines_in_layer = 0
+    welder = 0
+    relative = False
+    position = [nan, nan, nan]
+    feed = nan
+    events = {name: array("q") for name in WELD_EVENT_FIELDS}
+    motion = {name: array("q") for name in ("rows", "lines", "layer")}
+    motion_codes = []
+
+    for record in tokenize(gcode, start):
+      comment = record.comment
+      command = record.command
+
+      if comment is not None and LAYER_MARKER in comment and is_layer_marker(record.raw):
+        # Same splitting rule as LayerParser, lines before the first marker form their own layer
+        if lines_in_layer > 0:
+          layer += 1
+        lines_in_layer = 0
+      elif comment is not None and command is None:
+        if comment.startswith(Sections.CURA_TYPE_LAYER + ":"):
+          name = comment[len(Sections.CURA_TYPE_LAYER) + 1:]
+          if name not in feature_ids:
+            feature_ids[name] = len(features)
+            features.append(name)
+          feature = feature_ids[name]
+      lines_in_layer += 1
+
+      if command is None:
+        continue
+
+      if command in ("G0", "G1", "G2", "G3"):
+        params = record.params
+        if "F" in params:
+          feed = params["F"]
+        values = (params.get("X"), params.get("Y"), params.get("Z"))
+        if values == (None, None, None):
+          continue
+        for axis, value in enumerate(values):
+          if value is not None:
+            position[axis] = position[axis] + value if relative else value
+
+        cols["x"].append(nan if values[0] is None else values[0])
+        cols["y"].append(nan if values[1] is None else values[1])
+        cols["z"].append(nan if values[2] is None else values[2])
+        cols["f"].append(params.get("F", nan))
+        cols["abs_x"].append(position[0])
+        cols["abs_y"].append(position[1])
+        cols["abs_z"].append(position[2])
+        cols["feed"].append(feed)
+        line_col.append(record.line_number)
+        layer_col.append(layer)
+        feature_col.append(feature)
+        welder_col.append(welder)
+      elif command == "G90":
+        relative = False
+      elif command == "G91":
+        relative = True
+      elif command == "G92":
+        params = record.params
+        for axis, letter in enumerate("XYZ"):
+          if params.get(letter) is not None:
+            position[axis] = params[letter]
+      elif command == "M42" and record.params.get("P") == WELDER_PIN:
+        s = record.params.get("S")
+        # A bare S word parses to None and counts as off
+        state = 1 if isinstance(s, float) and s > 0 else 0
+        if state and not welder:
+          events["on_rows"].append(len(line_col))
+          events["on_lines"].append(record.line_number)
+          events["layer"].append(layer)
+          events["feature"].append(feature)
+        elif welder and not state:
+          events["off_rows"].append(len(line_col))
+          events["off_lines"].append(record.line_number)
+        welder = state
+      elif command in TIMING_COMMANDS:
+        motion["rows"].append(len(line_col))
+        motion["lines"].append(record.line_number)
+        motion["layer"].append(layer)
+        motion_codes.append(record.raw.partition(";")[0].strip())
+
+    if welder:
+      # Welder left on at the end of the gcode, the span ends with the last move
+      events["off_rows"].append(len(line_col))
+      events["off_lines"].append(record.line_number)
+
+    columns = {name: np.frombuffer(col, dtype=np.float32).copy() for name, col in cols.items()}
+    columns["line"] = np.frombuffer(line_col, dtype=np.int32).copy()
+    columns["layer"] = np.frombuffer(layer_col, dtype=np.int32).copy()
+    columns["feature"] = np.frombuffer(feature_col, dtype=np.int16).copy()
+    columns["welder"] = np.frombuffer(welder_col, dtype=np.int8).astype(bool)
+
+    weld_events = {name: np.frombuffer(col, dtype=np.int64).copy() for name, col in events.items()}
+    motion_events = {name: np.frombuffer(col, dtype=np.int64).copy() for name, col in motion.items()}
+    motion_events["codes"] = motion_codes
+
+    return cls(columns, features, layer + 1 if lines_in_layer > 0 or layer > 0 else 0, weld_events, motion_events)
+
+  def __len__(self):
+    return len(self.line)
+
+  @property
+  def nbytes(self):
+    return sum(getattr(self, name).nbytes for name in self.COLUMNS)
+
+  def layer_slice(self, layer: int) -> slice:
+    """Returns the rows of a layer as a slice (O(1))"""
+    return slice(int(self.layer_offsets[layer]), int(self.layer_offsets[layer + 1]))
+
+  def layer_bounds(self):
+    """Bounding box of every layer in one vectorized pass
+    Returns:
+      np.ndarray: (layer_count, 4) float32 array of min_x, max_x, min_y, max_y. NaN for layers without moves
+    """
+    bounds = np.full((self.layer_count, 4), np.nan, dtype=np.float32)
+    starts = self.layer_offsets[:-1]
+    has_moves = self.layer_offsets[1:] > starts
+    if not has_moves.any():
+      return bounds
+
+    # reduceat needs in-range, non-empty segment starts, layers without moves are masked afterwards
+    index = starts[has_moves]
+    bounds[has_moves, 0] = np.fmin.reduceat(self.abs_x, index)
+    bounds[has_moves, 1] = np.fmax.reduceat(self.abs_x, index)
+    bounds[has_moves, 2] = np.fmin.reduceat(self.abs_y, index)
+    bounds[has_moves, 3] = np.fmax.reduceat(self.abs_y, index)
+    return bounds
+
+  def offset(self, dx: float = 0.0, dy: float = 0.0, dz: float = 0.0, layers=None):
+    """Shifts moves in place
+    Args:
+      layers (optional): Layer index, iterable of layer indices or None for the whole table
+    """
+    rows = self._rows(layers)
+    for delta, commanded, absolute in ((dx, self.x, self.abs_x), (dy, self.y, self.abs_y), (dz, self.z, self.abs_z)):
+      if delta:
+        commanded[rows] += delta # NaN (axis not on the line) stays NaN
+        absolute[rows] += delta
+
+  def set_z(self, z: float, layers=None):
+    """Rewrites the Z of every move that sets Z (and the resolved Z of all moves) in the given layers"""
+    rows = self._rows(layers)
+    commanded = self.z[rows]
+    commanded[~np.isnan(commanded)] = z
+    self.z[rows] = commanded
+    self.abs_z[rows] = z
+
+  def apply_to(self, gcode: list, start: int, layers=None) -> list:
+    """Writes the (possibly modified) commanded coordinates back into gcode lines
+    Args:
+      gcode (list[str]): Lines the table was built from, or a contiguous part of them
+      start (int): Line number of gcode[0]
+      layers (optional): Only rewrite these layers
+    Returns:
+      list[str]: Copy of gcode with the X/Y/Z words of the table rows replaced
+    """
+    rows = np.arange(len(self))[self._rows(layers)]
+    rows = rows[(self.line[rows] >= start) & (self.line[rows] < start + len(gcode))]
+    out = list(gcode)
+    for row in rows:
+      index = self.line[row] - start
+      out[index] = _rewrite_line(out[index], self.x[row], self.y[row], self.z[row])
+    return out
+
+  def _rows(self, layers):
+    if layers is None:
+      return slice(None)
+    if isinstance(layers, (int, np.integer)):
+      return self.layer_slice(layers)
+    return np.concatenate([np.arange(self.layer_offsets[l], self.layer_offsets[l + 1]) for l in layers] + [np.empty(0, dtype=np.int64)])
+
+def _format(value):
+  return f"{float(value):.3f}".rstrip("0").rstrip(".")
+
+def _rewrite_line(line, x, y, z):
+  code, separator, comment = line.partition(";")
+  words = []
+  for word in code.split():
+    letter = word[0].upper()
+    value = {"X": x, "Y": y, "Z": z}.get(letter)
+    if value is not None and not np.isnan(value) and len(word) > 1:
+      word = letter + _format(value)
+    words.append(word)
+  return " ".join(words) + (" " + separator + comment if separator else "")
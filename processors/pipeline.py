@@ -0,0 +1,62 @@
+"""Fused processor pipeline: chains line and window stages so a section is read, tokenized and written once"""
+
+from collections import deque
+
+from .gcode_parser import GcodeLine, parse_line, tokenize
+
+def is_stage(processor) -> bool:
+  """True if a processor can run inside the fused pipeline (implements process_line or process_window)"""
+  return hasattr(processor, "process_line") or hasattr(processor, "process_window")
+
+def _emit(result, record: GcodeLine):
+  # Stages return the record itself (unchanged), None (drop the line), a str or a list of str/records
+  if result is record:
+    yield record
+  elif result is None:
+    return
+  elif isinstance(result, str):
+    yield parse_line(result, record.line_number)
+  else:
+    for line in result:
+      yield line if isinstance(line, GcodeLine) else parse_line(line, record.line_number)
+
+def _line_stage(stage, records):
+  for record in records:
+    yield from _emit(stage.process_line(record), record)
+
+def _window_stage(stage, records):
+  # Holds at most stage.lookahead records, the stage sees them as the upcoming lines of the current one
+  window = deque()
+  for record in records:
+    window.append(record)
+    if len(window) > stage.lookahead:
+      current = window.popleft()
+      yield from _emit(stage.process_window(current, window), current)
+  while window:
+    current = window.popleft()
+    yield from _emit(stage.process_window(current, window), current)
+
+def fuse_records(processors, records):
+  """Chains the stages over an iterable of GcodeLine and yields the resulting GcodeLine objects lazily"""
+  for processor in processors:
+    if hasattr(processor, "reset"):
+      processor.reset()
+    if hasattr(processor, "process_window"):
+      records = _window_stage(processor, records)
+    else:
+      records = _line_stage(processor, records)
+  return records
+
+def fuse(processors, lines, start: int = 1):
+  """Runs a chain of stages in a single streaming pass
+  Every line is tokenized once and flows through all stages before the next line is read, lines only wait
+  in the windows of window stages. Memory is bounded by the sum of the lookaheads, not the section size.
+  Args:
+    processors (list): Line/window stages, run in order
+    lines: Iterable of gcode lines (list, open file, LayerIndex.iter_section(), ...)
+    start (int, optional): Line number of the first line
+  Returns:
+    generator: Processed lines
+  """
+  for record in fuse_records(processors, tokenize(lines, start)):
+    yield record.raw
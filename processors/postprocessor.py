@@ -1,21 +1,71 @@
-from PostProcessors import *
+import threading
+import time
+from .postprocessors import *
+from .preprocessors.z_offset import ZOffset
+from .pipeline import fuse
 from collections import defaultdict
 
+FALLBACK_LAST_OFFSET = "last_offset" # Shift a layer that missed its deadline by the last measured offset
+FALLBACK_UNCORRECTED = "uncorrected" # Send a layer that missed its deadline as planned
+
 class PostProcessor():
-  
-  def __init__(self):
+
+  def __init__(self, gcode=None, extents=None, measure=None):
     """Initializes the PostProcessors class
-    gcode: list[list[str]]: List of List of strings where each list is a layer of gcode"""
-    
+    Args:
+      gcode (list[list[str]], optional): Layers of the job as planned (PreProcessor.parse_layers()), regenerated
+                  layers are always built from these
+      extents (LayerExtents, optional): Planned Z of every layer, measured heights are compared against it
+      measure (callable, optional): measure(layer) -> measured top height in mm of a welded layer, None if there is
+                  no measurement. Called from the layer worker, it may block until the scan of the layer is complete.
+    """
+    self.gcode = gcode
+    self.extents = extents
+    self.measure = measure
     self.layer_index = 0 # Current layer index
-    
-  def collect_laser(self):
-    """Collects the laser path gcode for the next layer"""
-    current_layer = self.gcode[self.layer_index]
-    
-  def gen_next_layer():
-    """Generates the next layer of gcode"""
-    pass
-  
+    self.offset = 0.0 # Last known Z offset in mm, used whenever a layer has no fresh measurement
+    self.measured = {} # Layer -> time.time() its measurement returned
+    self.lock = threading.Lock()
+
+  def collect_laser(self, layer):
+    """Height error of a welded layer: measured top height minus planned Z, None without a measurement"""
+    if self.measure is None or self.extents is None:
+      return None
+    height = self.measure(layer)
+    with self.lock:
+      self.measured[layer] = time.time()
+    planned = float(self.extents.z[layer])
+    if height is None or planned != planned:
+      return None
+    return height - planned
+
+  def apply_offset(self, layer, offset):
+    """Planned lines of a layer with the Z of every absolute move shifted by offset (positive raises the torch)"""
+    if not offset:
+      return list(self.gcode[layer])
+    return list(fuse([ZOffset(offset)], self.gcode[layer]))
+
+  def gen_next_layer(self, layer):
+    """Generates a layer from the measurement of the layer before it
+    Returns:
+      list[str]: Lines of the layer shifted by the height error of the previous layer (the last known offset if it
+                  was not measured)
+    """
+    error = self.collect_laser(layer - 1) if layer > 0 else None
+    with self.lock:
+      if error is not None:
+        self.offset = error
+      offset = self.offset
+      self.layer_index = layer
+    return self.apply_offset(layer, offset)
 
-    
\ No newline at end of file
+  def fallback_layer(self, layer, fallback=FALLBACK_LAST_OFFSET):
+    """Layer to send when its regeneration misses the deadline
+    Args:
+      fallback (str, optional): FALLBACK_LAST_OFFSET or FALLBACK_UNCORRECTED
+    """
+    if fallback == FALLBACK_UNCORRECTED:
+      return list(self.gcode[layer])
+    with self.lock:
+      offset = self.offset
+    return self.apply_offset(layer, offset)
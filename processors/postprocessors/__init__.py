@@ -1,2 +1,2 @@
-from laser_path_gcode import *
-from postprocessor_interface import *
\ No newline at end of file
+from .laser_path_gcode import *
+from .postprocessor_interface import *
\ No newline at end of file
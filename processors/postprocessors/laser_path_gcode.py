@@ -1,4 +1,5 @@
 from .postprocessor_interface import Sections, PrintProcessorInterface
+from ..gcode_parser import tokenize
 
 class LaserPathGcode(PrintProcessorInterface):
   """This processor will generate the laser path gcode to scan over the print area for the next layer"""
@@ -13,36 +14,41 @@ class LaserPathGcode(PrintProcessorInterface):
     
     self.extract_coordinates()
     
+  @classmethod
+  def from_extents(cls, extents, layer: int):
+    """Builds the laser path from precomputed LayerExtents (PreProcessor.parse_extents()) without reading the layer
+    Args:
+      extents (LayerExtents): Extents of the job
+      layer (int): Layer index
+    """
+    laser_path = cls([])
+    values = (extents.min_x[layer], extents.max_x[layer], extents.min_y[layer], extents.max_y[layer], extents.z[layer])
+    laser_path.min_x, laser_path.max_x, laser_path.min_y, laser_path.max_y, laser_path.z = \
+      (None if value != value else float(value) for value in values)
+    return laser_path
+    
   def process(self):
     pass
   
   def extract_coordinates(self):
     """Gets borderline coordnates for next layer's print"""
     
-    for line in self.gcode:
-      if line.startswith('G1'):
-        x = float(line.split('X')[1].split(' ')[0])
-        y = float(line.split('Y')[1].split(' ')[0])
-        z = float(line.split('Z')[1].split(' ')[0])
+    for record in tokenize(self.gcode):
+      if record.command != 'G1':
+        continue
+      
+      # Axes are modal, a G1 only carries the axes that change (e.g. G1 F1000)
+      x = record.params.get('X')
+      y = record.params.get('Y')
+      z = record.params.get('Z')
+      
+      if x is not None:
+        self.min_x = x if self.min_x is None else min(self.min_x, x)
+        self.max_x = x if self.max_x is None else max(self.max_x, x)
+        
+      if y is not None:
+        self.min_y = y if self.min_y is None else min(self.min_y, y)
+        self.max_y = y if self.max_y is None else max(self.max_y, y)
         
-        if self.min_x == None:
-          self.min_x = x
-        elif x < self.min_x:
-          self.min_x = x
-          
-        if self.max_x == None:
-          self.max_x = x
-        elif x > self.max_x:
-          self.max_x = x
-          
-        if self.min_y == None:
-          self.min_y = y
-        elif y < self.min_y:
-          self.min_y = y
-          
-        if self.max_y == None:
-          self.max_y = y
-        elif y > self.max_y:
-          self.max_y = y
-          
-        self.z = z
\ No newline at end of file
+      if z is not None:
+        self.z = z
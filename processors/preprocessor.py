@@ -1,16 +1,45 @@
 from typing import List
 from collections import defaultdict
-from PreProcessors import *
+from .preprocessors import *
+from .move_table import MoveTable
+from .weld_segments import WeldSegments
+from .layer_extents import LayerExtents
+from .motion_estimator import MotionEstimator, MotionSettings
+from .compact_layer import LinePool, CompactLayer
+from .layer_index import LayerIndex, LazySections, LazyLayers
+from .section_parser import iter_sections
+from .pipeline import fuse, is_stage
+from .job_cache import JobCache, processor_fingerprint
 
 class PreProcessor():
   
-  def __init__(self, gcode):
+  def __init__(self, gcode, indexed: bool = False, cache: JobCache = None, processors: List[ProcessorInterface] = None):
+    """
+    Args:
+      gcode (str): Path to the gcode file
+      indexed (bool, optional): Memory maps the file and only records the offsets of sections and layers
+                  instead of reading every line. Sections and layers are decoded when they are accessed.
+      cache (JobCache, optional): Restores previously parsed data for the same file content and processors
+                  instead of parsing. Call prepare() to fill the cache on a miss.
+      processors (List[ProcessorInterface], optional): Default processors, see run_processors()
+    """
     
     self.gcode = []
+    self.path = gcode
+    self.index = None
+    self.cache = cache
+    self.cache_key = None
+    self.section_processors = list(processors or []) # Add default processors into this list
+    # section_processors (and their fingerprint when caching) that processed_gcode and cache_key belong to
+    self.processors_state = self._processors_state()
     
-    with open(gcode, 'r', encoding='utf-8', errors='replace') as f:
-      for line in f:
-        self.gcode.append(line.strip())
+    cached = None
+    if cache is not None:
+      self.cache_key = cache.key(gcode, self.section_processors)
+      cached = cache.load(self.cache_key)
+    self.cached = cached or {}
+    # Entries written by the other mode lack the sections/index of this one and get completed by prepare()
+    self.from_cache = "index" in self.cached if indexed else "sections" in self.cached
       
     self.sections = [Sections.TOP_COMMENT_SECTION,
                     Sections.STARTUP_SCRIPT_SECTION,
@@ -19,66 +48,228 @@ class PreProcessor():
                     Sections.BOTTOM_COMMENT]
     
     self.gcode_sections = defaultdict(list)
-    self.section_processors = [] # Add default processors into this list
+    self.section_start_lines = {} # Section -> line number (1 based) of its first line in the file
     self.gcode_layers = []
+    self.gcode_moves = None
+    self.weld_segments = None
+    self.layer_extents = None
+    self.processed_gcode = None # Output of run_processors() with the default processors
     
-    self.parse_sections()
+    if indexed:
+      self.index = LayerIndex(gcode, self.cached.get("index"))
+      self.gcode_sections = LazySections(self.index)
+    elif self.from_cache:
+      self.gcode_sections.update(self.cached["sections"])
+      self.section_start_lines = self.cached["section_start_lines"]
+    else:
+      with open(gcode, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+          self.gcode.append(line.strip())
+      self.parse_sections()
+      
+    self.gcode_moves = self.cached.get("moves")
+    self.weld_segments = self.cached.get("segments")
+    self.layer_extents = self.cached.get("extents")
+    self.motion_estimator = self.cached.get("motion")
+    if self.index is None:
+      self.processed_gcode = self.cached.get("processed")
     # print(self.parse_layers()[1])
     
+  def close(self):
+    """Closes the file mapping of indexed mode, lazy sections and layers can not be read afterwards"""
+    if self.index is not None:
+      self.index.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def _processors_state(self):
+    fingerprint = processor_fingerprint(self.section_processors) if self.cache is not None else None
+    return tuple(self.section_processors), fingerprint
+    
+  def _check_processors(self):
+    """Drops the processed gcode (and moves to a new cache key) if section_processors changed since it was made"""
+    state = self._processors_state()
+    if state == self.processors_state:
+      return
+    self.processors_state = state
+    self.processed_gcode = None
+    if self.cache is not None:
+      self.cache_key = self.cache.key(self.path, self.section_processors)
+      self.cached.pop("processed", None)
+      # The entry of the new key gets written by the next prepare()
+      self.from_cache = False
+    
   def parse_sections(self):
     """Parses the gcode into the different sections"""
     
-    current_index = 0
-    current_section_index = 0
+    for line_number, (section, line) in enumerate(iter_sections(self.gcode), 1):
+      self.section_start_lines.setdefault(section, line_number)
+      self.gcode_sections[section].append(line)
     
-    while current_index < len(self.gcode):
-      line = self.gcode[current_index]
-      self.gcode_sections[self.sections[current_section_index]].append(line)
-      
-      if line.strip() in [";top metadata end", 
-                          ";startup script end", 
-                          ";gcode movements end", 
-                          ";end script end"] :
-        current_section_index += 1
-        current_index += 1
-        continue
-      elif line.strip() == ";bottom comment end": 
-        break
-  
-      current_index += 1
-    
-  def run_processors(self, processors: List[ProcessorInterface] = None):
+  def run_processors(self, processors: List[ProcessorInterface] = None, fused: bool = False):
     """Runs the processors (Startup - End script only) excluding layer parser
     Args:
       processors (List[ProcessorInterface], optional): _description_. If specified, will run only those processors.
                   Otherwise, will run all processors defeind in section_processors
+      fused (bool, optional): Runs consecutive line/window stages (see pipeline.fuse) in a single streaming pass
+                  per section instead of one full pass and one copy of the section per processor.
+                  Other processors still get the whole section.
     """
     
     # Run processors in order
     # Order: STARTUP_SCRIPT, GCODE_MOVEMENTS, END_SCRIPT
     
     if processors == None:
+      self._check_processors()
+      if self.processed_gcode is not None:
+        return self.processed_gcode
       processors = self.section_processors
       
     processed_gcode = []
     
     # Iterates through the thre sections 
     for section in self.sections[1:-1]:
-      section_gcode = self.gcode_sections[section]
+      section_processors = [processor for processor in processors if processor.type == section]
       
-      # Processes the section using the processors 
-      for processor in processors:
-        if processor.type == section:
+      if fused:
+        section_gcode = self._run_fused(section, section_processors)
+      else:
+        section_gcode = self.gcode_sections[section]
+        
+        # Processes the section using the processors 
+        for processor in section_processors:
           section_gcode = processor.process(section_gcode)
         
       processed_gcode.append(section_gcode)
       
+    if processors is self.section_processors:
+      self.processed_gcode = processed_gcode
     return processed_gcode
   
-  def parse_layers(self):
+  def _run_fused(self, section, processors):
+    """Streams a section through runs of consecutive stages, materializing it only at processors that are not stages"""
+    if self.index is not None:
+      section_gcode = self.index.iter_section(section)
+    else:
+      section_gcode = self.gcode_sections[section]
+    
+    stages = []
+    for processor in processors:
+      if is_stage(processor):
+        stages.append(processor)
+        continue
+      if stages:
+        section_gcode = list(fuse(stages, section_gcode))
+        stages = []
+      section_gcode = processor.process(list(section_gcode))
+      
+    if stages or not isinstance(section_gcode, list):
+      section_gcode = list(fuse(stages, section_gcode))
+    return section_gcode
+  
+  def section_start_line(self, section):
+    """Returns the line number (1 based) of the first line of a section in the file"""
+    if self.index is not None:
+      return self.index.section_start_line(section)
+    return self.section_start_lines.get(section, 1)
+  
+  def parse_layers(self, compact: bool = False):
+    """Splits the movements section into layers
+    Args:
+      compact (bool, optional): Stores layers as CompactLayer (interned templates and array backed numbers,
+                  decodes to the same lines) sharing one LinePool. In indexed mode only layers assigned
+                  later (e.g. regenerated ones) are compacted, the others are read from the file anyway.
+    Returns:
+      list[list[str]]: Layers (LazyLayers in indexed mode, list[CompactLayer] when compact)
+    """
+    if self.index is not None:
+      return LazyLayers(self.index, LinePool() if compact else None)
+    
     parser = LayerParser()
     layers = parser.process(self.gcode_sections[Sections.GCODE_MOVEMENTS_SECTION])
+    if compact:
+      pool = LinePool()
+      layers = [CompactLayer(layer, pool) for layer in layers]
     return layers
+  
+  def parse_moves(self):
+    """Parses the movements section into a columnar MoveTable (cached after the first call)
+    Returns:
+      MoveTable: One row per move, layer indices match parse_layers()
+    """
+    if self.gcode_moves is None:
+      section = Sections.GCODE_MOVEMENTS_SECTION
+      if self.index is not None:
+        gcode = self.index.iter_section(section)
+      else:
+        gcode = self.gcode_sections[section]
+      self.gcode_moves = MoveTable.from_gcode(gcode, self.section_start_line(section))
+    return self.gcode_moves
+  
+  def parse_weld_segments(self):
+    """Builds the weld bead index from the move table (cached after the first call)
+    Returns:
+      WeldSegments: One entry per M42 P1 S1 ... S0 span, per layer lookup via layer_slice()
+    """
+    if self.weld_segments is None:
+      self.weld_segments = WeldSegments(self.parse_moves())
+    return self.weld_segments
+  
+  def parse_extents(self):
+    """Bounding box, Z level, path length and centroid of every layer (cached after the first call)
+    Returns:
+      LayerExtents: Indexed like parse_layers()
+    """
+    if self.layer_extents is None:
+      self.layer_extents = LayerExtents(self.parse_moves())
+    return self.layer_extents
+  
+  def parse_motion(self):
+    """Predicted duration of every move, weld bead and layer (cached after the first call), starting from the
+    acceleration and jerk limits the startup script sets
+    Returns:
+      MotionEstimator: Layers indexed like parse_layers(), ETAs through etas() / remaining()
+    """
+    if self.motion_estimator is None:
+      section = Sections.STARTUP_SCRIPT_SECTION
+      if self.index is not None:
+        startup = self.index.iter_section(section)
+      else:
+        startup = self.gcode_sections.get(section, [])
+      self.motion_estimator = MotionEstimator(self.parse_moves(), MotionSettings.from_gcode(startup))
+    return self.motion_estimator
+  
+  def prepare(self):
+    """Parses everything derived from the job up front and writes it to the cache on a miss"""
+    self._check_processors()
+    self.parse_moves()
+    self.parse_weld_segments()
+    self.parse_extents()
+    self.parse_motion()
+    if self.index is None:
+      # Indexed mode decodes sections on demand, materializing the processed sections would defeat it
+      self.run_processors()
+    
+    if self.cache is not None and not self.from_cache:
+      self.cached = dict(self.cached, **self.cache_payload())
+      self.cache.store(self.cache_key, self.cached)
+      self.from_cache = True
+  
+  def cache_payload(self):
+    """Data stored in the job cache"""
+    payload = {"moves": self.gcode_moves, "segments": self.weld_segments, "extents": self.layer_extents,
+               "motion": self.motion_estimator}
+    if self.index is not None:
+      payload["index"] = self.index.offsets()
+    else:
+      payload["sections"] = dict(self.gcode_sections)
+      payload["section_start_lines"] = self.section_start_lines
+      payload["processed"] = self.processed_gcode
+    return payload
 
 if __name__ == '__main__':
   PreProcessor("test.gcode")
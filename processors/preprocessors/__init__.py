@@ -1,2 +1,5 @@
-from layer_parser import *
-from processor_interface import *
\ No newline at end of file
+from .g0_to_g1 import *
+from .layer_parser import *
+from .processor_interface import *
+from .weld_control import *
+from .z_offset import *
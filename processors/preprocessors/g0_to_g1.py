@@ -0,0 +1,19 @@
+import re
+
+from .processor_interface import Sections, LineProcessorInterface
+
+_G0 = re.compile(r'^([ \t]*)[Gg]0*0(?![\d.])')
+
+class G0ToG1(LineProcessorInterface):
+  """Turns rapid moves (G0) into linear moves (G1) so the printer honours the feedrate of every move"""
+
+  def __init__(self, type: str = Sections.GCODE_MOVEMENTS_SECTION):
+    self.type = type
+    
+  def config(self) -> dict:
+    return {"type": self.type}
+    
+  def process_line(self, record):
+    if record.command != "G0":
+      return record
+    return _G0.sub(r'\1G1', record.raw, count=1)
@@ -1,4 +1,5 @@
 from .processor_interface import Sections, ProcessorInterface
+from ..gcode_parser import LAYER_MARKER, is_layer_marker
 
 class LayerParser(ProcessorInterface):
 
@@ -11,7 +12,8 @@ class LayerParser(ProcessorInterface):
     current_layer = []
     
     for line in gcode:
-      if Sections.CURA_LAYER in line:
+      # Substring test first, only lines holding the marker text are checked further
+      if LAYER_MARKER in line and is_layer_marker(line):
         if len(current_layer) > 0:
           self.layers.append(current_layer)
           current_layer = []
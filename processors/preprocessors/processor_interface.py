@@ -1,4 +1,6 @@
 from abc import abstractmethod
+from ..pipeline import fuse
+from ..gcode_parser import LAYER_MARKER
 
 """Copied from cura.py and sections.py, gcode-parser"""
 class Sections:
@@ -9,7 +11,7 @@ class Sections:
   END_SCRIPT_SECTION = "END_SCRIPT"
   BOTTOM_COMMENT = "BOTTOM_COMMENT"
   
-  CURA_LAYER = ";LAYER:"
+  CURA_LAYER = LAYER_MARKER
   CURA_MESH_LAYER = ";MESH"
   CURA_OUTER_WALL = ";TYPE:WALL-OUTER"
   CURA_TYPE_LAYER = ";TYPE"
@@ -32,4 +34,55 @@ class ProcessorInterface:
   @abstractmethod
   def process_type(self):
     """Return processor type"""
-    raise NotImplementedError
\ No newline at end of file
+    raise NotImplementedError
+  
+  def config(self) -> dict:
+    """Constructor arguments that decide the output (not the state of a run), part of the job cache key"""
+    raise NotImplementedError(f"{type(self).__name__} does not describe its config, it cannot be cached")
+
+class LineProcessorInterface(ProcessorInterface):
+  """Processor that handles every line on its own (a per line stage), so the fused pipeline can run it
+  together with the other stages in one pass
+  type: str: Section the processor runs on"""
+  
+  type = Sections.GCODE_MOVEMENTS_SECTION
+  
+  @abstractmethod
+  def process_line(self, record):
+    """Takes a GcodeLine and returns the record itself to keep it, None to drop it,
+    or the replacement line(s) as a str or list of str"""
+    raise NotImplementedError
+  
+  def reset(self):
+    """Clears the modal state before a new run"""
+    pass
+  
+  def process(self, gcode: list[str]) -> list[str]:
+    return list(fuse([self], gcode))
+    
+  def process_type(self):
+    return self.type
+
+class WindowProcessorInterface(ProcessorInterface):
+  """Processor that needs to see the next few lines to decide on the current one (a windowed stage)
+  type: str: Section the processor runs on
+  lookahead: int: Number of upcoming lines the processor gets to see"""
+  
+  type = Sections.GCODE_MOVEMENTS_SECTION
+  lookahead = 1
+  
+  @abstractmethod
+  def process_window(self, record, ahead):
+    """Takes a GcodeLine and the upcoming GcodeLines (at most lookahead, fewer at the end of the section),
+    returns the same as LineProcessorInterface.process_line"""
+    raise NotImplementedError
+  
+  def reset(self):
+    """Clears the modal state before a new run"""
+    pass
+  
+  def process(self, gcode: list[str]) -> list[str]:
+    return list(fuse([self], gcode))
+    
+  def process_type(self):
+    return self.type
@@ -0,0 +1,85 @@
+from .processor_interface import Sections, WindowProcessorInterface
+from ..gcode_parser import MOTION_COMMANDS, is_layer_marker, remove_word
+
+class WeldControl(WindowProcessorInterface):
+  """Replaces extrusion with welder control: the welder (M42) is switched on before the first extruding move
+  of a bead and off right after its last one, and the E words are removed. The lookahead decides whether
+  a bead continues, a bead without another extruding move within the window is switched off."""
+
+  def __init__(self, pin: int = 1, lookahead: int = 8, type: str = Sections.GCODE_MOVEMENTS_SECTION):
+    """
+    Args:
+      pin (int, optional): Output pin of the welder (M42 P<pin>)
+      lookahead (int, optional): Number of upcoming lines searched for the next move
+      type (str, optional): Section the processor runs on
+    """
+    self.pin = pin
+    self.lookahead = lookahead
+    self.type = type
+    self.reset()
+    
+  def reset(self):
+    self.welding = False
+    self.relative_e = False
+    self.last_e = 0.0
+    
+  def config(self) -> dict:
+    return {"pin": self.pin, "lookahead": self.lookahead, "type": self.type}
+    
+  def weld_on(self) -> list[str]:
+    # G4 P0 waits for the queued moves so the welder switches exactly at the start of the bead
+    return ["G4 P0", f"M42 P{self.pin} S1"]
+  
+  def weld_off(self) -> list[str]:
+    return [f"M42 P{self.pin} S0", "G4 P0"]
+    
+  def _extrudes(self, record, last_e: float) -> bool:
+    e = record.params.get("E")
+    if not isinstance(e, float):
+      return False
+    return e > 0 if self.relative_e else e > last_e
+  
+  def _bead_continues(self, ahead) -> bool:
+    """True if the next move within the window extrudes"""
+    for record in ahead:
+      if record.comment is not None and is_layer_marker(record.raw):
+        return False
+      if record.command in MOTION_COMMANDS:
+        params = record.params
+        if "X" in params or "Y" in params or "Z" in params or "E" in params:
+          return self._extrudes(record, self.last_e)
+    return False
+    
+  def process_window(self, record, ahead):
+    command = record.command
+    
+    if command == "M82":
+      self.relative_e = False
+    elif command == "M83":
+      self.relative_e = True
+    elif command == "G92" and isinstance(record.params.get("E"), float):
+      self.last_e = record.params["E"]
+    elif command in MOTION_COMMANDS and "E" in record.params:
+      extruding = self._extrudes(record, self.last_e)
+      if not self.relative_e and isinstance(record.params["E"], float):
+        self.last_e = record.params["E"]
+      
+      lines = []
+      if extruding and not self.welding:
+        lines += self.weld_on()
+        self.welding = True
+      elif not extruding and self.welding:
+        lines += self.weld_off()
+        self.welding = False
+      lines.append(remove_word(record.raw, "E"))
+      
+      if self.welding and not self._bead_continues(ahead):
+        lines += self.weld_off()
+        self.welding = False
+      return lines
+    elif self.welding and command in MOTION_COMMANDS and any(axis in record.params for axis in "XYZ"):
+      # Travel move while the welder is on
+      self.welding = False
+      return self.weld_off() + [record]
+    
+    return record
@@ -0,0 +1,33 @@
+from .processor_interface import Sections, LineProcessorInterface
+from ..gcode_parser import replace_word
+
+class ZOffset(LineProcessorInterface):
+  """Shifts the Z of every absolute move by a fixed offset, e.g. the height error measured by the laser"""
+
+  def __init__(self, offset: float, type: str = Sections.GCODE_MOVEMENTS_SECTION):
+    """
+    Args:
+      offset (float): Offset in mm, positive raises the torch
+      type (str, optional): Section the processor runs on
+    """
+    self.offset = offset
+    self.type = type
+    self.relative = False
+    
+  def reset(self):
+    self.relative = False
+    
+  def config(self) -> dict:
+    return {"offset": self.offset, "type": self.type}
+    
+  def process_line(self, record):
+    command = record.command
+    if command == "G90":
+      self.relative = False
+    elif command == "G91":
+      self.relative = True
+    elif command in ("G0", "G1") and not self.relative and self.offset:
+      z = record.params.get("Z")
+      if isinstance(z, float):
+        return replace_word(record.raw, "Z", z + self.offset)
+    return record
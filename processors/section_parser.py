@@ -0,0 +1,63 @@
+"""Streaming state machine that splits gcode into its sections"""
+
+from .preprocessors.processor_interface import Sections
+
+SECTIONS = [Sections.TOP_COMMENT_SECTION,
+            Sections.STARTUP_SCRIPT_SECTION,
+            Sections.GCODE_MOVEMENTS_SECTION,
+            Sections.END_SCRIPT_SECTION,
+            Sections.BOTTOM_COMMENT]
+
+SECTION_END_MARKERS = [";top metadata end",
+                       ";startup script end",
+                       ";gcode movements end",
+                       ";end script end"]
+FILE_END_MARKER = ";bottom comment end"
+
+_SECTION_END_MARKERS = frozenset(SECTION_END_MARKERS)
+
+def _readlines(stream):
+  # readline() returns each line as soon as it is available, iterating a pipe may buffer ahead
+  while True:
+    line = stream.readline()
+    if not line:
+      return
+    yield line
+
+def iter_lines(source):
+  """Yields stripped lines from a text or binary file-like object or from any iterable of str/bytes lines"""
+
+  if hasattr(source, "readline"):
+    source = _readlines(source)
+
+  for line in source:
+    if isinstance(line, (bytes, bytearray, memoryview)):
+      line = bytes(line).decode("utf-8", errors="replace")
+    yield line.strip()
+
+def iter_sections(source):
+  """Yields (section, line) events as soon as each line is read
+  The end marker of a section belongs to the section it closes. Reading stops at ;bottom comment end,
+  or at the end of the source if the marker is missing.
+  Args:
+    source: File-like object (text or binary, e.g. sys.stdin or a slicer pipe) or iterable of lines
+  """
+  section = 0
+  for line in iter_lines(source):
+    yield SECTIONS[section], line
+
+    if line in _SECTION_END_MARKERS:
+      section = min(section + 1, len(SECTIONS) - 1)
+    elif line == FILE_END_MARKER:
+      return
+
+def stream_section(source, section: str):
+  """Yields the lines of a single section and stops reading the source as soon as the section ends,
+  e.g. the movements section can be sent before the end script has been read"""
+  started = False
+  for name, line in iter_sections(source):
+    if name == section:
+      started = True
+      yield line
+    elif started:
+      return
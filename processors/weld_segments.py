@@ -0,0 +1,97 @@
+"""Per layer index of weld beads (M42 P1 S1 ... M42 P1 S0 spans)"""
+
+import numpy as np
+
+from .move_table import MoveTable
+
+class WeldSegments():
+  """Struct of arrays with one entry per weld bead, built from a MoveTable without rescanning the gcode
+  start, end: (n, 3) float32: Torch position (X, Y, Z) when the welder switches on / off
+  row_start, row_end: int64: Move table rows welded during the bead (row_start:row_end), the polyline of a bead is
+              start followed by the absolute positions of these rows
+  on_line, off_line: int64: Line numbers of the M42 P1 S1 / S0 commands
+  layer: int32: Layer index at switch on, matching PreProcessor.parse_layers()
+  feature: int16: ;TYPE: feature index at switch on (MoveTable.features)
+  length: float32: Arc length of the bead in mm
+  time: float32: Weld time in seconds at the programmed feedrates
+  feed: float32: Average feedrate over the bead in mm/min"""
+
+  def __init__(self, table: MoveTable):
+    self.features = table.features
+    self.layer_count = table.layer_count
+    events = table.weld_events
+
+    self.row_start = events["on_rows"].astype(np.int64)
+    self.row_end = events["off_rows"].astype(np.int64)
+    self.on_line = events["on_lines"].astype(np.int64)
+    self.off_line = events["off_lines"].astype(np.int64)
+    self.layer = events["layer"].astype(np.int32)
+    self.feature = events["feature"].astype(np.int16)
+
+    position = np.column_stack((table.abs_x, table.abs_y, table.abs_z)).astype(np.float32)
+    if len(position) == 0:
+      position = np.full((1, 3), np.nan, dtype=np.float32)
+
+    # The welder switches between moves, so the torch sits at the end of the previous move (NaN if there is none)
+    before = self.row_start - 1
+    self.start = np.where((before >= 0)[:, None], position[np.maximum(before, 0)], np.nan).astype(np.float32)
+    last = self.row_end - 1
+    self.end = np.where((last >= self.row_start)[:, None], position[np.maximum(last, 0)], self.start).astype(np.float32)
+
+    # Step length and duration of every move, summed per bead through cumulative sums
+    step = np.zeros(len(table), dtype=np.float64)
+    if len(table) > 1:
+      step[1:] = np.sqrt(np.sum(np.diff(position[:len(table)].astype(np.float64), axis=0) ** 2, axis=1))
+    step = np.nan_to_num(step)
+    feed = table.feed.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+      duration = np.where(feed > 0, step / (feed / 60.0), 0.0)
+    duration = np.nan_to_num(duration)
+
+    length_sum = np.concatenate(([0.0], np.cumsum(step)))
+    time_sum = np.concatenate(([0.0], np.cumsum(duration)))
+    self.length = (length_sum[self.row_end] - length_sum[self.row_start]).astype(np.float32)
+    self.time = (time_sum[self.row_end] - time_sum[self.row_start]).astype(np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+      self.feed = np.where(self.time > 0, self.length / self.time * 60.0, np.nan).astype(np.float32)
+
+    # CSR offsets by layer so the beads of a layer are a slice
+    self.layer_offsets = np.searchsorted(self.layer, np.arange(self.layer_count + 1)).astype(np.int64)
+    self._position = position
+
+  def __len__(self):
+    return len(self.row_start)
+
+  def layer_slice(self, layer: int) -> slice:
+    """Returns the beads of a layer as a slice into the arrays (O(1))"""
+    return slice(int(self.layer_offsets[layer]), int(self.layer_offsets[layer + 1]))
+
+  def vertices(self, segment: int) -> np.ndarray:
+    """Polyline of a bead: start point followed by the end point of every welded move"""
+    rows = self._position[self.row_start[segment]:self.row_end[segment]]
+    return np.vstack((self.start[segment][None, :], rows))
+
+  def segment(self, segment: int) -> dict:
+    """All fields of one bead"""
+    feature = self.feature[segment]
+    return {
+      "start": tuple(float(v) for v in self.start[segment]),
+      "end": tuple(float(v) for v in self.end[segment]),
+      "rows": (int(self.row_start[segment]), int(self.row_end[segment])),
+      "lines": (int(self.on_line[segment]), int(self.off_line[segment])),
+      "layer": int(self.layer[segment]),
+      "feature": self.features[feature] if feature >= 0 else None,
+      "length": float(self.length[segment]),
+      "time": float(self.time[segment]),
+      "feed": float(self.feed[segment]),
+    }
+
+  def layer_segments(self, layer: int) -> list:
+    """All beads of a layer as dicts"""
+    return [self.segment(i) for i in range(*self.layer_slice(layer).indices(len(self)))]
+
+  def feature_mask(self, feature: str) -> np.ndarray:
+    """Boolean mask of the beads that start in a ;TYPE: feature (e.g. "WALL-OUTER")"""
+    if feature not in self.features:
+      return np.zeros(len(self), dtype=bool)
+    return self.feature == self.features.index(feature)
@@ -1,51 +1,452 @@
-import requests
+import asyncio
+import sys
+import threading
 import time
-from duetwebapi import DuetWebAPI
+from collections import deque
+from command_queue import CommandQueue, wait_summary
+from duet_transport import (DEFAULT_BUFFER_SIZE, MAX_PACKET_BYTES, AsyncDuetTransport, clean_code, command_word,
+                            pack_commands, shared_transport)
+from model_poller import ModelPoller
 from processors import *
+
+# Commands after which the sender waits for the machine, e.g. the welder has to switch exactly between moves
+SYNC_COMMANDS = ("M42",)
+BUFFER_RESERVE = 32  # Bytes kept free in the firmware buffer for the sender's own M400 and a priority command
+# Commands that stop feeding motion (pause, feed hold, stops), the queue is held until resume()
+HOLD_COMMANDS = ("M0", "M1", "M25", "M226", "M112", "M410")
+# Commands allowed in the priority lane besides HOLD_COMMANDS and welder off: babystepping, resume
+PRIORITY_COMMANDS = HOLD_COMMANDS + ("M24", "M290")
+WELDER_PIN = 1  # M42 P1 switches the welder
+WELD_WINDOW = 2  # Commands in flight while the welder is on, bounds how late a welder off from send_priority() runs
+UPLOAD_DIRECTORY = "/macros"
+UPLOAD_MARKER = "arcmentLayer"  # Global variable the uploaded layers set when they are done
+ESTIMATE_TOLERANCE = 0.1  # Relative error allowed for predicted layer times
+ESTIMATE_POLL_INTERVAL = 0.02  # Seconds between polls around a predicted end of motion
+
+def layer_lines(layer):
+    """Returns the lines of a layer given as a string or an iterable of code lines"""
+    # Determine if the layer is a string or list of lines
+    if isinstance(layer, str):
+        # Split the string into non-empty lines
+        return [line.strip() for line in layer.splitlines() if line.strip()]
+    elif isinstance(layer, list):
+        return layer
+    elif hasattr(layer, "__iter__"):
+        # Generators (e.g. stream_section on a slicer pipe) are sent as their lines arrive
+        return layer
+    raise ValueError("Layer must be a string or an iterable of code lines.")
+
+def wire_code(code_line):
+    """Returns (record, code to send) or None for lines that only take up buffer space (comments, blank lines)"""
+    record = parse_line(code_line)
+    if record.command is None:
+        return None
+    # Quoted strings may contain ";", those lines are sent as they are
+    code = record.raw.partition(";")[0].strip() if '"' not in record.raw else record.raw
+    return record, code
+
+def is_priority(code):
+    """True for the commands send_priority() takes: pause / feed hold / stops, resume, Z babystep (M290) and welder off"""
+    command = command_word(code)
+    if command in PRIORITY_COMMANDS:
+        return True
+    if command == "M42":
+        params = parse_line(code).params
+        return params.get("P") == WELDER_PIN and params.get("S") == 0
+    return False
+
 class Sender:
-    def __init__(self):
-        self.duet_ip = "169.254.1.2"
-        self.printer = DuetWebAPI(self.duet_ip)
-        self.printer.connect(password='reprap')
+    def __init__(self, duet_ip="169.254.1.2", mode="line", window=8, password='reprap', poll_interval=0.1,
+                 max_queue=256, weld_window=WELD_WINDOW):
+        """
+        :param duet_ip: IP of the Duet
+        :param mode: "line" waits for idle after every line, "pipelined" keeps up to
+                     window commands queued in the firmware and only waits at sync points
+                     (SYNC_COMMANDS, layer ends and explicit sync() calls)
+        :param window: Maximum number of commands in flight in pipelined mode, consecutive
+                       commands are packed into one request of up to window commands
+        :param weld_window: Window while the welder is on (after M42 P1 S1 until M42 P1 S0), priority
+                            commands share the firmware's G-code channel with the stream and only run
+                            once the commands in flight have, see send_priority()
+        :param poll_interval: Seconds between object model polls while the sender waits for the machine
+                              (every ModelPoller.idle_interval otherwise), status and position come
+                              from one shared ModelPoller (subscribe through self.poller)
+        :param max_queue: Depth of the host side command queue in pipelined mode, enqueue() and
+                          send_layer() block while it is full (backpressure)
+        
+        In "upload" mode a layer is written to a macro file (rr_upload) and run with M98,
+        motion is then only limited by the firmware's planner and the sender waits for a
+        single completion event per layer.
+        """
+        if mode not in ("line", "pipelined", "upload"):
+            raise ValueError(f"Unknown send mode: {mode}")
+        self.duet_ip = duet_ip
+        self.mode = mode
+        self.window = window
+        self.weld_window = min(weld_window, window)
+        self.welding = False
+        # The board is connected once (shared_transport), the sender's own session is used by the caller
+        # and the streaming thread in turn (a sync waits for the queue before it sends)
+        self.transport = shared_transport(self.duet_ip, password=password).clone()
+        self.in_flight = deque()  # Byte lengths of the commands sent since the buffer was last seen empty
+        self.layers_uploaded = 0
+        
+        # Pipelined mode: producers fill the queue, a streaming thread packs and sends it
+        self.queue = CommandQueue(max_queue)
+        self.priority_latencies = deque(maxlen=self.queue.wait_times.maxlen)
+        self.stream_error = None
+        self._streamer = None
+        self._resumed = threading.Event()
+        self._resumed.set()
+        # The priority lane sends from the caller's thread next to the streaming thread, on its own session
+        # and buffer tracking, one command at a time
+        self.priority_transport = self.transport.clone()
+        self._priority_lock = threading.Lock()
+        
+        # The poller thread gets its own session and buffer tracking, so it runs next to the sending thread
+        self.poller = ModelPoller(self.transport.clone(), interval=poll_interval)
+        self.poller.subscribe(self._log_position, ["move.axes[].machinePosition"])
+        self.poller.start()
+        if self.mode == "upload":
+            self.reset_upload_marker()
+    
+    def _log_position(self, key, value, previous, timestamp):
+        print(f"Current coordinates: {value}")
     
     def send_code_line(self, code_line):
         """Send a single line of gcode to the printer and wait until idle."""
-        self.printer.send_code(code_line)
-        print(f"Sent code: {code_line}")
+        sent = time.time()
+        for result in self.transport.send_many([code_line]):
+            print(f"Sent code: {result.code}")
+            if result.error:
+                print(f"Error: {result.reply}")
         
-        # Wait till idle before sending the next line
+        # Wait till idle before sending the next line, judged on a poll taken after the send
+        self.poller.wait_idle(after=sent)
+    
+    def send_code_pipelined(self, code_line):
+        """Queue a line without waiting for it to run, blocks only while the window or the firmware buffer is full."""
+        self.send_codes_pipelined([code_line])
+    
+    def current_window(self):
+        """Commands allowed in flight: window, weld_window while the welder is on"""
+        return self.weld_window if self.welding else self.window
+    
+    def send_codes_pipelined(self, lines):
+        """Queue lines in order, consecutive commands go out packed into one request (at most window
+        commands, see pack_commands). Waits for the machine after each of the SYNC_COMMANDS."""
+        pending = []
+        size = 0
+        for line in lines:
+            wire = wire_code(line)
+            if wire is None:
+                continue
+            
+            record, code = wire
+            pending.append(code)
+            size += len(code) + 1
+            if record.command in SYNC_COMMANDS:
+                self._send_packets(pending)
+                pending, size = [], 0
+                self.sync()
+                if record.command == "M42" and record.params.get("P") == WELDER_PIN:
+                    # Everything up to the switch has run, the moves after it go out with the matching window
+                    self.welding = bool(record.params.get("S"))
+            elif len(pending) >= self.current_window() or size >= MAX_PACKET_BYTES:
+                # Streamed layers are sent as they arrive instead of being collected up to the next sync point
+                self._send_packets(pending)
+                pending, size = [], 0
+        self._send_packets(pending)
+    
+    def _send_packets(self, codes):
+        limit = min(MAX_PACKET_BYTES, (self.transport.buffer_size or DEFAULT_BUFFER_SIZE) - BUFFER_RESERVE)
+        for packet in pack_commands(codes, limit, self.current_window()):
+            self.send_packet(packet)
+    
+    def send_packet(self, packet):
+        """Sends a list of commands as one request once the window and the firmware buffer have room for all of them"""
+        sizes = [len(code) + 1 for code in packet]
+        window = max(self.current_window(), len(packet))
         while True:
-            coords = self.get_current_position()
-            status = self.get_status()
-            print(f"Current coordinates: {coords}")
-            if status.lower() == "idle":
+            self._resumed.wait()
+            while len(self.in_flight) + len(packet) > window or self.transport.buffer_free < sum(sizes) + BUFFER_RESERVE:
+                self._drain(self.transport.poll_buffer())
+                if len(self.in_flight) + len(packet) > window or self.transport.buffer_free < sum(sizes) + BUFFER_RESERVE:
+                    time.sleep(0.01)
+            # A pause may have been sent while this waited for room, nothing may follow it
+            if self._resumed.is_set():
                 break
-            time.sleep(0.25)
-    
-    def send_layer(self, layer):
-        """Send each line in a layer individually."""
-        # Determine if the layer is a string or list of lines
-        if isinstance(layer, str):
-            # Split the string into non-empty lines
-            lines = [line.strip() for line in layer.splitlines() if line.strip()]
-        elif isinstance(layer, list):
-            lines = layer
-        else:
-            raise ValueError("Layer must be a string or a list of code lines.")
         
+        self._drain(self.transport.send("\n".join(packet)))
+        self.in_flight.extend(sizes)
+    
+    def _drain(self, buffer_free):
+        """Drops the oldest in flight commands that the firmware buffer no longer holds"""
+        used = self.transport.buffer_size - buffer_free
+        while self.in_flight and sum(self.in_flight) > used:
+            self.in_flight.popleft()
+    
+    def enqueue(self, code_line, timeout=None):
+        """Queues a line for the streaming thread (pipelined mode). Blocks while the queue is full,
+        returns False if timeout (seconds) ran out first."""
+        if self.stream_error is not None:
+            raise self.stream_error
+        if self._streamer is None:
+            self._streamer = threading.Thread(target=self._stream, name="sender-stream", daemon=True)
+            self._streamer.start()
+        return self.queue.put(code_line, timeout)
+    
+    def wait_queue(self, timeout=None):
+        """Blocks until the streaming thread has sent everything queued so far"""
+        done = self.queue.join(timeout)
+        if self.stream_error is not None:
+            raise self.stream_error
+        return done
+    
+    def _stream(self):
+        while True:
+            codes = self.queue.take(self.window)
+            if not codes:
+                return
+            try:
+                if self.stream_error is None:
+                    self.send_codes_pipelined(codes)
+            except Exception as e:
+                # Nothing after a failed command may run, the producers see the error on their next call
+                self.stream_error = e
+                self.queue.clear()
+            finally:
+                self.queue.task_done(len(codes))
+    
+    def send_priority(self, code):
+        """Sends a safety-critical or correction command (see is_priority) ahead of everything in the queue,
+        pause and stop commands hold the queue until resume(). Returns the round trip in seconds.
+        
+        It goes out right away on the sender's priority transport, a connection of its own, and nothing
+        queued after it is sent. The firmware still feeds it through the same HTTP G-code channel as the
+        stream though (BUFFER_RESERVE keeps room for it there), so it only runs after the commands
+        already in flight: at most weld_window commands while the welder is on (window otherwise), plus
+        the moves those put in the planner's queue. M112 is the exception, RepRapFirmware acts on it as
+        soon as it arrives."""
+        if not is_priority(code):
+            raise ValueError(f"Not a priority command: {code}")
+        if command_word(code) in HOLD_COMMANDS:
+            self._resumed.clear()
+        started = time.perf_counter()
+        with self._priority_lock:
+            self.priority_transport.send(clean_code(code))
+        latency = time.perf_counter() - started
+        self.priority_latencies.append(latency)
+        return latency
+    
+    def resume(self, code="M24"):
+        """Sends code (M24 resumes a paused print, None sends nothing) and lets the queue stream again"""
+        if code is not None:
+            self.send_priority(code)
+        self._resumed.set()
+    
+    def metrics(self):
+        """Queue depth and wait times, round trips of priority commands"""
+        metrics = self.queue.metrics()
+        metrics["held"] = not self._resumed.is_set()
+        metrics["in_flight"] = len(self.in_flight)
+        metrics["priority"] = wait_summary(list(self.priority_latencies))
+        return metrics
+    
+    def reset_upload_marker(self, timeout=None):
+        """Sets the global the uploaded layers report to back to -1 (declares it on a fresh board). It stays
+        on the board between runs, and a value left by an earlier run would pass for a layer of this one."""
+        key = f"global.{UPLOAD_MARKER}"
+        path = f"{UPLOAD_DIRECTORY}/arcment_reset.g"
+        macro = [f"if !exists(global.{UPLOAD_MARKER})",
+                 f"  global {UPLOAD_MARKER} = -1",
+                 f"set global.{UPLOAD_MARKER} = -1"]
+        self.poller.watch(key)
+        self.transport.upload(path, "\n".join(macro) + "\n")
+        sent = time.time()
+        self.transport.send(f'M98 P"{path}"')
+        return self.poller.wait_for(lambda snapshot: snapshot.get(key) == -1, after=sent, timeout=timeout)
+    
+    def upload_layer(self, lines):
+        """Uploads a layer as a macro and starts it. Returns the sequence number the macro reports when done.
+        Two files are used in turn so the next layer can be uploaded while the current one runs, a file
+        is only overwritten once the layer that ran from it has reported."""
+        sequence = self.layers_uploaded
+        if sequence >= 2:
+            self.wait_layer(sequence - 2)
+        self.layers_uploaded += 1
+        path = f"{UPLOAD_DIRECTORY}/arcment_layer_{sequence % 2}.g"
+        
+        macro = []
         for line in lines:
-            self.send_code_line(line)
+            wire = wire_code(line)
+            if wire is not None:
+                macro.append(wire[1])
+        # Only runs once every move of the layer has finished
+        macro += ["M400", f"set global.{UPLOAD_MARKER} = {sequence}"]
+        
+        self.transport.upload(path, "\n".join(macro) + "\n")
+        self.transport.send(f'M98 P"{path}"')
+        return sequence
+    
+    def wait_estimate(self, until, margin=0.0):
+        """Sleeps through the predicted motion (until is a time.time() value, e.g. from MotionEstimator) and
+        polls fast within margin seconds around its predicted end, instead of polling throughout"""
+        if until is None:
+            return
+        delay = until - margin - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self.poller.burst(until + margin, ESTIMATE_POLL_INTERVAL)
+    
+    def wait_layer(self, sequence, timeout=None, until=None, margin=0.0):
+        """Blocks until the uploaded layer with this sequence number has finished (predicted to end at until)"""
+        key = f"global.{UPLOAD_MARKER}"
+        self.poller.watch(key)
+        self.wait_estimate(until, margin)
+        # Layers report in order, a later layer having reported means this one is done too
+        return self.poller.wait_for(lambda snapshot: isinstance(snapshot.get(key), (int, float)) and
+                                    snapshot.get(key) >= sequence, timeout=timeout)
+    
+    def sync(self, until=None, margin=0.0):
+        """Wait until everything sent so far has been executed (M400 + wait for idle).
+        :param until: Predicted time.time() the motion ends, see wait_estimate()"""
+        sent = time.time()
+        if self.mode == "upload":
+            if self.layers_uploaded:
+                self.wait_layer(self.layers_uploaded - 1, until=until, margin=margin)
+            self.poller.wait_idle(after=sent)
+        elif self.mode == "pipelined":
+            if threading.current_thread() is not self._streamer:
+                # Sync points inside the queue (SYNC_COMMANDS) are handled by the streaming thread itself
+                self.wait_queue()
+            self.transport.send("M400")
+            self.wait_estimate(until, margin)
+            self.poller.wait_idle(after=sent)
+            self.in_flight.clear()
+            self.transport.poll_buffer()
+        else:
+            self.poller.wait_idle(after=sent)
+    
+    def send_layer(self, layer, sync=True, duration=None):
+        """Send the lines of a layer (one per request in line mode, queued for the streaming thread in pipelined mode), or the whole layer as one macro in upload mode.
+        The end of the layer is a sync point unless sync is False, pipelined layers then return once they are queued.
+        :param duration: Predicted run time of the layer in seconds (MotionEstimator.layer_time), the sync
+                         then sleeps through the motion and checks the machine right when it should be done"""
+        lines = layer_lines(layer)
+        until = time.time() + duration if duration else None
+        margin = max(duration * ESTIMATE_TOLERANCE, self.poller.interval) if duration else 0.0
+        
+        if self.mode == "upload":
+            sequence = self.upload_layer(lines)
+            if sync:
+                self.wait_layer(sequence, until=until, margin=margin)
+        elif self.mode == "pipelined":
+            for line in lines:
+                self.enqueue(line)
+            if sync:
+                self.sync(until, margin)
+        else:
+            for line in lines:
+                self.send_code_line(line)
         
         print("Layer done.")
     
     def get_status(self):
-        return self.printer.get_model(key="state")["status"]
+        """Status from the latest poll"""
+        return self.poller.get("state.status")
     
     def get_current_position(self):
-        return self.printer.get_model(key="move.axes[].machinePosition")
+        """Machine position from the latest poll"""
+        return self.poller.get("move.axes[].machinePosition")
+    
+    def close(self):
+        self.queue.close()
+        if self._streamer is not None:
+            self._streamer.join()
+        self.poller.stop()
+        self.priority_transport.close()
+
+
+class AsyncSender:
+    """Pipelined sender for an asyncio event loop.
+
+    Sending, status polling (monitor()) and sensor work can run as tasks of
+    the same loop, the transport keeps its connections open between commands.
+
+    Usage:
+        async with AsyncSender(duet_ip) as sender:
+            monitor = asyncio.create_task(sender.monitor())
+            await sender.send_layer(layer)
+    """
+
+    def __init__(self, duet_ip="169.254.1.2", window=8, password='reprap', timeout=5.0):
+        self.duet_ip = duet_ip
+        self.window = window
+        self.transport = AsyncDuetTransport(duet_ip, password=password, timeout=timeout)
+        self.in_flight = deque()
+        self.status = None  # Latest values seen by monitor()
+        self.position = None
+
+    async def __aenter__(self):
+        await self.transport.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.transport.__aexit__(*exc_info)
+
+    def _drain(self, buffer_free):
+        used = self.transport.buffer_size - buffer_free
+        while self.in_flight and sum(self.in_flight) > used:
+            self.in_flight.popleft()
+
+    async def send_code(self, code_line):
+        """Queue a line, waits only while the window or the firmware buffer is full."""
+        wire = wire_code(code_line)
+        if wire is None:
+            return
+
+        record, code = wire
+        size = len(code) + 1
+        while len(self.in_flight) >= self.window or self.transport.buffer_free < size + BUFFER_RESERVE:
+            self._drain(await self.transport.poll_buffer())
+            if len(self.in_flight) >= self.window or self.transport.buffer_free < size + BUFFER_RESERVE:
+                await asyncio.sleep(0.01)
+
+        self._drain(await self.transport.send(code))
+        self.in_flight.append(size)
+
+        if record.command in SYNC_COMMANDS:
+            await self.sync()
+
+    async def sync(self):
+        """Wait until everything sent so far has been executed (M400 + wait for idle)."""
+        await self.transport.sync()
+        self.in_flight.clear()
+        await self.transport.poll_buffer()
+
+    async def send_layer(self, layer, sync=True):
+        for line in layer_lines(layer):
+            await self.send_code(line)
+        if sync:
+            await self.sync()
+        print("Layer done.")
+
+    async def monitor(self, interval=0.25):
+        """Keeps status and position up to date until cancelled, both are read concurrently"""
+        while True:
+            self.status, self.position = await asyncio.gather(
+                self.transport.get_status(),
+                self.transport.get_model(key="move.axes[].machinePosition"))
+            await asyncio.sleep(interval)
     
 if __name__ == "__main__":
-    sender = Sender("test2.gcode")
+    # python sender.py job.gcode, or pipe the slicer output in: slicer ... | python sender.py -
+    if len(sys.argv) < 2 or sys.argv[1] == "-":
+        source = sys.stdin
+    else:
+        source = open(sys.argv[1], 'r', encoding='utf-8', errors='replace')
     
-    for layer in sender.layers:
-        sender.send_layer(layer)
+    sender = Sender(mode="pipelined")
+    # Starts sending the movements section while the rest of the file is still being read
+    sender.send_layer(stream_section(source, Sections.GCODE_MOVEMENTS_SECTION))
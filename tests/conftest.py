@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def job():
+    """Path of the sample job shipped with the repository"""
+    return os.path.join(ROOT, "test.gcode")
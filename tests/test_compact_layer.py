@@ -0,0 +1,37 @@
+import pytest
+
+from processors import CompactLayer, LinePool, PreProcessor
+
+
+@pytest.mark.parametrize("line", [
+    "G1 X180.683 Y-12.5 E0.0234",
+    "G1 X-0 Y1. Z007",
+    "M117 {braces} 1",
+    ";LAYER:12",
+    "",
+    "G1 X123456789012345 Y1",
+])
+def test_line_round_trip(line):
+    assert CompactLayer([line]).to_lines() == [line]
+
+
+def test_job_round_trip(job):
+    pool = LinePool()
+    layers = PreProcessor(job).parse_layers()
+    compact = [CompactLayer(layer, pool) for layer in layers]
+    assert [layer.to_lines() for layer in compact] == layers
+    assert compact[1][3] == layers[1][3]
+    assert compact[1][-1] == layers[1][-1]
+    assert compact[1][:4] == layers[1][:4]
+    # Layers share their templates through the pool
+    assert len(pool) < sum(len(layer) for layer in layers)
+
+
+def test_compact_layers(job):
+    preprocessor = PreProcessor(job)
+    assert preprocessor.parse_layers(compact=True) == preprocessor.parse_layers()
+
+
+def test_index_out_of_range():
+    with pytest.raises(IndexError):
+        CompactLayer(["G1 X1"])[1]
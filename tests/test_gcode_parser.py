@@ -0,0 +1,73 @@
+import pytest
+
+from processors.gcode_parser import is_layer_marker, parse_line, remove_word, replace_word, tokenize
+
+
+def test_words_and_comment():
+    record = parse_line("G1 X10 Y-2.5 F3000 ; move", 7)
+    assert record.command == "G1"
+    assert record.params == {"X": 10.0, "Y": -2.5, "F": 3000.0}
+    assert record.comment == "; move"
+    assert record.line_number == 7
+
+
+@pytest.mark.parametrize("line", ["; just a comment", ";LAYER:3", ""])
+def test_lines_without_a_command(line):
+    record = parse_line(line)
+    assert record.command is None
+    assert record.params == {}
+
+
+def test_lowercase_and_glued_words():
+    assert parse_line("g1 x1 y2").params == {"X": 1.0, "Y": 2.0}
+    record = parse_line("G1X174.122Y5")
+    assert record.command == "G1"
+    assert record.params == {"X": 174.122, "Y": 5.0}
+
+
+def test_line_number_and_checksum():
+    record = parse_line("N12 G1 X5 Y6*71")
+    assert record.command == "G1"
+    assert record.params == {"X": 5.0, "Y": 6.0}
+
+
+def test_bare_letter():
+    assert parse_line("M42 P1 S").params == {"P": 1.0, "S": None}
+
+
+def test_quoted_strings():
+    assert parse_line('M98 P"macro.g"').params == {"P": "macro.g"}
+    # A ";" inside quotes does not start a comment
+    record = parse_line('M291 P"Layer; 3" S1 ; note')
+    assert record.params == {"P": "Layer; 3", "S": 1.0}
+    assert record.comment == "; note"
+
+
+def test_free_text_commands():
+    record = parse_line("M117 Hello world")
+    assert record.command == "M117"
+    assert record.params == {}
+    assert record.text == "Hello world"
+    assert parse_line('M117 "Layer; 3"').text == "Layer; 3"
+
+
+def test_tokenize_numbers_lines():
+    records = list(tokenize(["G28", "", "G1 X1"], start=10))
+    assert [record.line_number for record in records] == [10, 11, 12]
+    assert [record.command for record in records] == ["G28", None, "G1"]
+
+
+@pytest.mark.parametrize("line, marker", [
+    (";LAYER:3", True),
+    ("G1 X1 ;LAYER:3", True),
+    ("G1 X1 ; note ;LAYER:3", False),
+    ('M118 S";LAYER:1"', False),
+    ("G1 X1", False),
+])
+def test_layer_marker(line, marker):
+    assert is_layer_marker(line) is marker
+
+
+def test_replace_and_remove_word():
+    assert replace_word("G1 X1 Z0.2 E5", "Z", 1.5) == "G1 X1 Z1.5 E5"
+    assert remove_word("G1 X1 E5 F300", "E") == "G1 X1 F300"
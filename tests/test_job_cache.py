@@ -0,0 +1,43 @@
+from processors import G0ToG1, JobCache, PreProcessor, ZOffset
+
+
+def test_hit_after_prepare(job, tmp_path):
+    cache = JobCache(str(tmp_path))
+    first = PreProcessor(job, cache=cache)
+    assert not first.from_cache
+    first.prepare()
+
+    second = PreProcessor(job, cache=cache)
+    assert second.from_cache
+    assert second.parse_moves().line.tolist() == first.parse_moves().line.tolist()
+    assert second.parse_layers() == first.parse_layers()
+
+
+def test_processors_change_the_key(job, tmp_path):
+    cache = JobCache(str(tmp_path))
+    PreProcessor(job, cache=cache, processors=[ZOffset(1.0)]).prepare()
+
+    assert PreProcessor(job, cache=cache, processors=[ZOffset(1.0)]).from_cache
+    assert not PreProcessor(job, cache=cache, processors=[ZOffset(2.0)]).from_cache
+    assert not PreProcessor(job, cache=cache, processors=[ZOffset(1.0), G0ToG1()]).from_cache
+    assert not PreProcessor(job, cache=cache).from_cache
+
+
+def test_changed_processors_rerun(job, tmp_path):
+    cache = JobCache(str(tmp_path))
+    preprocessor = PreProcessor(job, cache=cache, processors=[ZOffset(1.0)])
+    preprocessor.prepare()
+    offset = preprocessor.run_processors()
+
+    preprocessor.section_processors[0] = ZOffset(2.0)
+    assert preprocessor.run_processors() != offset
+    assert not preprocessor.from_cache
+
+
+def test_unreadable_entry_is_a_miss(job, tmp_path):
+    cache = JobCache(str(tmp_path))
+    key = cache.key(job)
+    with open(cache.path(key), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.load(key) is None
+    assert not PreProcessor(job, cache=cache).from_cache
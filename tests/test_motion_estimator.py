@@ -0,0 +1,36 @@
+import pytest
+
+from processors.motion_estimator import MotionEstimator, MotionSettings
+
+
+def line(feed, pieces, length=100.0):
+    step = length / pieces
+    return [f"G1 X0 Y0 F{feed}"] + [f"G1 X{step * i:.4f} Y0" for i in range(1, pieces + 1)]
+
+
+@pytest.mark.parametrize("feed, acceleration", [(3000, 1000.0), (6000, 1000.0), (3000, 100.0), (6000, 50.0)])
+def test_split_line_takes_as_long_as_one_move(feed, acceleration):
+    # At 100 mm/s² reaching 50 mm/s takes 12.5 mm, 125 of the 0.1 mm moves
+    settings = MotionSettings(acceleration=acceleration)
+    whole = MotionEstimator.from_gcode(line(feed, 1), settings).total_time
+    split = MotionEstimator.from_gcode(line(feed, 1000), settings).total_time
+    assert split == pytest.approx(whole, rel=1e-6)
+
+
+def test_trapezoid():
+    # 100 mm at 50 mm/s with 1000 mm/s²: 0.05 s accelerating, 1.95 s cruising at full speed, 0.05 s decelerating
+    estimate = MotionEstimator.from_gcode(line(3000, 1))
+    assert estimate.total_time == pytest.approx(2.05)
+
+
+def test_short_moves_never_reach_the_feedrate():
+    # 1 mm at 1000 mm/s² peaks at sqrt(1000) mm/s, far below the 100 mm/s feed
+    estimate = MotionEstimator.from_gcode(["G1 X0 Y0 F6000", "G1 X1 Y0"], MotionSettings(acceleration=1000.0))
+    assert estimate.total_time == pytest.approx(2 * 1000.0 ** 0.5 / 1000.0)
+
+
+def test_dwell_stops_the_machine():
+    plain = MotionEstimator.from_gcode(line(6000, 2))
+    dwelled = MotionEstimator.from_gcode(line(6000, 2)[:2] + ["G4 P500"] + line(6000, 2)[2:])
+    # The stop costs the dwell plus decelerating to zero and accelerating again around it
+    assert dwelled.total_time > plain.total_time + 0.5
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from processors import MoveTable, PreProcessor, parse_line
+from processors.gcode_parser import MOTION_COMMANDS
+
+
+def is_move(line):
+    record = parse_line(line)
+    return record.command in MOTION_COMMANDS and any(axis in record.params for axis in "XYZ")
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_layers_match_parse_layers(job, indexed):
+    with PreProcessor(job, indexed=indexed) as preprocessor:
+        layers = list(preprocessor.parse_layers())
+        table = preprocessor.parse_moves()
+        assert table.layer_count == len(layers)
+        counts = np.diff(table.layer_offsets)
+        assert counts.tolist() == [sum(1 for line in layer if is_move(line)) for layer in layers]
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_weld_events_match_parse_layers(job, indexed):
+    with PreProcessor(job, indexed=indexed) as preprocessor:
+        layers = list(preprocessor.parse_layers())
+        events = preprocessor.parse_moves().weld_events
+        assert len(events["on_rows"]) == len(events["off_rows"]) > 0
+        per_layer = np.bincount(events["layer"], minlength=len(layers))
+        assert per_layer.tolist() == [sum(1 for line in layer if line.startswith("M42 P1 S1")) for layer in layers]
+
+
+def test_marker_after_code_starts_a_layer():
+    gcode = ["G1 X0 Y0", "G1 X1 ;LAYER:1", "G1 X2", ";LAYER:2", "G1 X3"]
+    table = MoveTable.from_gcode(gcode)
+    assert table.layer_count == 3
+    assert table.layer.tolist() == [0, 1, 1, 2]
+
+
+def test_welder_state_and_events():
+    gcode = ["G1 X0 Y0", "M42 P1 S1", "G1 X1", "G1 X2", "M42 P1 S0", "G1 X3"]
+    table = MoveTable.from_gcode(gcode)
+    assert table.welder.tolist() == [False, True, True, False]
+    assert table.weld_events["on_rows"].tolist() == [1]
+    assert table.weld_events["off_rows"].tolist() == [3]
+    assert table.weld_events["on_lines"].tolist() == [2]
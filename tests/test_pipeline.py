@@ -0,0 +1,24 @@
+import pytest
+
+from processors import G0ToG1, PreProcessor, WeldControl, ZOffset, fuse
+
+
+def processors():
+    return [WeldControl(), G0ToG1(), ZOffset(0.5)]
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_fused_matches_sequential(job, indexed):
+    with PreProcessor(job, indexed=indexed) as preprocessor:
+        sequential = preprocessor.run_processors(processors())
+        fused = preprocessor.run_processors(processors(), fused=True)
+    assert [list(section) for section in fused] == [list(section) for section in sequential]
+
+
+def test_fuse_keeps_untouched_lines():
+    lines = ["; comment", "G28", "M117 Hello world"]
+    assert list(fuse([G0ToG1(), ZOffset(0.5)], lines)) == lines
+
+
+def test_fuse_runs_stages_in_order():
+    assert list(fuse([G0ToG1(), ZOffset(1.0)], ["G0 X1 Z1"])) == list(ZOffset(1.0).process(G0ToG1().process(["G0 X1 Z1"])))
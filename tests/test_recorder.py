@@ -0,0 +1,102 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from collection import ProfileBatch, RecordedSession, ReplayStream, SessionRecorder
+from collection.recorder import PROFILES, chunk_file
+
+WIDTH = 6
+
+
+def batch(start, count):
+    profiles = ProfileBatch(count, WIDTH)
+    profiles.count = count
+    profiles.block_id[:] = np.arange(start, start + count)
+    profiles.timestamp[:] = np.arange(start, start + count) * 100.0
+    profiles.length[:] = WIDTH - 1
+    profiles.x[:] = np.arange(start, start + count)[:, None]
+    profiles.z[:] = np.arange(WIDTH)
+    profiles.valid[:] = True
+    return profiles
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "session")
+    with SessionRecorder(path, WIDTH, chunk_size=4) as recorder:
+        recorder.set_layer(0)
+        recorder.write_profiles(batch(0, 6))
+        recorder.set_layer(1)
+        recorder.write_profiles(batch(6, 5))
+
+    session = RecordedSession(path)
+    assert session.count() == 11
+    assert session.layers() == [0, 1]
+    # Chunks never span layers: 4 + 2 rows of layer 0, 4 + 1 rows of layer 1
+    assert [entry["count"] for entry in session.index[PROFILES]] == [4, 2, 4, 1]
+    rows = session.select(layer=1)
+    assert rows["meta"]["block_id"].tolist() == [6, 7, 8, 9, 10]
+    assert rows["x"][:, 0].tolist() == [6, 7, 8, 9, 10]
+    assert session.select(start=300.0, end=500.0)["meta"]["block_id"].tolist() == [3, 4, 5]
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / "session")
+    with SessionRecorder(path, WIDTH, chunk_size=4) as recorder:
+        recorder.write_profiles(batch(0, 10))
+
+    stream = ReplayStream(path)
+    stream.Start()
+    assert stream.GetProfileCount() == 10
+    first = stream.ReadProfile()
+    assert first[0] == 0
+    assert first[9].tolist() == [0] * (WIDTH - 1)
+    profiles = ProfileBatch(16, WIDTH)
+    assert stream.ReadProfiles(profiles) == 9
+    assert profiles.block_id[:9].tolist() == list(range(1, 10))
+    assert profiles.z[0, :WIDTH - 1].tolist() == list(range(WIDTH - 1))
+    assert stream.GetProfileCount() == 0
+
+
+def test_cut_off_recording_reads_its_full_chunks(tmp_path):
+    path = str(tmp_path / "session")
+    recorder = SessionRecorder(path, WIDTH, chunk_size=4)
+    try:
+        # The process dies with 2 rows in the open chunk
+        recorder.write_profiles(batch(0, 10))
+        wait_for(lambda: RecordedSession(path).count() == 8)
+
+        session = RecordedSession(path)
+        assert [entry["count"] for entry in session.index[PROFILES]] == [4, 4]
+        stream = ReplayStream(session)
+        stream.Start()
+        profiles = ProfileBatch(16, WIDTH)
+        assert stream.ReadProfiles(profiles) == 8
+        assert profiles.block_id[:8].tolist() == list(range(8))
+    finally:
+        recorder.close()
+
+
+def test_failed_chunk_stops_the_recording(tmp_path):
+    path = str(tmp_path / "session")
+    recorder = SessionRecorder(path, WIDTH, chunk_size=4)
+    # Chunk 1 can not be saved
+    os.makedirs(chunk_file(path, PROFILES, 1, "x"))
+    recorder.write_profiles(batch(0, 12))
+    wait_for(lambda: recorder.error is not None)
+    with pytest.raises(OSError):
+        recorder.write_profiles(batch(12, 1))
+    with pytest.raises(OSError):
+        recorder.flush()
+    with pytest.raises(OSError):
+        recorder.close()
+    # Nothing after the failed chunk is indexed
+    assert [entry["chunk"] for entry in RecordedSession(path).index[PROFILES]] == [0]
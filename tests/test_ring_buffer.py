@@ -0,0 +1,60 @@
+import numpy as np
+
+from collection import ProfileBatch, ProfileRing
+
+
+def batch(block_ids, width=4):
+    profiles = ProfileBatch(len(block_ids), width)
+    profiles.count = len(block_ids)
+    profiles.block_id[:] = block_ids
+    profiles.timestamp[:] = block_ids
+    profiles.length[:] = width
+    profiles.x[:] = np.asarray(block_ids)[:, None]
+    return profiles
+
+
+def test_wraparound_keeps_the_latest_rows():
+    ring = ProfileRing(5, 4)
+    for start in range(0, 12, 3):
+        ring.write(batch(range(start, start + 3)))
+    assert ring.written == 12
+    assert len(ring) == 5
+    assert ring.overwritten == 7
+    rows = ring.snapshot()
+    assert rows.block_id.tolist() == [7, 8, 9, 10, 11]
+    assert rows.index.tolist() == [7, 8, 9, 10, 11]
+    assert rows.x[:, 0].tolist() == [7, 8, 9, 10, 11]
+    assert ring.snapshot(2).block_id.tolist() == [10, 11]
+
+
+def test_batch_larger_than_the_ring():
+    ring = ProfileRing(4, 4)
+    ring.write(batch(range(10)))
+    assert ring.snapshot().block_id.tolist() == [6, 7, 8, 9]
+    assert ring.missed == 0
+
+
+def test_read_from_skips_overwritten_rows():
+    ring = ProfileRing(4, 4)
+    ring.write(batch(range(3)))
+    rows = ring.read_from(0)
+    assert rows.index.tolist() == [0, 1, 2]
+    ring.write(batch(range(3, 9)))
+    rows = ring.read_from(3)
+    assert rows.index.tolist() == [5, 6, 7, 8]
+
+
+def test_gaps_in_block_ids_count_as_missed():
+    ring = ProfileRing(8, 4)
+    ring.write(batch([0, 1, 4]))  # 2 missing inside a batch
+    ring.write(batch([5, 9]))  # 3 missing inside the next one
+    ring.write(batch([12]))  # 2 missing between batches
+    assert ring.missed == 7
+
+
+def test_since():
+    ring = ProfileRing(4, 4)
+    ring.write(batch(range(6)))
+    assert ring.since(3).block_id.tolist() == [4, 5]
+    assert not ring.wait(6, timeout=0.01)
+    assert ring.wait(5, timeout=0.01)
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from command_queue import CommandQueue
+from duet_sim import DuetSimulator
+from sender import Sender, is_priority
+
+
+def test_queue_blocks_while_full():
+    queue = CommandQueue(max_depth=2)
+    assert queue.put("G1 X1")
+    assert queue.put("G1 X2")
+    assert not queue.put("G1 X3", timeout=0.05)
+    assert queue.blocked_seconds > 0
+
+    done = []
+    producer = threading.Thread(target=lambda: done.append(queue.put("G1 X3", timeout=5.0)))
+    producer.start()
+    time.sleep(0.05)
+    assert not done
+    assert queue.take(1) == ["G1 X1"]
+    producer.join(5.0)
+    assert done == [True]
+    assert queue.take(10) == ["G1 X2", "G1 X3"]
+    assert queue.metrics()["max_depth_seen"] == 2
+
+
+def test_queue_join_and_clear():
+    queue = CommandQueue()
+    for code in ("G1 X1", "G1 X2", "G1 X3"):
+        queue.put(code)
+    assert not queue.join(timeout=0.01)
+    queue.task_done(len(queue.take(1)))
+    assert queue.clear() == 2
+    assert queue.join(timeout=0.01)
+    queue.close()
+    assert queue.take(1) == []
+    with pytest.raises(RuntimeError):
+        queue.put("G1 X4")
+
+
+@pytest.mark.parametrize("code, priority", [
+    ("M25", True), ("M112", True), ("M24", True), ("M290 Z0.02", True),
+    ("M42 P1 S0", True), ("M42 P1 S1", False), ("M42 P2 S0", False), ("G1 X1", False),
+])
+def test_is_priority(code, priority):
+    assert is_priority(code) is priority
+
+
+@pytest.fixture
+def simulator():
+    with DuetSimulator(latency=0.002, time_scale=20) as simulator:
+        yield simulator
+
+
+@pytest.fixture
+def sender(simulator):
+    sender = Sender(simulator.address, mode="pipelined", poll_interval=0.02, max_queue=16)
+    sender.poller.unsubscribe(sender._log_position)
+    yield sender
+    sender.close()
+
+
+def test_stream_with_backpressure(sender, simulator):
+    codes = ["G1 X0 Y0 F6000"] + [f"G1 X{i % 2 * 5} Y{i * 0.1:.1f}" for i in range(60)]
+    for code in codes:
+        assert sender.enqueue(code, timeout=10.0)
+    assert sender.wait_queue(timeout=20.0)
+    metrics = sender.metrics()
+    assert metrics["enqueued"] == metrics["taken"] == len(codes)
+    assert metrics["max_depth_seen"] <= 16
+    assert simulator.overflows == 0
+
+
+def test_priority_lane_holds_the_queue(sender, simulator):
+    codes = ["G1 X0 Y0 F3000"] + [f"G1 X{i % 2 * 10} Y{i * 0.1:.1f}" for i in range(100)]
+    for code in codes[:20]:
+        sender.enqueue(code)
+    time.sleep(0.2)
+    sender.send_priority("M25")
+    assert sender.metrics()["held"]
+    for code in codes[20:30]:
+        sender.enqueue(code)
+    time.sleep(0.3)
+    # Nothing is sent while held, the commands wait in the host queue
+    sent = simulator.endpoint_requests.get("/rr_gcode", 0)
+    time.sleep(0.3)
+    assert simulator.endpoint_requests.get("/rr_gcode", 0) == sent
+    assert sent > 0
+    assert sender.queue.depth > 0
+
+    sender.resume()
+    assert not sender.metrics()["held"]
+    assert sender.wait_queue(timeout=20.0)
+    assert len(sender.priority_latencies) == 2
+
+
+def test_welder_off_waits_for_few_commands(sender, simulator):
+    codes = ["G1 X0 Y0 F3000", "M42 P1 S1"] + [f"G1 X{i % 2 * 10} Y{i * 0.1:.1f}" for i in range(200)]
+    for code in codes:
+        sender.enqueue(code)
+    time.sleep(0.3)
+    assert sender.welding
+    with simulator.lock:
+        buffered = len(simulator.queue)
+    sender.send_priority("M42 P1 S0")
+    assert buffered <= sender.weld_window
+    deadline = time.monotonic() + 5.0
+    while simulator.gp_out.get(1) != 0.0:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    sender.queue.clear()
+    assert sender.wait_queue(timeout=20.0)
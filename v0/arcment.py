@@ -1,16 +1,26 @@
-import requests
+import os
+import numpy as np
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from duet_transport import shared_transport
+from processors.gcode_parser import tokenize
+from processors.move_table import MoveTable
+from processors.weld_segments import WeldSegments
+
 duet_ip = "192.168.0.4"
 x_offset = 10
 y_offset = 11
 z_offset = 12
 
 
+def send_gcodes(commands):
+    # Shared pooled session, consecutive commands are packed into as few requests as possible
+    return shared_transport(duet_ip).send_many(commands)
+
+
 def send_gcode(command):
-    url = f"http://{duet_ip}/rr_gcode?gcode={command}"
-    response = requests.get(url)
-    return response.json()
+    return send_gcodes([command])
 
 
 def scan(z, x0, y0, x1, y1):
@@ -29,52 +39,37 @@ def main():
     filename = input("Please enter a gcode file to run: ")
     with open(filename, "r") as file:
         gcode_commands = file.readlines()
-    movement_start = 0
-    movement_end = 0
-    end_script = 0
-    z0 = 0
-    x0 = 0
-    y0 = 0
-    x1 = 0
-    y1 = 0
-    # Finds the start, end, and init z value 
-    for i, command in enumerate(gcode_commands):
-        if "Z" in command:
-            comment_index = sys.maxsize
-            if ";" in command:
-                comment_index = command.index(";")
-            if comment_index > command.index("Z"):
-                z = float(command.split("Z")[1].split(" ")[0])
-        if command.startswith(";TYPE:WALL-OUTER"):
-            x0, y0 = float(gcode_commands[i-1].split("X")[1].split(" ")[0]), float(gcode_commands[i-1].split("Y")[1].split(" ")[0])
-            z0 = float(gcode_commands[i+1].split("Z")[1].split(" ")[0])
-            movement_start = i
-        if command.startswith("M42 P1 S0"):
-            x1, y1 = float(gcode_commands[i-3].split("X")[1].split(" ")[0]), float(gcode_commands[i-3].split("Y")[1].split(" ")[0])
-            movement_end = i
-        if command.startswith(";gcode movements end"):
-            end_script = i
-            break
-        # response = send_gcode(command)
-        # print(response)
+    table = MoveTable.from_gcode(gcode_commands)
+    segments = WeldSegments(table)
+    # Finds the start, end, and init z value of the last outer wall bead
+    outer = np.flatnonzero(segments.feature_mask("WALL-OUTER"))
+    if len(outer) == 0:
+        raise ValueError(f"No WALL-OUTER weld bead in {filename}")
+    bead = outer[-1]
+    x0, y0, z0 = (float(v) for v in segments.start[bead])
+    x1, y1 = (float(v) for v in segments.end[bead][:2])
+    z = z0
+    # Starts with the move onto the bead start, ends with the M42 P1 S0 (line numbers are 1 based)
+    start_row = max(int(segments.row_start[bead]) - 1, 0)
+    movement_start = int(table.line[start_row]) - 1
+    movement_end = int(segments.off_line[bead]) - 1
+    records = list(tokenize(gcode_commands))
+    end_script = next((i for i, record in enumerate(records) if record.comment == ";gcode movements end"), len(records))
     
     scan(z0, x0, y0, x1, y1)
 
+    x, y = x0, y0
     for i in range(movement_start, movement_end+1):
-        command = gcode_commands[i]
-        if command.startswith("G1"):
-            if "X" in command:
-                x = float(command.split("X")[1].split(" ")[0])
-            if "Y" in command:
-                y = float(command.split("Y")[1].split(" ")[0])
-            if "Z" in command:
-                z = float(command.split("Z")[1].split(" ")[0])
+        record = records[i]
+        if record.command == "G1":
+            x = record.params.get("X", x)
+            y = record.params.get("Y", y)
+            z = record.params.get("Z", z)
             gcode_commands[i] = f"G1 X{x+x_offset} Y{y+y_offset} Z{z+z_offset}"
-        response = send_gcode(gcode_commands[i])
-        print(response)
-    for i in range(end_script, len(gcode_commands)):
-        response = send_gcode(gcode_commands[i])
-        print(response)
+    response = send_gcodes(gcode_commands[movement_start:movement_end+1])
+    print(response)
+    response = send_gcodes(gcode_commands[end_script:])
+    print(response)
 
 
 if __name__ == "__main__":